@@ -0,0 +1,38 @@
+"""Measures how long it takes to build neural structures of increasing size.
+
+Each structure is a chain of nodes in which every node is connected to its successor and to a shared boost, so the
+number of connections grows linearly with the number of nodes. With linear-time graph construction, the time per
+node stays roughly constant across sizes.
+
+Usage: python benchmarks/construction_benchmark.py [num_nodes ...]
+"""
+import sys
+import time
+
+import dfpy
+
+
+def build_chain(num_nodes):
+    dfpy.initialize_architecture()
+    ns = dfpy.get_default_neural_structure()
+    boost = dfpy.Boost(1.0)
+    previous = None
+    for _ in range(num_nodes):
+        node = dfpy.Node()
+        ns.connect(boost, node)
+        if previous is not None:
+            ns.connect(previous, node, kernel_weights=1.0)
+        previous = node
+    return ns
+
+
+def main(sizes):
+    for num_nodes in sizes:
+        start = time.perf_counter()
+        build_chain(num_nodes)
+        duration = time.perf_counter() - start
+        print(f"{num_nodes:>8} nodes: {duration:8.3f} s ({duration / num_nodes * 1e6:7.2f} us per node)")
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [1000, 5000, 20000])
@@ -0,0 +1,47 @@
+"""Measures the cold-start latency of `import dfpy` in fresh interpreters.
+
+The import must not pull in TensorFlow. Pass --max-seconds to turn the benchmark into a guard that exits with a
+non-zero status if the fastest of the measured imports exceeds the given duration.
+
+Usage: python benchmarks/import_benchmark.py [--repeats N] [--max-seconds S]
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import dfpy
+duration = time.perf_counter() - start
+print(json.dumps({"duration": duration, "tensorflow_loaded": "tensorflow" in sys.modules}))
+"""
+
+
+def measure_import():
+    output = subprocess.run([sys.executable, "-c", _PROBE], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=None)
+    args = parser.parse_args()
+
+    results = [measure_import() for _ in range(args.repeats)]
+    durations = sorted(result["duration"] for result in results)
+    print(f"import dfpy: min {durations[0] * 1e3:.1f} ms, median {durations[len(durations) // 2] * 1e3:.1f} ms "
+          f"over {args.repeats} runs")
+
+    if any(result["tensorflow_loaded"] for result in results):
+        print("FAIL: import dfpy loaded TensorFlow")
+        sys.exit(1)
+    if args.max_seconds is not None and durations[0] > args.max_seconds:
+        print(f"FAIL: import dfpy took longer than {args.max_seconds} s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
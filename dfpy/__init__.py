@@ -4,8 +4,10 @@ from dfpy.neural_structure import NeuralStructure
 from dfpy.neural_structure import add_step
 from dfpy.activation_function import *
 from dfpy.weight_patterns import *
-from dfpy.connection import connect
+from dfpy.frames import FrameSource, ArrayFrames, ChunkedFrames, IteratorFrames, KeyframeFrames
+from dfpy.connection import connect, connect_many
 from dfpy.shared import get_default_neural_structure
+from dfpy.serialization import save_neural_structure, load_neural_structure
 import dfpy.utils
 import dfpy.shared
 import dfpy.config
@@ -1 +1,5 @@
+# Whether simulators pick up changes to the neural structure (parameters, added steps and connections) by default
 enable_live_tuning = False
+
+# Upper bound for the total size (in bytes) of the materialized weight patterns kept in the kernel cache
+kernel_cache_max_bytes = 256 * 1024 * 1024
@@ -5,18 +5,7 @@ from dfpy.shared import get_default_neural_structure
 from dfpy.weight_patterns import WeightPattern
 from dfpy.steps import Node, Step
 from dfpy.activation_function import ActivationFunction
-import importlib
-
-#
-# Import TensorFlow if it exists
-#
-tf_spec = importlib.util.find_spec("tensorflow")
-if tf_spec != None:
-    import tensorflow as tf
-else:
-    tf = None
-
-import numpy as np
+from dfpy.utils import is_tensor
 
 
 class Connection():
@@ -35,6 +24,10 @@ class Connection():
     def input_step(self):
         return self._input_step
 
+    @property
+    def output_step(self):
+        return self._output_step
+
     @property
     def trainable(self):
         return self._trainable
@@ -149,19 +142,19 @@ def connect(source, target, kernel_weights=None, pointwise_weights=None, activat
     if ns is None:
         ns = get_default_neural_structure()
 
-    if tf is not None and isinstance(source, tf.Tensor) or isinstance(source, np.ndarray):
+    if is_tensor(source):
         source = CustomInput(source)
 
     source_dim = source.dimensionality()
     target_dim = target.dimensionality()
     if source_dim > target_dim:
-        if source_dim - len(contract_dimensions) != target_dim:
+        if source_dim - len(contract_dimensions) + len(expand_dimensions) != target_dim:
             raise RuntimeError(f"Connecting a step of dimensionality {source_dim} to a step of "
                                f"dimensionality {target_dim} requires {source_dim - target_dim} contractions. "
                                f"Specify a list of contracted dimension indices using the "
                                f"`contract_dimensions` parameter!")
     if source_dim != 0 and source_dim < target_dim:
-        if source_dim + len(expand_dimensions) != target_dim:
+        if source_dim + len(expand_dimensions) - len(contract_dimensions) != target_dim:
             raise RuntimeError(f"Connecting a step of dimensionality {source_dim} to a step of "
                                f"dimensionality {target_dim} requires {target_dim-source_dim} expansions. "
                                f"Specify a list of expanded dimension indices using the "
@@ -170,3 +163,19 @@ def connect(source, target, kernel_weights=None, pointwise_weights=None, activat
     return ns.connect(source, target, kernel_weights, pointwise_weights, activation_function,
                        contract_dimensions, contraction_weights,
                        expand_dimensions)
+
+
+def connect_many(source, target, source_indices, target_indices, weights=1.0, activation_function=None, ns=None):
+    """Connects entries of two steps by a list of weighted edges (see :meth:`NeuralStructure.connect_many`).
+
+    :param Step source: input step of the edges
+    :param Step target: output step of the edges
+    :param source_indices: flat index of the entry of the input step of each edge
+    :param target_indices: flat index of the entry of the output step of each edge
+    :param weights: weight of each edge (or a single weight for all edges)
+    :param activation_function: the activation function of the connection
+    """
+    if ns is None:
+        ns = get_default_neural_structure()
+
+    return ns.connect_many(source, target, source_indices, target_indices, weights, activation_function)
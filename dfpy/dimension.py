@@ -1,6 +1,20 @@
+import weakref
+
+
 class Dimension:
-    def __init__(self, lower: float, upper: float, size: int = None, name: str = "dim", ticklabels: dict = {}):
-        """Creates a Dimension object that represents a field dimension.
+    """An immutable value that represents a field dimension.
+
+    Dimensions with equal bounds, size, name and tick labels compare and hash equal. Creating a dimension that
+    equals an existing one returns the existing object (interning), so that the many identical dimensions of a
+    large architecture share a single object and are validated only once.
+    """
+    __slots__ = ("_lower", "_upper", "_size", "_name", "_ticklabels", "_key", "__weakref__")
+
+    # Existing dimensions, keyed by their content (dimensions that are no longer used are dropped)
+    _interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, lower: float, upper: float, size: int = None, name: str = "dim", ticklabels: dict = {}):
+        """Creates a Dimension object that represents a field dimension (or returns an equal existing one).
 
         :param lower: lower bound of the domain
         :param upper: upper bound of the domain
@@ -14,26 +28,47 @@ class Dimension:
             #if size % 2 == 0:
             #    size = size+1
 
-        if size % 2 == 0:
-            RuntimeWarning("It is recommended to provide an odd size for the dimensions. This avoids incompatibilities between different simulation frameworks.")
-
-
         if type(lower) == int:
             lower = float(lower)
 
         if type(upper) == int:
             upper = float(upper)
 
+        # Validated before the lookup, so that invalid arguments are rejected even if an equal dimension exists
+        assert type(ticklabels) == dict, "ticklabels bound must be a dict"
         assert type(size) == int, "size must be an int"
         assert type(lower) == float, "lower bound must be a float"
         assert type(upper) == float, "upper bound must be a float"
-        assert type(ticklabels) == dict, "ticklabels bound must be a dict"
 
-        self._lower = lower
-        self._upper = upper
-        self._size = size
-        self._name = name
-        self._ticklabels = ticklabels
+        try:
+            key = (lower, upper, size, name, cls._ticklabels_key(ticklabels))
+            dimension = cls._interned.get(key)
+        except TypeError:
+            # Tick labels that are not hashable prevent interning (and hashing)
+            dimension = None
+            key = None
+        if dimension is not None:
+            return dimension
+
+        if size % 2 == 0:
+            RuntimeWarning("It is recommended to provide an odd size for the dimensions. This avoids incompatibilities between different simulation frameworks.")
+
+        dimension = super().__new__(cls)
+        # The attributes are set past __setattr__, which rejects all changes
+        object.__setattr__(dimension, "_lower", lower)
+        object.__setattr__(dimension, "_upper", upper)
+        object.__setattr__(dimension, "_size", size)
+        object.__setattr__(dimension, "_name", name)
+        object.__setattr__(dimension, "_ticklabels", dict(ticklabels))
+        object.__setattr__(dimension, "_key", key)
+        if key is not None:
+            cls._interned[key] = dimension
+        return dimension
+
+    @staticmethod
+    def _ticklabels_key(ticklabels):
+        # Independent of the insertion order, like the comparison of the dicts in __eq__
+        return frozenset(ticklabels.items())
 
     @classmethod
     def from_size(cls, size):
@@ -57,7 +92,34 @@ class Dimension:
 
     @property
     def ticklabels(self):
-        return self._ticklabels
+        # A copy, so that the dimension stays immutable
+        return dict(self._ticklabels)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Dimensions are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Dimensions are immutable")
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, Dimension):
+            return NotImplemented
+        return (self._lower, self._upper, self._size, self._name, self._ticklabels) \
+            == (other._lower, other._upper, other._size, other._name, other._ticklabels)
+
+    def __hash__(self):
+        if self._key is None:
+            raise TypeError("Dimensions with unhashable tick labels are not hashable")
+        return hash(self._key)
+
+    def __reduce__(self):
+        # Unpickled and copied dimensions are interned as well
+        return Dimension, (self._lower, self._upper, self._size, self._name, self._ticklabels)
+
+    def __repr__(self):
+        return f"Dimension(lower={self._lower}, upper={self._upper}, size={self._size}, name={self._name!r})"
 
 
 def dimensions_from_sizes(*sizes):
@@ -66,4 +128,3 @@ def dimensions_from_sizes(*sizes):
 
 def shape_from_list_of_dimensions(dimensions):
     return [dimension.size for dimension in dimensions]
-
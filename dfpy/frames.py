@@ -0,0 +1,202 @@
+import bisect
+
+import numpy as np
+
+
+class FrameSource:
+    """Base class for a sequence of input frames (one per time step) that is read on demand, e.g., by a
+    :class:`TimedCustomInput`.
+    """
+    def __init__(self, num_frames: int = None):
+        """Creates a FrameSource.
+
+        :param num_frames: number of frames (None if unknown or unbounded)
+        """
+        self._num_frames = num_frames
+
+    @property
+    def num_frames(self):
+        return self._num_frames
+
+    def frame(self, index: int):
+        """Returns the frame at the given time step.
+
+        :param index: index of the time step
+        :return: the frame, or None if the input is zero at that time step (e.g., after the last frame)
+        """
+        raise NotImplementedError()
+
+    def change_indices(self):
+        """Returns the indices of the time steps at which the frame changes (in ascending order), if the frames only
+        change at a few time steps.
+
+        :return: list of time step indices, or None if the frame may change on every time step
+        """
+        return None
+
+    def reset(self):
+        """Prepares the source to be read from the first frame again.
+        """
+        pass
+
+
+class ArrayFrames(FrameSource):
+    """Frames stored in an array (or a list of arrays) with the time step as first axis.
+
+    The array may be an on-disk np.memmap (e.g., from np.load(filename, mmap_mode="r")), in which case only the frames
+    that are read are loaded into memory.
+    """
+    def __init__(self, frames):
+        """Creates ArrayFrames.
+
+        :param frames: array of shape [num_frames, *shape]
+        """
+        super().__init__(len(frames))
+        self._frames = frames
+
+    @property
+    def frames(self):
+        return self._frames
+
+    def frame(self, index):
+        if index >= self._num_frames:
+            return None
+        return self._frames[index]
+
+
+class ChunkedFrames(FrameSource):
+    """Frames stored in a sequence of .npy files, each of which holds a chunk of shape [num_chunk_frames, *shape].
+
+    Only the chunk that holds the current frame is opened (memory-mapped) at any time.
+    """
+    def __init__(self, filenames: list):
+        """Creates ChunkedFrames.
+
+        :param filenames: names of the chunk files, in temporal order
+        """
+        self._filenames = list(filenames)
+        # Index of the first frame of each chunk (and the total number of frames)
+        self._offsets = [0]
+        for filename in self._filenames:
+            self._offsets.append(self._offsets[-1] + len(np.load(filename, mmap_mode="r")))
+        super().__init__(self._offsets[-1])
+        self._chunk_index = None
+        self._chunk = None
+
+    @property
+    def filenames(self):
+        return self._filenames
+
+    def frame(self, index):
+        if index >= self._num_frames:
+            return None
+        chunk_index = bisect.bisect_right(self._offsets, index) - 1
+        if chunk_index != self._chunk_index:
+            self._chunk = np.load(self._filenames[chunk_index], mmap_mode="r")
+            self._chunk_index = chunk_index
+        return self._chunk[index - self._offsets[chunk_index]]
+
+    def reset(self):
+        self._chunk_index = None
+        self._chunk = None
+
+
+class IteratorFrames(FrameSource):
+    """Frames produced by an iterator (e.g., a generator that decodes a video).
+
+    Frames have to be read in temporal order. Reading an earlier frame again (e.g., after a reset) restarts the
+    iteration, which requires a callable that creates a new iterator or an iterable that can be iterated again.
+    """
+    def __init__(self, frames, num_frames: int = None):
+        """Creates IteratorFrames.
+
+        :param frames: iterable of frames, or callable without arguments that returns such an iterable
+        :param num_frames: number of frames (None to read until the iterator is exhausted)
+        """
+        super().__init__(num_frames)
+        self._frames = frames
+        self._iterator = None
+        self._num_started = 0
+        self._index = -1
+        self._frame = None
+        self._exhausted = False
+
+    def _start(self):
+        if self._num_started > 0 and not callable(self._frames) and iter(self._frames) is self._frames:
+            raise RuntimeError("Cannot restart a frame iterator; pass a callable that creates the iterator instead")
+        self._iterator = iter(self._frames() if callable(self._frames) else self._frames)
+        self._num_started += 1
+        self._index = -1
+        self._frame = None
+        self._exhausted = False
+
+    def frame(self, index):
+        if self._num_frames is not None and index >= self._num_frames:
+            return None
+        if self._iterator is None or index < self._index:
+            self._start()
+        while self._index < index and not self._exhausted:
+            frame = next(self._iterator, None)
+            if frame is None:
+                # The iterator is exhausted; the input is zero from now on
+                self._exhausted = True
+            else:
+                self._frame = frame
+                self._index += 1
+        if index > self._index:
+            return None
+        return self._frame
+
+    def reset(self):
+        if self._index != -1 or self._exhausted:
+            self._iterator = None
+
+
+class KeyframeFrames(FrameSource):
+    """Sparse frames: each keyframe is held until the time step of the next keyframe. The input is zero before the
+    first keyframe.
+    """
+    def __init__(self, keyframes: dict, num_frames: int = None):
+        """Creates KeyframeFrames.
+
+        :param keyframes: dictionary mapping time step indices to frames
+        :param num_frames: number of frames (None to hold the last keyframe indefinitely)
+        """
+        super().__init__(num_frames)
+        self._keyframes = keyframes
+        self._indices = sorted(keyframes)
+
+    @property
+    def keyframes(self):
+        return self._keyframes
+
+    def frame(self, index):
+        if self._num_frames is not None and index >= self._num_frames:
+            return None
+        position = bisect.bisect_right(self._indices, index) - 1
+        if position < 0:
+            return None
+        return self._keyframes[self._indices[position]]
+
+    def change_indices(self):
+        if self._num_frames is None:
+            return self._indices
+        # The input becomes zero after the last frame
+        return [index for index in self._indices if index < self._num_frames] + [self._num_frames]
+
+
+def frame_source(timed_custom_input, num_frames: int = None):
+    """Returns a frame source that reads the frames of a timed custom input.
+
+    :param timed_custom_input: a FrameSource, a dictionary of keyframes, an iterator or a callable that returns an
+    iterator of frames, or an array(-like) with the time step as first axis
+    :param num_frames: number of frames, if not determined by the timed custom input
+    :return FrameSource: the frame source
+    """
+    if isinstance(timed_custom_input, FrameSource):
+        return timed_custom_input
+    if type(timed_custom_input) == dict:
+        return KeyframeFrames(timed_custom_input, num_frames)
+    if callable(timed_custom_input) or hasattr(timed_custom_input, "__next__"):
+        return IteratorFrames(timed_custom_input, num_frames)
+    return ArrayFrames(timed_custom_input)
@@ -1,13 +1,15 @@
 from dfpy import NoiseInput
 from dfpy.activation_function import Sigmoid
 from dfpy.shared import get_default_neural_structure
-from dfpy.weight_patterns import CustomWeightPattern
+from dfpy.weight_patterns import CustomWeightPattern, SparseWeightPattern
 
-from dfpy.steps import Step, Field, Node
+from dfpy.steps import Step, Field, Node, NodeArray
+from dfpy.steps.step import float_dtype
+from dfpy.dimension import shape_from_list_of_dimensions
 from dfpy.connection import SynapticConnection, DirectConnection
+from dfpy.utils import is_tensor
 
 import numpy as np
-import tensorflow as tf
 
 class NeuralStructure:
     """Base class for a DFT materialized connectivity structure (MCS).
@@ -18,17 +20,42 @@ class NeuralStructure:
         self._connections_into_steps = []
         self._steps_by_name = {}
         self._step_indices_by_name = {}
+        # Steps do not override __eq__, so these dicts are keyed by identity
+        self._step_indices = {}
+        self._connections_by_steps = {}
         self._add_step_observers = []
         self._add_connection_observers = []
+        self._dtype = np.dtype(np.float64)
+
+    @property
+    def dtype(self):
+        """Floating-point dtype in which simulators store the state of all steps that do not set their own dtype
+        (see :attr:`Step.dtype`). Lower precision reduces memory and memory bandwidth. np.float32 is also faster to
+        compute; np.float16 only saves memory, since NumPy computes it in software on most CPUs.
+        """
+        return self._dtype
+
+    @dtype.setter
+    def dtype(self, dtype):
+        self._dtype = float_dtype(dtype)
+
+    def step_dtype(self, step):
+        """Returns the dtype in which the state of a step is stored: the dtype of the step if it sets one, the dtype
+        of the neural structure otherwise.
+
+        :param Step step: the step
+        """
+        return step.dtype if step.dtype is not None else self._dtype
 
     def add_step(self, step):
         """Adds a step to the mcs.
 
         :param Step step: step to add
         """
-        if step in self._steps:
+        if step in self._step_indices:
             raise RuntimeError(f"Trying to add step f{step.name} to the neural structure twice.")
 
+        self._step_indices[step] = len(self._steps)
         self._step_indices_by_name[step.name] = len(self._steps)
         self._steps.append(step)
         self._connections_into_steps.append([])
@@ -71,9 +98,9 @@ class NeuralStructure:
         if not isinstance(output_step, Step):
             raise RuntimeError("Invalid argument supplied for output_step: " + str(output_step))
 
-        if input_step not in self._steps:
+        if input_step not in self._step_indices:
             self.add_step(input_step)
-        if output_step not in self._steps:
+        if output_step not in self._step_indices:
             self.add_step(output_step)
 
         #if contraction_weights is not None and len(contract_dimensions) == 1\
@@ -84,27 +111,25 @@ class NeuralStructure:
         if contract_dimensions is None and isinstance(input_step, Field) and isinstance(output_step, Node):
             contract_dimensions = range(len(input_step.dimensions))
 
-        input_step_index = self._steps.index(input_step)
+        input_step_index = self._step_indices[input_step]
 
         # and not isinstance(input_step, NoiseInput)
         if (kernel_weights is not None or pointwise_weights is not None)\
-                or (isinstance(input_step, Field) or isinstance(input_step, Node))\
-                and (isinstance(output_step, Field) or isinstance(output_step, Node)):
+                or isinstance(input_step, (Field, Node, NodeArray))\
+                and isinstance(output_step, (Field, Node, NodeArray)):
             # The user intends a synaptic connection
             if activation_function is None:
-                if isinstance(input_step, Field) or isinstance(input_step, Node):
+                if isinstance(input_step, (Field, Node, NodeArray)):
                     activation_function = input_step.activation_function
                 else:
                     activation_function = Sigmoid(1)
                     #raise RuntimeError(f"Cannot connect a {type(input_step)} synaptically without providing an "
                     #                   f"activation function")
 
-            if type(kernel_weights) == list or isinstance(kernel_weights, np.ndarray)\
-                    or isinstance(kernel_weights, tf.Tensor):
+            if type(kernel_weights) == list or is_tensor(kernel_weights):
                 kernel_weights = CustomWeightPattern(kernel_weights)
 
-            if type(pointwise_weights) == list or isinstance(pointwise_weights, np.ndarray)\
-                    or isinstance(pointwise_weights, tf.Tensor):
+            if type(pointwise_weights) == list or is_tensor(pointwise_weights):
                 pointwise_weights = CustomWeightPattern(pointwise_weights)
 
             connection = SynapticConnection(input_step, input_step_index, output_step, kernel_weights,
@@ -117,13 +142,67 @@ class NeuralStructure:
                                           contraction_weights,
                                           expand_dimensions)
 
-        output_step_index = self._steps.index(output_step)
+        output_step_index = self._step_indices[output_step]
         self._connections_into_steps[output_step_index].append(connection)
+        self._connections_by_steps.setdefault((input_step, output_step), connection)
 
         self._handle_connection_created(connection)
 
         return connection
 
+    def connect_many(self, input_step, output_step, source_indices, target_indices, weights=1.0,
+                     activation_function=None):
+        """Connects entries of one step to entries of another step by a list of weighted edges, e.g., the nodes of
+        one :class:`NodeArray` to those of another (or the same) one.
+
+        All edges are validated at once and become a single connection, whose pointwise weights are a
+        :class:`SparseWeightPattern` (sorted by target entry), instead of one connection per edge. The simulator
+        applies it as a sparse linear map, so its cost scales with the number of edges.
+
+        :param Step input_step: input step of the edges
+        :param Step output_step: output step of the edges
+        :param source_indices: flat index of the entry of the input step of each edge (or node names of a NodeArray)
+        :param target_indices: flat index of the entry of the output step of each edge (or node names of a NodeArray)
+        :param weights: weight of each edge (or a single weight for all edges)
+        :param activation_function: the activation function of the connection (None for the activation function of
+        the input step)
+        :return: the connection
+        """
+        source_shape = self._edge_shape(input_step)
+        target_shape = self._edge_shape(output_step)
+        for step, shape in ((input_step, source_shape), (output_step, target_shape)):
+            if not shape:
+                raise RuntimeError(f"Edges can only connect steps with at least one dimension, but {step.name} has "
+                                   f"no dimensions; give it dimensions or connect it with connect() instead")
+
+        source_indices = self._edge_indices(input_step, source_indices)
+        target_indices = self._edge_indices(output_step, target_indices)
+        weights = SparseWeightPattern.from_edges(source_shape, target_shape, source_indices, target_indices, weights)
+
+        return self.connect(input_step, output_step, pointwise_weights=weights,
+                            activation_function=activation_function,
+                            contract_dimensions=list(range(len(source_shape))),
+                            expand_dimensions=list(range(len(target_shape))))
+
+    @staticmethod
+    def _edge_shape(step):
+        # The shape follows from the dimensions of the step (e.g., those given to a CustomInput), or from its shape
+        # for steps without dimensions; steps that have neither are treated like steps without dimensions
+        dimensions = getattr(step, "dimensions", None)
+        if dimensions is not None:
+            return tuple(shape_from_list_of_dimensions(dimensions))
+        shape = getattr(step, "shape", ())
+        return tuple(shape() if callable(shape) else shape)
+
+    @staticmethod
+    def _edge_indices(step, indices):
+        if isinstance(indices, np.ndarray) and indices.dtype.kind in "iu":
+            return indices
+        indices = np.asarray(indices)
+        if indices.dtype.kind in "US" and isinstance(step, NodeArray):
+            return np.array([step.node_index(node_name) for node_name in indices.tolist()], dtype=np.int64)
+        return indices
+
     @property
     def steps(self):
         """Returns the steps of the mcs.
@@ -139,7 +218,7 @@ class NeuralStructure:
         :param Step step: step
         :return: input steps to the given step
         """
-        step_index = self._steps.index(step)
+        step_index = self._step_indices[step]
         return self._input_steps_by_step[step_index]
 
     @property
@@ -156,17 +235,18 @@ class NeuralStructure:
     def get_step_index_by_name(self, name: str):
         return self._step_indices_by_name[name]
 
+    def get_step_index(self, step):
+        """Returns the index of a step in the mcs.
+
+        :param Step step: step
+        :return: index of the step
+        """
+        return self._step_indices[step]
+
     def get_connection_by_step_names(self, input_step_name: str, output_step_name: str):
         input_step = self.get_step_by_name(input_step_name)
         output_step = self.get_step_by_name(output_step_name)
-        output_step_index = self._steps.index(output_step)
-        connections_into_output_step = self._connections_into_steps[output_step_index]
-        connection = None
-        for conn in connections_into_output_step:
-            if conn.input_step == input_step:
-                connection = conn
-                break
-        return connection
+        return self._connections_by_steps.get((input_step, output_step))
 
 
 def add_step(step):
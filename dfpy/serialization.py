@@ -0,0 +1,304 @@
+import json
+import os
+
+import numpy as np
+
+import dfpy.shared
+from dfpy.dimension import Dimension
+from dfpy.activation_function import Sigmoid, HardSigmoid, Identity
+from dfpy.weight_patterns import CustomWeightPattern, SumWeightPattern, RepeatWeightPattern, \
+    GaussWeightPattern, RepeatedValueWeightPattern, SparseWeightPattern, LowRankWeightPattern
+from dfpy.steps import Field, Node, NodeArray, TimedBoost, TimedGate, Boost, GaussInput, CustomInput, NoiseInput, \
+    RateMatrixToSpaceCode, Scalar, ScalarMultiplication, TimedCustomInput
+from dfpy.utils import is_tensor
+from dfpy.neural_structure import NeuralStructure
+
+FORMAT_NAME = "dfpy-neural-structure"
+FORMAT_VERSION = 1
+
+# Arrays with at most this many elements are stored in the header, all others in the array file
+_max_inline_array_size = 16
+# Offsets of arrays in the array file are aligned to this many bytes
+_array_alignment = 64
+
+# Constructor parameters of the supported step types (each is also a property of the step)
+_step_parameters = {
+    Field: ("dimensions", "resting_level", "activation_function", "time_scale", "interaction_kernel",
+            "global_inhibition", "noise_strength"),
+    Node: ("resting_level", "time_scale", "self_excitation", "activation_function", "noise_strength"),
+    NodeArray: ("size", "resting_level", "time_scale", "self_excitation", "activation_function", "noise_strength",
+                "node_names"),
+    TimedBoost: ("values",),
+    TimedGate: ("dimensions", "min_time", "max_time"),
+    Boost: ("value",),
+    GaussInput: ("dimensions", "height", "mean", "sigmas"),
+    CustomInput: ("pattern", "dimensions"),
+    NoiseInput: ("dimensions", "strength"),
+    RateMatrixToSpaceCode: ("number_of_bins", "lower_limit", "upper_limit"),
+    Scalar: ("value",),
+    ScalarMultiplication: ("shape", "scalar"),
+    TimedCustomInput: ("dimensions", "timed_custom_input", "num_time_steps"),
+}
+
+# Constructor parameters of the supported weight pattern types
+_weight_pattern_parameters = {
+    CustomWeightPattern: ("pattern",),
+    SumWeightPattern: ("weight_patterns",),
+    RepeatWeightPattern: ("weight_pattern", "num_repeats"),
+    GaussWeightPattern: ("height", "sigmas", "mean"),
+    RepeatedValueWeightPattern: ("value", "shape"),
+    SparseWeightPattern: ("shape", "coordinates", "values"),
+    LowRankWeightPattern: ("u", "v"),
+}
+
+# Parameters that hold (possibly large) arrays, even if they were given as nested lists
+_array_parameters = {(CustomInput, "pattern"), (TimedCustomInput, "timed_custom_input"), (CustomWeightPattern, "pattern")}
+
+_step_types = {step_type.__name__: step_type for step_type in _step_parameters}
+_weight_pattern_types = {weight_pattern_type.__name__: weight_pattern_type
+                         for weight_pattern_type in _weight_pattern_parameters}
+
+
+def array_filename(filename: str):
+    """Returns the name of the file that holds the large arrays of a saved neural structure.
+
+    :param filename: name of the header file
+    """
+    return filename + ".arrays"
+
+
+class _Encoder:
+    """Turns the parameters of steps and connections into JSON-compatible values and collects the large arrays.
+    """
+    def __init__(self):
+        self.arrays = []
+        self._array_indices = {}
+
+    def encode(self, value):
+        if value is None or type(value) in (bool, int, float, str):
+            return value
+        if isinstance(value, np.generic):
+            return value.item()
+        if type(value) == list or type(value) == range:
+            return [self.encode(item) for item in value]
+        if type(value) == tuple:
+            return {"type": "tuple", "items": [self.encode(item) for item in value]}
+        if type(value) == dict:
+            return {"type": "dict", "items": [[self.encode(key), self.encode(item)] for key, item in value.items()]}
+        if is_tensor(value):
+            return self._encode_array(value)
+        if isinstance(value, Dimension):
+            return {"type": "Dimension", "lower": value.lower, "upper": value.upper, "size": value.size,
+                    "name": value.name, "ticklabels": self.encode(value.ticklabels)}
+        if isinstance(value, Sigmoid):
+            return {"type": "Sigmoid", "beta": self.encode(value.beta)}
+        if isinstance(value, HardSigmoid):
+            return {"type": "HardSigmoid", "beta": self.encode(value.beta)}
+        if isinstance(value, Identity):
+            return {"type": "Identity"}
+        if type(value) in _weight_pattern_parameters:
+            encoded = {"type": type(value).__name__,
+                       "parameters": self.encode_parameters(value, _weight_pattern_parameters[type(value)])}
+            if hasattr(value, "ranges"):
+                encoded["ranges"] = self.encode(value.ranges())
+            return encoded
+        raise RuntimeError(f"Cannot serialize value of type {type(value).__name__}: {value}")
+
+    def encode_parameters(self, obj, names):
+        parameters = {}
+        for name in names:
+            value = getattr(obj, name)
+            if (type(obj), name) in _array_parameters and type(value) == list:
+                value = np.asarray(value)
+            parameters[name] = self.encode(value)
+        return parameters
+
+    def _encode_array(self, value):
+        array = np.asarray(value)
+        if array.dtype.hasobject:
+            raise RuntimeError("Cannot serialize arrays of Python objects")
+        if array.size <= _max_inline_array_size:
+            return {"type": "array", "dtype": array.dtype.str, "shape": list(array.shape), "data": array.tolist()}
+        # Arrays that are shared between several steps or weight patterns are only stored once
+        index = self._array_indices.get(id(value))
+        if index is None:
+            index = len(self.arrays)
+            self._array_indices[id(value)] = index
+            self.arrays.append(array)
+        return {"type": "array", "index": index}
+
+
+class _Decoder:
+    def __init__(self, arrays):
+        self._arrays = arrays
+
+    def decode(self, value):
+        if type(value) == list:
+            return [self.decode(item) for item in value]
+        if type(value) != dict:
+            return value
+        value_type = value["type"]
+        if value_type == "tuple":
+            return tuple(self.decode(item) for item in value["items"])
+        if value_type == "dict":
+            return {self.decode(key): self.decode(item) for key, item in value["items"]}
+        if value_type == "array":
+            if "index" in value:
+                return self._arrays[value["index"]]
+            return np.array(value["data"], dtype=np.dtype(value["dtype"])).reshape(value["shape"])
+        if value_type == "Dimension":
+            return Dimension(value["lower"], value["upper"], value["size"], value["name"],
+                             self.decode(value["ticklabels"]))
+        if value_type == "Sigmoid":
+            return Sigmoid(value["beta"])
+        if value_type == "HardSigmoid":
+            return HardSigmoid(value["beta"])
+        if value_type == "Identity":
+            return Identity()
+        if value_type in _weight_pattern_types:
+            parameters = {name: self.decode(parameter) for name, parameter in value["parameters"].items()}
+            weight_pattern = _weight_pattern_types[value_type](**parameters)
+            if "ranges" in value:
+                # The ranges were computed from the field size on creation, which the pattern does not keep
+                weight_pattern._ranges = self.decode(value["ranges"])
+            return weight_pattern
+        raise RuntimeError(f"Unknown value type in serialized neural structure: {value_type}")
+
+
+def encode_neural_structure(neural_structure):
+    """Encodes a neural structure into a JSON-compatible description and a list of large arrays that the
+    description refers to by index.
+
+    :param NeuralStructure neural_structure: the neural structure
+    :return: tuple of the description (a dict) and the list of arrays
+    """
+    encoder = _Encoder()
+
+    steps = []
+    for step in neural_structure.steps:
+        if type(step) not in _step_parameters:
+            raise RuntimeError(f"Step {step.name} of type {type(step).__name__} cannot be serialized")
+        steps.append({"type": type(step).__name__, "name": step.name,
+                      "trainable": step.trainable, "assignable": step.assignable,
+                      "dtype": None if step.dtype is None else step.dtype.str,
+                      "parameters": encoder.encode_parameters(step, _step_parameters[type(step)])})
+
+    connections = []
+    for output_step_index, connections_into_step in enumerate(neural_structure.connections_into_steps):
+        for connection in connections_into_step:
+            connections.append({
+                "input_step": connection.input_step_index,
+                "output_step": output_step_index,
+                "kernel_weights": encoder.encode(connection.kernel_weights),
+                "pointwise_weights": encoder.encode(getattr(connection, "pointwise_weights", None)),
+                "activation_function": encoder.encode(getattr(connection, "activation_function", None)),
+                "contract_dimensions": encoder.encode(connection.contract_dimensions),
+                "contraction_weights": encoder.encode(connection.contraction_weights),
+                "expand_dimensions": encoder.encode(connection.expand_dimensions),
+            })
+
+    return {"dtype": neural_structure.dtype.str, "steps": steps, "connections": connections}, encoder.arrays
+
+
+def array_layout(arrays: list):
+    """Places arrays one after the other in a single buffer, each at an aligned offset.
+
+    :param arrays: the arrays
+    :return: tuple of the descriptions of the arrays (dtype, shape and offset) and the size of the buffer in bytes
+    """
+    descriptions = []
+    offset = 0
+    for array in arrays:
+        offset += -offset % _array_alignment
+        descriptions.append({"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset})
+        offset += array.nbytes
+    return descriptions, offset
+
+
+def save_neural_structure(neural_structure, filename: str):
+    """Saves a neural structure (steps, dimensions, weight patterns, activation functions and connections).
+
+    The graph is written as a JSON header to filename. Large arrays (e.g., the patterns of a CustomInput,
+    TimedCustomInput or CustomWeightPattern) are written in raw binary form to a side file (see
+    :func:`array_filename`), so that they can be memory-mapped on loading.
+
+    :param NeuralStructure neural_structure: the neural structure
+    :param filename: name of the header file
+    """
+    description, arrays = encode_neural_structure(neural_structure)
+    array_descriptions, _ = array_layout(arrays)
+
+    with open(array_filename(filename), "wb") as file:
+        for array, array_description in zip(arrays, array_descriptions):
+            file.write(b"\0" * (array_description["offset"] - file.tell()))
+            np.ascontiguousarray(array).tofile(file)
+
+    header = {"format": FORMAT_NAME, "version": FORMAT_VERSION,
+              "array_file": os.path.basename(array_filename(filename)), "arrays": array_descriptions,
+              **description}
+    with open(filename, "w") as file:
+        json.dump(header, file, separators=(",", ":"))
+
+
+def _read_array(filename, description, mmap_mode):
+    dtype = np.dtype(description["dtype"])
+    shape = tuple(description["shape"])
+    count = int(np.prod(shape))
+    if mmap_mode is None or count == 0 or len(shape) == 0:
+        return np.fromfile(filename, dtype=dtype, count=count, offset=description["offset"]).reshape(shape)
+    return np.memmap(filename, dtype=dtype, mode=mmap_mode, offset=description["offset"], shape=shape)
+
+
+def load_neural_structure(filename: str, mmap_mode: str = None):
+    """Loads a neural structure that was saved with :func:`save_neural_structure`.
+
+    :param filename: name of the header file
+    :param mmap_mode: if given, the large arrays are memory-mapped with this mode ("r" or "c", see numpy.memmap)
+    instead of being read into memory
+    :return NeuralStructure: the neural structure
+    """
+    with open(filename) as file:
+        header = json.load(file)
+    if header.get("format") != FORMAT_NAME or header.get("version") != FORMAT_VERSION:
+        raise RuntimeError(f"{filename} is not a neural structure of format version {FORMAT_VERSION}")
+
+    array_file = os.path.join(os.path.dirname(filename), header["array_file"])
+    return decode_neural_structure(header, [_read_array(array_file, description, mmap_mode)
+                                            for description in header["arrays"]])
+
+
+def decode_neural_structure(description: dict, arrays: list):
+    """Creates a neural structure from a description and arrays created with :func:`encode_neural_structure`.
+
+    :param description: the description
+    :param arrays: the arrays the description refers to (they are used without copying where the steps allow)
+    :return NeuralStructure: the neural structure
+    """
+    decoder = _Decoder(arrays)
+
+    neural_structure = NeuralStructure()
+    neural_structure.dtype = description.get("dtype", "<f8")
+    # Steps add themselves to the default neural structure on creation
+    default_neural_structure = dfpy.shared.get_default_neural_structure()
+    dfpy.shared.set_default_neural_structure(neural_structure)
+    try:
+        for step_description in description["steps"]:
+            parameters = {name: decoder.decode(value) for name, value in step_description["parameters"].items()}
+            step = _step_types[step_description["type"]](name=step_description["name"], **parameters)
+            step.trainable = step_description["trainable"]
+            step.assignable = step_description["assignable"]
+            step.dtype = step_description.get("dtype")
+    finally:
+        dfpy.shared.set_default_neural_structure(default_neural_structure)
+
+    steps = neural_structure.steps
+    for connection in description["connections"]:
+        neural_structure.connect(steps[connection["input_step"]], steps[connection["output_step"]],
+                                 kernel_weights=decoder.decode(connection["kernel_weights"]),
+                                 pointwise_weights=decoder.decode(connection["pointwise_weights"]),
+                                 activation_function=decoder.decode(connection["activation_function"]),
+                                 contract_dimensions=decoder.decode(connection["contract_dimensions"]),
+                                 contraction_weights=decoder.decode(connection["contraction_weights"]),
+                                 expand_dimensions=decoder.decode(connection["expand_dimensions"]))
+
+    return neural_structure
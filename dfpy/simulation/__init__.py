@@ -0,0 +1,14 @@
+from dfpy.simulation.simulator import Simulator
+from dfpy.simulation.compiled_steps import CompiledStep, compile_step
+from dfpy.simulation.compiled_connections import CompiledConnection
+from dfpy.simulation.convolution import DirectConvolution, SeparableConvolution, FFTConvolution, MatrixConvolution, \
+    build_convolution, estimate_costs, select_method
+from dfpy.simulation.kernels import sample_kernel, kernel_ranges, kernel_shape
+from dfpy.simulation.sweep import simulate_sweep
+from dfpy.simulation.recording import Recorder, MemorySink, RingBufferSink, NpyFileSink
+from dfpy.simulation.scheduling import ThreadedSchedule, partition_by_cost
+from dfpy.simulation.events import EventTimeline
+from dfpy.simulation.profiling import Profiler, ProfileEntry
+from dfpy.simulation.distributed import DistributedSweep
+from dfpy.simulation.precision import precision_report
+from dfpy.simulation.resources import resource_report
@@ -0,0 +1,75 @@
+import numpy as np
+
+from dfpy.activation_function import ActivationFunction, Sigmoid, HardSigmoid, Identity
+
+
+class CompiledActivationFunction:
+    """Base class for the runtime counterpart of an :class:`ActivationFunction`.
+    """
+    def __init__(self, activation_function: ActivationFunction):
+        self._activation_function = activation_function
+
+    @property
+    def activation_function(self):
+        return self._activation_function
+
+    @property
+    def key(self):
+        """Hashable description of the function: compiled activation functions with equal keys compute the same
+        output, so that it can be shared.
+        """
+        return type(self), getattr(self._activation_function, "beta", None)
+
+    def __call__(self, x, out):
+        """Applies the activation function to x and writes the result into out.
+
+        :param x: input array
+        :param out: preallocated output array (may be x itself)
+        """
+        raise NotImplementedError()
+
+
+class CompiledSigmoid(CompiledActivationFunction):
+    """Logistic sigmoid 1/(1+exp(-beta*x)), evaluated through tanh so that it does not overflow for large beta.
+    """
+    def __call__(self, x, out):
+        beta = self._activation_function.beta
+        np.multiply(x, 0.5 * beta, out=out)
+        np.tanh(out, out=out)
+        out += 1.0
+        out *= 0.5
+        return out
+
+
+class CompiledHardSigmoid(CompiledActivationFunction):
+    """Piecewise-linear sigmoid clip(beta*x/4 + 1/2, 0, 1).
+    """
+    def __call__(self, x, out):
+        np.multiply(x, 0.25 * self._activation_function.beta, out=out)
+        out += 0.5
+        np.clip(out, 0.0, 1.0, out=out)
+        return out
+
+
+class CompiledIdentity(CompiledActivationFunction):
+    """Identity function.
+    """
+    def __call__(self, x, out):
+        if out is not x:
+            np.copyto(out, x)
+        return out
+
+
+def compile_activation_function(activation_function):
+    """Returns the runtime counterpart of an activation function.
+
+    :param ActivationFunction activation_function: the activation function (None is treated as the identity)
+    :return CompiledActivationFunction: the compiled activation function
+    """
+    if activation_function is None or isinstance(activation_function, Identity):
+        return CompiledIdentity(activation_function)
+    if isinstance(activation_function, Sigmoid):
+        return CompiledSigmoid(activation_function)
+    if isinstance(activation_function, HardSigmoid):
+        return CompiledHardSigmoid(activation_function)
+    raise RuntimeError(f"Unsupported activation function: {activation_function}")
@@ -0,0 +1,427 @@
+import numpy as np
+
+from dfpy.connection import Connection, SynapticConnection
+from dfpy.weight_patterns import WeightPattern, CustomWeightPattern, GaussWeightPattern, RepeatedValueWeightPattern, \
+    SparseWeightPattern, LowRankWeightPattern
+from dfpy.simulation.activation import compile_activation_function, CompiledIdentity
+from dfpy.simulation.convolution import build_convolution
+
+
+class CompiledConnection:
+    """Runtime counterpart of a :class:`Connection`. It transforms the value of its input step and adds the result to
+    the input buffer of its output step.
+
+    The transformation is applied in the following order: activation function (synaptic connections only), kernel
+    convolution, pointwise weights, contraction, expansion. If the connection expands dimensions, the pointwise
+    weights are applied after the expansion instead, so that they can be specified in the space of the output step.
+    All intermediate results are written into buffers that are allocated once at compile time.
+
+    Stages are fused where possible: pointwise weights, contraction weights and the contraction are a single einsum
+    over the input (the weights are multiplied once at compile time), scalar weights are applied to the smallest
+    buffer they can be applied to, and pointwise weights after an expansion are applied while the signal is written
+    or added to the input of the output step, so that no full-size intermediate is kept per connection.
+
+    If the connection both contracts and expands dimensions and its pointwise weights span the dimensions of the input
+    step followed by the expanded dimensions, the weights define a linear map instead: the output is the sum over the
+    contracted dimensions of the input times the weights, out[k, e] = sum_c x[k, c] * W[k, c, e], where k are the kept
+    and c the contracted dimensions of the input step and e are the expanded dimensions. Sparse and low-rank weight
+    patterns are applied without materializing the dense weights in this case, so that memory and FLOPs scale with
+    the number of non-zero entries or the rank.
+
+    In a batched simulation, a batched input step yields a signal with a leading batch axis. Dimension indices
+    (contracted, expanded) always refer to the dimensions of the steps, not counting the batch axis.
+    """
+    def __init__(self, connection: Connection, source, target, dtype=np.float64, border_type="zero",
+                 convolution_method=None, **options):
+        """Creates a CompiledConnection.
+
+        :param connection: the connection
+        :param CompiledStep source: the compiled input step
+        :param CompiledStep target: the compiled output step
+        :param dtype: dtype of the buffers
+        :param border_type: border type of the kernel convolution ("zero" or "circular")
+        :param convolution_method: method of the kernel convolution (None to choose automatically)
+        """
+        self._connection = connection
+        self._source = source
+        self._dtype = dtype
+        self._operations = []
+        self._gain = 1.0
+        self._convolution = None
+
+        signal = source.value
+        owned = False
+        # Number of leading batch axes of the signal
+        self._lead = signal.ndim - len(source.shape)
+        if self._lead > 0 and not target.batched:
+            raise RuntimeError(f"The connection from {connection.input_step.name} to {target.name} carries a batch "
+                               f"axis, but its output step is not batched")
+
+        contract_dimensions = tuple(connection.contract_dimensions) if connection.contract_dimensions else ()
+        expand_dimensions = tuple(connection.expand_dimensions) if connection.expand_dimensions else ()
+
+        # Activation function
+        activation_function = None
+        if isinstance(connection, SynapticConnection):
+            activation_function = compile_activation_function(connection.activation_function)
+        shared_activation_function = getattr(source, "activation_function", None)
+        if activation_function is None or isinstance(activation_function, CompiledIdentity):
+            pass
+        elif shared_activation_function is not None and shared_activation_function.key == activation_function.key:
+            # The input step computes the output once per time step for all of its connections
+            signal = source.output
+        else:
+            signal_in = signal
+            signal = np.empty(signal.shape, dtype=dtype)
+            self._operations.append(lambda x=signal_in, out=signal, f=activation_function: f(x, out))
+            owned = True
+
+        # Kernel
+        kernel_weights = connection.kernel_weights
+        if isinstance(kernel_weights, WeightPattern):
+            if kernel_weights.dimensionality() != signal.ndim - self._lead:
+                raise RuntimeError(f"Dimensionality of the kernel of the connection from {connection.input_step.name} "
+                                   f"does not match the dimensionality of its input")
+            out = np.empty(signal.shape, dtype=dtype)
+            self._convolution = build_convolution(kernel_weights, signal, out, border_type, convolution_method)
+            self._operations.append(self._convolution.compute)
+            signal = out
+            owned = True
+        elif kernel_weights is not None:
+            self._gain *= float(kernel_weights)
+
+        # Pointwise weights, contraction weights and contraction
+        pointwise_weights = getattr(connection, "pointwise_weights", None)
+        source_ndim = signal.ndim - self._lead
+        is_mapping = bool(contract_dimensions) and bool(expand_dimensions)\
+            and isinstance(pointwise_weights, WeightPattern)\
+            and pointwise_weights.dimensionality() == source_ndim + len(expand_dimensions)
+        contract_dimensions = tuple((d if d >= 0 else d + source_ndim) + self._lead for d in contract_dimensions)
+        if is_mapping:
+            weights = self._contraction_weight_array(connection.contraction_weights, contract_dimensions,
+                                                     signal.shape)
+            if weights is not None:
+                weighted = signal if owned else np.empty(signal.shape, dtype=dtype)
+                self._operations.append(lambda x=signal, w=weights, out=weighted: np.multiply(x, w, out=out))
+                signal = weighted
+            # Contraction, expansion and pointwise weights are a single linear map
+            signal = self._add_mapping(pointwise_weights, signal, contract_dimensions, expand_dimensions, target)
+            owned = True
+        elif contract_dimensions:
+            signal = self._add_contraction(None if expand_dimensions else pointwise_weights,
+                                           connection.contraction_weights, signal, contract_dimensions, owned)
+            owned = True
+        elif not expand_dimensions:
+            signal, owned = self._add_pointwise_weights(pointwise_weights, signal, owned)
+
+        # Expansion (a view that broadcasts against the output step; pointwise weights are applied when the signal is
+        # added to the input of the output step)
+        final_weights = None
+        if expand_dimensions and not is_mapping:
+            ndim = signal.ndim - self._lead + len(expand_dimensions)
+            expand_dimensions = tuple(d if d >= 0 else d + ndim for d in expand_dimensions)
+            remaining_sizes = iter(signal.shape[self._lead:])
+            expanded_shape = [1 if axis in expand_dimensions else next(remaining_sizes) for axis in range(ndim)]
+            signal = signal.reshape(signal.shape[:self._lead] + tuple(expanded_shape))
+            if isinstance(pointwise_weights, WeightPattern):
+                final_weights = _pointwise_array(pointwise_weights, dtype)
+                signal = self._align(signal, final_weights.ndim)
+                try:
+                    np.broadcast_shapes(signal.shape, final_weights.shape)
+                except ValueError:
+                    raise RuntimeError(f"Pointwise weights of shape {final_weights.shape} of the connection from "
+                                       f"{connection.input_step.name} do not match its signal of shape "
+                                       f"{signal.shape}")
+            elif pointwise_weights is not None:
+                self._gain *= float(pointwise_weights)
+
+        # Gain from scalar weights, applied where the signal is smallest
+        self._factor = None
+        if final_weights is not None:
+            self._factor = final_weights if self._gain == 1.0 else final_weights * self._gain
+        elif self._gain != 1.0:
+            gain = np.dtype(dtype).type(self._gain)
+            if owned or signal.size < target.value.size:
+                scaled = signal if owned else np.empty(signal.shape, dtype=dtype)
+                self._operations.append(lambda x=signal, g=gain, out=scaled: np.multiply(x, g, out=out))
+                signal = scaled
+            else:
+                self._factor = gain
+
+        signal = self._align(signal, len(target.shape))
+        target_shape = target.value.shape
+        try:
+            broadcast_shape = np.broadcast_shapes(signal.shape, np.shape(self._factor), target_shape)
+        except ValueError:
+            broadcast_shape = None
+        if broadcast_shape != target_shape:
+            raise RuntimeError(f"Output of the connection from {connection.input_step.name} has shape "
+                               f"{signal.shape}, which is incompatible with the shape {target_shape} "
+                               f"of its output step")
+
+        self._signal = signal
+        # Every operation passes over a buffer of at most the size of the input step, apart from the convolution
+        self._estimated_cost = len(self._operations) * source.value.size + target.value.size
+        if self._convolution is not None:
+            self._estimated_cost += self._convolution.estimated_cost - source.value.size
+        # Buffer of the output step that holds the weighted signal before it is added (shared by all connections
+        # into the step)
+        self._scratch = target.scratch if self._factor is not None else None
+
+    def _add_pointwise_weights(self, pointwise_weights, signal, owned):
+        if pointwise_weights is None:
+            return signal, owned
+        if not isinstance(pointwise_weights, WeightPattern):
+            self._gain *= float(pointwise_weights)
+            return signal, owned
+        weights = _pointwise_array(pointwise_weights, self._dtype)
+        signal = self._align(signal, weights.ndim)
+        try:
+            shape = np.broadcast_shapes(signal.shape, weights.shape)
+        except ValueError:
+            raise RuntimeError(f"Pointwise weights of shape {weights.shape} of the connection from "
+                               f"{self._connection.input_step.name} do not match its signal of shape {signal.shape}")
+        out = signal if owned and shape == signal.shape else np.empty(shape, dtype=self._dtype)
+        self._operations.append(lambda x=signal, w=weights, out=out: np.multiply(x, w, out=out))
+        return out, True
+
+    def _add_contraction(self, pointwise_weights, contraction_weights, signal, contract_dimensions, owned):
+        # Pointwise weights, contraction weights and the sum over the contracted dimensions are a single einsum, so
+        # that no weighted copy of the signal is created
+        if pointwise_weights is not None and not isinstance(pointwise_weights, WeightPattern):
+            self._gain *= float(pointwise_weights)
+            pointwise_weights = None
+        lead = self._lead
+        weights = None
+        if pointwise_weights is not None:
+            weights = _pointwise_array(pointwise_weights, self._dtype)
+            if weights.shape != signal.shape[lead:]:
+                # Weights that broadcast against the signal are applied separately
+                signal, owned = self._add_pointwise_weights(pointwise_weights, signal, owned)
+                weights = None
+
+        vectors = self._contraction_weight_vectors(contraction_weights, contract_dimensions, signal.shape)
+        if weights is not None:
+            # The weights are constant, so the contraction weights are folded into them once
+            for axis, axis_weights in vectors:
+                weights = weights * axis_weights.reshape([-1 if i == axis - lead else 1 for i in range(weights.ndim)])
+            vectors = []
+
+        letters = [chr(ord("a") + axis) for axis in range(signal.ndim - lead)]
+        operands = [signal]
+        subscripts = ["..." + "".join(letters)]
+        if weights is not None:
+            operands.append(weights)
+            subscripts.append("".join(letters))
+        for axis, axis_weights in vectors:
+            operands.append(axis_weights)
+            subscripts.append(letters[axis - lead])
+        kept = [letter for axis, letter in enumerate(letters) if axis + lead not in contract_dimensions]
+
+        out = np.empty(signal.shape[:lead] + tuple(size for axis, size in enumerate(signal.shape)
+                                                   if axis >= lead and axis not in contract_dimensions),
+                       dtype=self._dtype)
+        if len(operands) == 1:
+            self._operations.append(lambda x=signal, axes=contract_dimensions, out=out: np.sum(x, axis=axes, out=out))
+        else:
+            # Without optimization, einsum computes the weighted sum in a single pass without intermediates
+            subscripts = ",".join(subscripts) + "->..." + "".join(kept)
+            self._operations.append(lambda operands=operands, out=out:
+                                    np.einsum(subscripts, *operands, out=out, casting="same_kind"))
+        return out
+
+    def _add_mapping(self, weight_pattern, signal, contract_dimensions, expand_dimensions, target):
+        lead = self._lead
+        source_shape = signal.shape[lead:]
+        target_ndim = len(target.shape)
+        expand_dimensions = tuple(d if d >= 0 else d + target_ndim for d in expand_dimensions)
+        contracted = tuple(axis - lead for axis in contract_dimensions)
+        kept = tuple(axis for axis in range(len(source_shape)) if axis not in contracted)
+        if len(kept) + len(expand_dimensions) != target_ndim:
+            raise RuntimeError(f"The connection from {self._connection.input_step.name} to {target.name} does not "
+                               f"map the dimensions of its input step to those of its output step")
+        # Position of each dimension of the output step in the joint space (source dimensions, expanded dimensions)
+        kept_positions = iter(kept)
+        target_axes = [len(source_shape) + expand_dimensions.index(axis) if axis in expand_dimensions
+                       else next(kept_positions) for axis in range(target_ndim)]
+        joint_shape = source_shape + tuple(target.shape[axis] for axis in expand_dimensions)
+        target_shape = tuple(joint_shape[axis] for axis in target_axes)
+        out = np.empty(signal.shape[:lead] + target_shape, dtype=self._dtype)
+
+        weight_shape = np.shape(weight_pattern.pattern) if isinstance(weight_pattern, CustomWeightPattern)\
+            else tuple(getattr(weight_pattern, "shape", joint_shape))
+        if weight_shape != joint_shape:
+            raise RuntimeError(f"The weights of the connection from {self._connection.input_step.name} to "
+                               f"{target.name} must have shape {joint_shape} (the dimensions of the input step "
+                               f"followed by the expanded dimensions), but have shape {weight_shape}")
+
+        if isinstance(weight_pattern, SparseWeightPattern):
+            self._operations.append(_SparseMapping(weight_pattern, signal, out, lead, target_axes, self._dtype))
+        elif isinstance(weight_pattern, LowRankWeightPattern) and not kept \
+                and weight_pattern.u.ndim - 1 == len(source_shape):
+            self._operations.append(_LowRankMapping(weight_pattern, signal, out, lead, target_axes, self._dtype))
+        else:
+            weights = weight_pattern.materialize(joint_shape, self._dtype)
+            letters = [chr(ord("a") + axis) for axis in range(len(joint_shape))]
+            subscripts = "..." + "".join(letters[:len(source_shape)]) + "," + "".join(letters) + "->..." \
+                         + "".join(letters[axis] for axis in target_axes)
+            path = np.einsum_path(subscripts, signal, weights, optimize="optimal")[0]
+            self._operations.append(lambda x=signal, w=weights, out=out:
+                                    np.einsum(subscripts, x, w, out=out, optimize=path, casting="same_kind"))
+        return out
+
+    def _align(self, signal, ndim):
+        # Inserts axes between the batch axis and the step dimensions of a batched signal, so that it broadcasts
+        # against arrays with ndim step dimensions
+        num_missing = ndim - (signal.ndim - self._lead)
+        if self._lead == 0 or num_missing <= 0:
+            return signal
+        return signal.reshape(signal.shape[:self._lead] + (1,) * num_missing + signal.shape[self._lead:])
+
+    def _contraction_weight_vectors(self, contraction_weights, contract_dimensions, shape):
+        if contraction_weights is None:
+            return []
+        if len(contract_dimensions) == 1 and np.ndim(contraction_weights) == 1:
+            contraction_weights = [contraction_weights]
+        if len(contraction_weights) != len(contract_dimensions):
+            raise RuntimeError(f"The connection from {self._connection.input_step.name} specifies "
+                               f"{len(contraction_weights)} contraction weights for {len(contract_dimensions)} "
+                               f"contracted dimensions")
+        vectors = []
+        for axis, axis_weights in zip(contract_dimensions, contraction_weights):
+            axis_weights = np.asarray(axis_weights, dtype=self._dtype)
+            if axis_weights.shape != (shape[axis],):
+                raise RuntimeError(f"Contraction weights for dimension {axis - self._lead} of the connection from "
+                                   f"{self._connection.input_step.name} must have shape {(shape[axis],)}")
+            vectors.append((axis, axis_weights))
+        return vectors
+
+    def _contraction_weight_array(self, contraction_weights, contract_dimensions, shape):
+        vectors = self._contraction_weight_vectors(contraction_weights, contract_dimensions, shape)
+        if not vectors:
+            return None
+        weights = np.ones([1] * len(shape), dtype=self._dtype)
+        for axis, axis_weights in vectors:
+            weights = weights * axis_weights.reshape([-1 if i == axis else 1 for i in range(len(shape))])
+        return weights
+
+    @property
+    def connection(self):
+        return self._connection
+
+    @property
+    def source(self):
+        return self._source
+
+    @property
+    def convolution(self):
+        """The convolution with the kernel weights (None if the connection has no kernel).
+        """
+        return self._convolution
+
+    @property
+    def estimated_cost(self):
+        """Estimated cost of computing the output of the connection and adding it to the output step, in units of a
+        multiply-add over one element (see :func:`estimate_costs`).
+        """
+        return self._estimated_cost
+
+    def _compute(self):
+        for operation in self._operations:
+            operation()
+
+    def write(self, out):
+        """Computes the output of the connection and writes it to out.
+
+        :param out: input buffer of the output step
+        """
+        self._compute()
+        if self._factor is None:
+            np.copyto(out, self._signal)
+        else:
+            np.multiply(self._signal, self._factor, out=out)
+
+    def accumulate(self, out):
+        """Computes the output of the connection and adds it to out.
+
+        :param out: input buffer of the output step
+        """
+        self._compute()
+        if self._factor is not None:
+            np.multiply(self._signal, self._factor, out=self._scratch)
+            np.add(out, self._scratch, out=out)
+        else:
+            np.add(out, self._signal, out=out)
+
+
+def _pointwise_array(weight_pattern, dtype):
+    if isinstance(weight_pattern, CustomWeightPattern):
+        return weight_pattern.materialize(np.shape(weight_pattern.pattern), dtype)
+    if isinstance(weight_pattern, (RepeatedValueWeightPattern, SparseWeightPattern, LowRankWeightPattern)):
+        # Elementwise, sparse and low-rank weights are applied densely; they only save work as linear maps
+        return weight_pattern.materialize(weight_pattern.shape, dtype)
+    if isinstance(weight_pattern, GaussWeightPattern):
+        raise RuntimeError("Gauss weight patterns are only supported as kernel weights")
+    raise RuntimeError(f"Unsupported pointwise weight pattern: {weight_pattern}")
+
+
+def _flat_view(array, lead):
+    # The mappings read and write the buffers through views with flattened step dimensions
+    flat = array.reshape(array.shape[:lead] + (-1,))
+    if not np.may_share_memory(flat, array):
+        raise RuntimeError("Cannot flatten a buffer without copying it")
+    return flat
+
+
+class _SparseMapping:
+    """Applies a sparse linear map: gathers the input entries of all non-zero weights, multiplies them with the
+    weights, and sums them per output entry. Work and memory scale with the number of non-zero weights.
+    """
+    def __init__(self, weight_pattern: SparseWeightPattern, signal, out, lead, target_axes, dtype):
+        coordinates = weight_pattern.coordinates
+        source_ndim = signal.ndim - lead
+        source_indices = np.ravel_multi_index(tuple(coordinates[:source_ndim]), signal.shape[lead:])
+        target_indices = np.ravel_multi_index(tuple(coordinates[axis] for axis in target_axes), out.shape[lead:])
+        # Entries are sorted by output entry, so that each output entry sums a contiguous range (CSR)
+        order = np.argsort(target_indices, kind="stable")
+        self._source_indices = source_indices[order]
+        self._weights = np.asarray(weight_pattern.values, dtype=dtype)[order]
+        target_indices = target_indices[order]
+        self._rows, self._starts = np.unique(target_indices, return_index=True)
+
+        self._signal = _flat_view(signal, lead)
+        self._out = _flat_view(out, lead)
+        batch_shape = signal.shape[:lead]
+        self._products = np.empty(batch_shape + (len(self._weights),), dtype=dtype)
+        self._sums = np.empty(batch_shape + (len(self._rows),), dtype=dtype)
+
+    def __call__(self):
+        self._out.fill(0)
+        if len(self._rows) == 0:
+            return
+        np.take(self._signal, self._source_indices, axis=-1, out=self._products)
+        self._products *= self._weights
+        np.add.reduceat(self._products, self._starts, axis=-1, out=self._sums)
+        self._out[..., self._rows] = self._sums
+
+
+class _LowRankMapping:
+    """Applies a low-rank linear map U·Vᵀ from all dimensions of the input to the expanded dimensions in two
+    products, (x·U)·Vᵀ, whose cost scales with the rank.
+    """
+    def __init__(self, weight_pattern: LowRankWeightPattern, signal, out, lead, target_axes, dtype):
+        source_ndim = signal.ndim - lead
+        rank = weight_pattern.rank
+        self._u = np.asarray(weight_pattern.u, dtype=dtype).reshape(-1, rank)
+        # The dimensions of V follow the order of the expanded dimensions; reorder them to the order of the output
+        v = np.asarray(weight_pattern.v, dtype=dtype)
+        v = np.transpose(v, [axis - source_ndim for axis in target_axes] + [v.ndim - 1])
+        self._v_transposed = np.ascontiguousarray(v.reshape(-1, rank).T)
+
+        self._signal = _flat_view(signal, lead)
+        self._out = _flat_view(out, lead)
+        self._projected = np.empty(signal.shape[:lead] + (rank,), dtype=dtype)
+
+    def __call__(self):
+        np.matmul(self._signal, self._u, out=self._projected)
+        np.matmul(self._projected, self._v_transposed, out=self._out)
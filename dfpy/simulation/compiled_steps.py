@@ -0,0 +1,800 @@
+import bisect
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from dfpy.steps import Step, Field, Node, NodeArray, GaussInput, CustomInput, NoiseInput, Boost, TimedBoost, \
+    TimedCustomInput, TimedGate
+from dfpy.simulation.activation import compile_activation_function
+from dfpy.simulation.convolution import build_convolution
+
+
+class CompiledStep:
+    """Base class for the runtime counterpart of a :class:`Step`.
+
+    A compiled step owns a preallocated value buffer that is updated in place. Other compiled steps and connections
+    keep references to this buffer, so it must never be rebound.
+
+    Stateless steps compute their value from the current time (and their inputs) in :meth:`update`. Stateful steps
+    accumulate their inputs in :meth:`accumulate_inputs` and advance their state by one Euler step in
+    :meth:`integrate`.
+
+    Every compiled step counts the changes of its value in its version, so that a step that reads it can tell whether
+    it changed: static steps only change on reset and when a parameter is changed, other stateless steps change on
+    every update that changes their value, and stateful steps on every time step unless they are quiescent (see
+    :class:`CompiledDynamics`). Stateless steps whose value is piecewise constant in time report the times at which it
+    changes (see :meth:`breakpoints`), so that the simulator only updates them at these times.
+
+    In a batched simulation, the value buffer of a step carries a leading batch axis if the step differs between
+    the batch elements (because it is stateful, noisy, or has overridden parameters). Steps that are identical for
+    all batch elements keep a single unbatched buffer, which broadcasts against the batched ones.
+    """
+    stateful = False
+    # Whether the value carries a batch axis in every batched simulation (otherwise, only if parameters of the step
+    # are overridden per batch element)
+    batched_by_default = False
+    batch_parameter_names = ()
+    # Parameters that are read from the step on every time step, so changing them needs no further action
+    live_parameter_names = ()
+
+    def __init__(self, step: Step, shape: tuple, dtype=np.float64, batch_size=None, parameters=None, **options):
+        """Creates a CompiledStep.
+
+        :param step: the step
+        :param shape: shape of the value of the step (without batch axis)
+        :param dtype: dtype of the buffers
+        :param batch_size: number of batch elements (None for an unbatched simulation)
+        :param parameters: dict mapping parameter names of the step to arrays holding one value per batch element
+        """
+        parameters = parameters if parameters is not None else {}
+        for name, values in parameters.items():
+            if name not in self.batch_parameter_names:
+                raise RuntimeError(f"Parameter '{name}' of step {step.name} cannot be varied across a batch")
+            if batch_size is None or np.shape(values) != (batch_size,):
+                raise RuntimeError(f"Parameter '{name}' of step {step.name} must hold one value per batch element")
+
+        self._step = step
+        self._dtype = dtype
+        self._shape = tuple(shape)
+        self._batched = self.layout(step, batch_size, parameters)[1]
+        self._batch_shape = (batch_size,) if self._batched else ()
+        # Overridden parameters are shaped so that they broadcast against the batched buffers
+        self._parameters = {name: np.asarray(values, dtype=dtype).reshape((batch_size,) + (1,) * len(self._shape))
+                            for name, values in parameters.items()}
+        self.value = np.zeros(self._batch_shape + self._shape, dtype=dtype)
+        self.input_connections = []
+        self._scratch = None
+        # Incremented whenever the value changes
+        self.version = 0
+        # Versions of the steps read by the incoming connections when they were last checked
+        self._input_versions = None
+
+    @classmethod
+    def value_shape(cls, step):
+        """Returns the shape of the value of a step of this type (without batch axis).
+
+        :param step: the step
+        """
+        return ()
+
+    @classmethod
+    def layout(cls, step, batch_size=None, parameters=None):
+        """Returns the shape of the value of a step of this type (without batch axis) and whether it carries a batch
+        axis, without compiling the step.
+
+        :param step: the step
+        :param batch_size: number of batch elements (None for an unbatched simulation)
+        :param parameters: dict of the parameters of the step that are overridden per batch element
+        """
+        batched = batch_size is not None and (cls.batched_by_default or bool(parameters))
+        return tuple(cls.value_shape(step)), batched
+
+    @property
+    def step(self):
+        return self._step
+
+    @property
+    def name(self):
+        return self._step.name
+
+    @property
+    def shape(self):
+        """Shape of the value of the step (without batch axis).
+        """
+        return self._shape
+
+    @property
+    def dtype(self):
+        return self.value.dtype
+
+    @property
+    def batched(self):
+        """Whether the buffers of the step carry a leading batch axis.
+        """
+        return self._batched
+
+    @property
+    def static(self):
+        """Whether the value of the step only needs to be computed once (on reset).
+        """
+        return self._step.static
+
+    @property
+    def scratch(self):
+        """A buffer with the shape of the value that incoming connections use to weight their output before adding
+        it (allocated on first use).
+        """
+        if self._scratch is None:
+            self._scratch = np.zeros(self.value.shape, dtype=self._dtype)
+        return self._scratch
+
+    @property
+    def estimated_cost(self):
+        """Estimated cost of one time step of the step, without its incoming connections, in units of a multiply-add
+        over one element (see :func:`estimate_costs`). Used to balance the work between threads.
+        """
+        return self.value.size
+
+    def breakpoints(self, time_step_duration):
+        """Returns the times at which the value of a stateless step changes (in ascending order), if it is piecewise
+        constant in time and only depends on the time. Between these times, the step is only updated when one of its
+        inputs changes.
+
+        :param float time_step_duration: duration of a time step
+        :return: list of times, or None if the step has to be updated on every time step
+        """
+        return None
+
+    def inputs_changed(self):
+        """Returns whether any step read by the incoming connections changed (or connections were added or removed)
+        since the previous call.
+        """
+        # The step itself is excluded, since a stateful step only changes while it is updated
+        versions = [(connection.source, connection.source.version) for connection in self.input_connections
+                    if connection.source is not self]
+        changed = versions != self._input_versions
+        self._input_versions = versions
+        return changed
+
+    def parameter(self, name):
+        """Returns the value of a parameter: the per-batch-element values if it is overridden, the value of the step
+        otherwise.
+
+        :param name: name of the parameter
+        """
+        values = self._parameters.get(name)
+        if values is None:
+            return getattr(self._step, name)
+        return values
+
+    def handle_parameter_change(self, name):
+        """Brings the step up to date after a parameter of the step was changed (see :meth:`Step._notify_observers`).
+
+        :param name: name of the changed parameter
+        :return: whether the change was handled in place; otherwise, the step has to be compiled again
+        """
+        # Parameters that are overridden per batch element do not depend on the step
+        return name in self.live_parameter_names or name in self._parameters
+
+    def reset(self, rng):
+        """Resets the buffers of the step to their initial values.
+
+        :param rng: random number generator of the simulation
+        """
+        self.value.fill(0)
+
+    def update(self, time, time_step_duration, rng):
+        """Computes the value of a stateless step at the given time (and increments the version if it changed).
+
+        :param float time: current simulation time
+        :param float time_step_duration: duration of a time step
+        :param rng: random number generator of the simulation
+        """
+        pass
+
+
+class CompiledDynamics(CompiledStep):
+    """Base class for steps that evolve according to a neural dynamics (fields and nodes).
+
+    By default, the step takes an Euler step of one time step duration on every time step. With multi-rate
+    integration, a step whose time scale is long compared to the time step duration takes an Euler step that spans a
+    multiple of the time step duration (a power of two, so that the updates of steps with different multiples stay
+    aligned), such that the ratio of the step to the time scale stays below multi_rate. The step reads its inputs and
+    computes its interaction only at the start of such a step. In between, its value follows the Euler step linearly
+    (one increment per time step), so that faster steps read an interpolated value rather than a value that jumps.
+
+    With adaptive time stepping, the multiple is additionally controlled by an estimate of the local error: the
+    change of the rate of change between two Euler steps. The multiple is halved if the estimated error of the next
+    step exceeds adaptive_tolerance, and doubled if the error of a twice as long step stays below it, so that the
+    step takes long steps while it is close to a fixed point. The multiple is bounded by multi_rate (1 by default).
+
+    With a quiescence tolerance, a step that is not noisy becomes quiescent once its inputs did not change since its
+    previous Euler step (all steps it reads from are static, or quiescent themselves) and its value changes by at
+    most the tolerance per time step. A quiescent step keeps its value and its output, and skips accumulating its
+    inputs and integrating (counted in skipped_updates), until one of the steps it reads from changes or one of its
+    parameters is changed.
+    """
+    stateful = True
+    batched_by_default = True
+    batch_parameter_names = ("resting_level", "time_scale", "noise_strength")
+    live_parameter_names = batch_parameter_names
+    # Upper bound for the number of time steps spanned by one Euler step
+    max_rate_multiple = 1024
+
+    def __init__(self, step, shape, dtype=np.float64, multi_rate=None, adaptive_tolerance=None,
+                 quiescence_tolerance=None, **options):
+        """Creates a CompiledDynamics.
+
+        :param step: the step
+        :param shape: shape of the value of the step (without batch axis)
+        :param dtype: dtype of the buffers
+        :param multi_rate: maximum ratio of the duration of an Euler step to the time scale (None to take an Euler
+        step on every time step, unless adaptive_tolerance is given)
+        :param adaptive_tolerance: tolerated local error of an Euler step, in units of the activation (None to
+        disable adaptive time stepping)
+        :param quiescence_tolerance: largest change of the value per time step at which the step becomes quiescent
+        (None to update the step on every time step)
+        """
+        super().__init__(step, shape, dtype, **options)
+        full_shape = self.value.shape
+        self.input_sum = np.zeros(full_shape, dtype=dtype)
+        self.output = np.zeros(full_shape, dtype=dtype)
+        # Change of the value per time step during the current Euler step
+        self._rate = np.zeros(full_shape, dtype=dtype)
+        self._noise = np.zeros(full_shape, dtype=_random_dtype(dtype))
+        self._noisy = False
+        # Holds one scalar per batch element (e.g., the summed output for the global inhibition)
+        self._reduced = np.zeros(self._batch_shape + (1,) * len(self._shape), dtype=dtype)
+        self._activation_function = compile_activation_function(step.activation_function)
+
+        self._adaptive_tolerance = adaptive_tolerance
+        if multi_rate is None and adaptive_tolerance is not None:
+            multi_rate = 1.0
+        self._multi_rate = multi_rate
+        self._previous_rate = np.zeros(full_shape, dtype=dtype) if adaptive_tolerance is not None else None
+        self._has_previous_rate = False
+        self._rate_multiple = 1
+        self._ticks_until_update = 0
+
+        self._quiescence_tolerance = quiescence_tolerance
+        self._quiescent = False
+        self._inputs_changed = True
+        self._skipped_updates = 0
+
+    @property
+    def estimated_cost(self):
+        # The activation function and the Euler step take about eight passes over the state
+        return 8 * self.value.size
+
+    @property
+    def activation_function(self):
+        """The compiled activation function. The output buffer always holds the activation function applied to the
+        current value, so that connections with the same activation function can read it instead of computing it.
+        """
+        return self._activation_function
+
+    @property
+    def rate_multiple(self):
+        """Number of time steps spanned by the current Euler step.
+        """
+        return self._rate_multiple
+
+    @property
+    def due(self):
+        """Whether the step starts a new Euler step in the next time step, and thus needs its inputs.
+        """
+        return self._ticks_until_update == 0
+
+    @property
+    def quiescent(self):
+        """Whether the step currently skips its updates because it has settled.
+        """
+        return self._quiescent
+
+    @property
+    def skipped_updates(self):
+        """Number of time steps since the last reset on which the step was quiescent.
+        """
+        return self._skipped_updates
+
+    def handle_parameter_change(self, name):
+        self._quiescent = False
+        return super().handle_parameter_change(name)
+
+    def reset(self, rng):
+        self.value[...] = self.parameter("resting_level")
+        self.input_sum.fill(0)
+        self._activation_function(self.value, self.output)
+        self.version += 1
+        self._rate_multiple = 1
+        self._ticks_until_update = 0
+        self._has_previous_rate = False
+        self._quiescent = False
+        self._input_versions = None
+        self._inputs_changed = True
+        self._skipped_updates = 0
+
+    def accumulate_inputs(self):
+        """Sums the outputs of all incoming connections into the input buffer.
+
+        The first connection writes its output directly, all others add theirs, so the input buffer is traversed once
+        per connection. A quiescent step only checks whether any of its inputs changed.
+        """
+        connections = self.input_connections
+        if self._quiescence_tolerance is not None:
+            self._inputs_changed = self.inputs_changed()
+            if self._quiescent:
+                if not self._inputs_changed:
+                    return
+                self._quiescent = False
+        if not connections:
+            self.input_sum.fill(0)
+            return
+        connections[0].write(self.input_sum)
+        for connection in connections[1:]:
+            connection.accumulate(self.input_sum)
+
+    def _add_interaction(self, rate):
+        pass
+
+    def integrate(self, time_step_duration, rng):
+        """Advances the state by one time step. At the start of an Euler step that spans m time steps of duration dt,
+        the change per time step is computed from the inputs, and then added on each of the m time steps:
+        u += dt/tau * (-u + h + s + interaction) + sqrt(m*dt)/(m*tau) * q * xi
+
+        :param float time_step_duration: duration of a time step
+        :param rng: random number generator of the simulation
+        """
+        if self._ticks_until_update == 0 and not self._quiescent:
+            self._start_euler_step(time_step_duration, rng)
+        if self._quiescent:
+            self._skipped_updates += 1
+            return
+        self._ticks_until_update -= 1
+        self.value += self._rate
+        if self._noisy:
+            self.value += self._noise
+        self._activation_function(self.value, self.output)
+        self.version += 1
+
+    def _start_euler_step(self, time_step_duration, rng):
+        rate = self._rate
+        time_scale = self.parameter("time_scale")
+        noise_strength = self.parameter("noise_strength")
+        np.subtract(self.parameter("resting_level"), self.value, out=rate)
+        rate += self.input_sum
+        self._add_interaction(rate)
+        rate *= time_step_duration / time_scale
+
+        self._noisy = bool(np.any(noise_strength != 0))
+        if (self._quiescence_tolerance is not None and not self._noisy and not self._inputs_changed
+                and max(float(np.max(rate, initial=0.0)), -float(np.min(rate, initial=0.0)))
+                <= self._quiescence_tolerance):
+            self._quiescent = True
+            return
+
+        if self._multi_rate is not None:
+            self._rate_multiple = self._next_rate_multiple(time_step_duration, time_scale)
+        self._ticks_until_update = self._rate_multiple
+
+        if self._noisy:
+            rng.standard_normal(out=self._noise, dtype=self._noise.dtype)
+            multiple = self._rate_multiple
+            self._noise *= np.sqrt(multiple * time_step_duration) / (multiple * time_scale) * noise_strength
+
+    def _next_rate_multiple(self, time_step_duration, time_scale):
+        # Largest power of two for which the Euler step stays within multi_rate times the time scale
+        ratio = self._multi_rate * float(np.min(time_scale)) / time_step_duration
+        max_multiple = 1
+        while max_multiple * 2 <= min(ratio, self.max_rate_multiple):
+            max_multiple *= 2
+        multiple = max_multiple
+
+        if self._adaptive_tolerance is not None:
+            multiple = self._rate_multiple
+            if self._has_previous_rate:
+                # The rate changes by about m * dt * u'' per Euler step, so a step of k time steps deviates from the
+                # solution by about k*k/(2*m) times the change of the rate per time step
+                change = self._previous_rate
+                np.subtract(self._rate, change, out=change)
+                np.abs(change, out=change)
+                error = float(np.max(change, initial=0.0)) / (2 * multiple)
+                if error * multiple * multiple > self._adaptive_tolerance:
+                    multiple = max(multiple // 2, 1)
+                elif error * 4 * multiple * multiple <= self._adaptive_tolerance:
+                    multiple *= 2
+            multiple = min(multiple, max_multiple)
+            np.copyto(self._previous_rate, self._rate)
+            self._has_previous_rate = True
+        return multiple
+
+
+class CompiledField(CompiledDynamics):
+    """Runtime counterpart of a :class:`Field`.
+    """
+    batch_parameter_names = CompiledDynamics.batch_parameter_names + ("global_inhibition",)
+    live_parameter_names = batch_parameter_names
+
+    def __init__(self, step: Field, dtype=np.float64, border_type="zero", convolution_method=None, **options):
+        """Creates a CompiledField.
+
+        :param step: the field
+        :param dtype: dtype of the buffers
+        :param border_type: border type of the lateral interaction ("zero" or "circular")
+        :param convolution_method: convolution method of the lateral interaction (None to choose automatically)
+        """
+        super().__init__(step, self.value_shape(step), dtype, **options)
+        self._lateral = np.zeros(self.value.shape, dtype=dtype)
+        self._field_axes = tuple(range(len(self._batch_shape), self.value.ndim))
+        self._border_type = border_type
+        self._convolution_method = convolution_method
+        self._build_convolution()
+
+    @classmethod
+    def value_shape(cls, step):
+        return step.shape()
+
+    def _build_convolution(self):
+        interaction_kernel = self._step.interaction_kernel
+        self._convolution = None
+        if interaction_kernel is not None:
+            if interaction_kernel.dimensionality() != len(self._shape):
+                raise RuntimeError(f"Dimensionality of the interaction kernel of {self._step.name} does not match "
+                                   f"the dimensionality of the field")
+            self._convolution = build_convolution(interaction_kernel, self.output, self._lateral,
+                                                  self._border_type, self._convolution_method)
+
+    @property
+    def convolution(self):
+        """The convolution that computes the lateral interaction (None if the field has no interaction kernel).
+        """
+        return self._convolution
+
+    @property
+    def estimated_cost(self):
+        cost = super().estimated_cost
+        if self._convolution is not None:
+            cost += self._convolution.estimated_cost
+        return cost
+
+    def handle_parameter_change(self, name):
+        if name == "interaction_kernel":
+            # Only the kernel is materialized again (usually a hit in the kernel cache); the state is kept
+            self._build_convolution()
+            return True
+        return super().handle_parameter_change(name)
+
+    def _add_interaction(self, rate):
+        if self._convolution is not None:
+            rate += self._convolution.compute()
+        global_inhibition = self.parameter("global_inhibition")
+        if np.any(global_inhibition != 0):
+            np.sum(self.output, axis=self._field_axes, keepdims=True, out=self._reduced)
+            self._reduced *= global_inhibition
+            rate += self._reduced
+
+
+class CompiledNode(CompiledDynamics):
+    """Runtime counterpart of a :class:`Node`.
+    """
+    batch_parameter_names = CompiledDynamics.batch_parameter_names + ("self_excitation",)
+    live_parameter_names = batch_parameter_names
+
+    def __init__(self, step: Node, dtype=np.float64, **options):
+        super().__init__(step, (), dtype, **options)
+
+    def _add_interaction(self, rate):
+        self_excitation = self.parameter("self_excitation")
+        if np.any(self_excitation != 0):
+            np.multiply(self.output, self_excitation, out=self._reduced)
+            rate += self._reduced
+
+
+class CompiledNodeArray(CompiledDynamics):
+    """Runtime counterpart of a :class:`NodeArray`. The parameters of the nodes are arrays that broadcast against
+    the value, so all nodes take their Euler step together.
+    """
+    batch_parameter_names = CompiledDynamics.batch_parameter_names + ("self_excitation",)
+    live_parameter_names = batch_parameter_names
+
+    def __init__(self, step: NodeArray, dtype=np.float64, **options):
+        super().__init__(step, self.value_shape(step), dtype, **options)
+        self._self_excitation = np.zeros(self.value.shape, dtype=dtype)
+
+    @classmethod
+    def value_shape(cls, step):
+        return step.shape()
+
+    def _add_interaction(self, rate):
+        self_excitation = self.parameter("self_excitation")
+        if np.any(self_excitation != 0):
+            np.multiply(self.output, self_excitation, out=self._self_excitation)
+            rate += self._self_excitation
+
+
+class CompiledGaussInput(CompiledStep):
+    """Runtime counterpart of a :class:`GaussInput`.
+    """
+    batch_parameter_names = ("height",)
+
+    def __init__(self, step: GaussInput, dtype=np.float64, **options):
+        super().__init__(step, self.value_shape(step), dtype, **options)
+
+    @classmethod
+    def value_shape(cls, step):
+        return step.shape()
+
+    def handle_parameter_change(self, name):
+        if name in ("height", "mean", "sigmas"):
+            self.reset(None)
+            return True
+        return super().handle_parameter_change(name)
+
+    def reset(self, rng):
+        step = self._step
+        self.value[...] = self.parameter("height")
+        for axis, (dimension, mean, sigma) in enumerate(zip(step.dimensions, step.mean, step.sigmas)):
+            x = np.linspace(dimension.lower, dimension.upper, dimension.size)
+            factor = np.exp(-0.5 * ((x - mean) / sigma) ** 2)
+            self.value *= factor.reshape([-1 if i == axis else 1 for i in range(len(self._shape))])
+
+
+class CompiledCustomInput(CompiledStep):
+    """Runtime counterpart of a :class:`CustomInput`.
+    """
+    def __init__(self, step: CustomInput, dtype=np.float64, **options):
+        super().__init__(step, self.value_shape(step), dtype, **options)
+
+    @classmethod
+    def value_shape(cls, step):
+        return np.shape(step.pattern)
+
+    def handle_parameter_change(self, name):
+        if name == "pattern" and self._step.pattern.shape == self._shape:
+            self.reset(None)
+            return True
+        return name == "dimensions" or super().handle_parameter_change(name)
+
+    def reset(self, rng):
+        np.copyto(self.value, self._step.pattern)
+
+
+class CompiledNoiseInput(CompiledStep):
+    """Runtime counterpart of a :class:`NoiseInput`.
+    """
+    batched_by_default = True
+    batch_parameter_names = ("strength",)
+    live_parameter_names = batch_parameter_names
+
+    def __init__(self, step: NoiseInput, dtype=np.float64, **options):
+        super().__init__(step, self.value_shape(step), dtype, **options)
+        random_dtype = _random_dtype(dtype)
+        self._noise = self.value if random_dtype == self.value.dtype else np.zeros(self.value.shape, random_dtype)
+
+    @classmethod
+    def value_shape(cls, step):
+        return step.shape
+
+    def update(self, time, time_step_duration, rng):
+        rng.standard_normal(out=self._noise, dtype=self._noise.dtype)
+        np.multiply(self._noise, self.parameter("strength"), out=self.value, casting="same_kind")
+        self.version += 1
+
+
+class CompiledBoost(CompiledStep):
+    """Runtime counterpart of a :class:`Boost`.
+    """
+    batch_parameter_names = ("value",)
+
+    def __init__(self, step: Boost, dtype=np.float64, **options):
+        super().__init__(step, (), dtype, **options)
+
+    @property
+    def static(self):
+        return True
+
+    def handle_parameter_change(self, name):
+        if name == "value":
+            self.reset(None)
+            return True
+        return super().handle_parameter_change(name)
+
+    def reset(self, rng):
+        self.value[...] = self.parameter("value")
+
+
+class CompiledTimedBoost(CompiledStep):
+    """Runtime counterpart of a :class:`TimedBoost`.
+    """
+    def __init__(self, step: TimedBoost, dtype=np.float64, **options):
+        super().__init__(step, (), dtype, **options)
+        self._sort_values()
+
+    def _sort_values(self):
+        values = self._step.values
+        self._times = sorted(values)
+        self._values = [values[time] for time in self._times]
+
+    def handle_parameter_change(self, name):
+        if name == "values":
+            self._sort_values()
+            return True
+        return super().handle_parameter_change(name)
+
+    def breakpoints(self, time_step_duration):
+        return self._times
+
+    def update(self, time, time_step_duration, rng):
+        index = bisect.bisect_right(self._times, time) - 1
+        value = self._values[index] if index >= 0 else 0.0
+        if value != self.value:
+            self.value.fill(value)
+            self.version += 1
+
+
+class CompiledTimedCustomInput(CompiledStep):
+    """Runtime counterpart of a :class:`TimedCustomInput`.
+
+    Frames are read on demand from the step's :class:`FrameSource`, so only the current frame is held in memory. With
+    prefetching, a background thread reads the next frames while the simulation proceeds, which hides the latency of
+    on-disk or decoded inputs at the cost of holding prefetch_frames additional frames.
+    """
+    def __init__(self, step: TimedCustomInput, dtype=np.float64, prefetch_frames=0, **options):
+        """Creates a CompiledTimedCustomInput.
+
+        :param step: the timed custom input
+        :param dtype: dtype of the buffers
+        :param prefetch_frames: number of frames to read ahead in a background thread (0 to read synchronously)
+        """
+        super().__init__(step, self.value_shape(step), dtype, **options)
+        self._source = step.frames()
+        self._prefetch_frames = prefetch_frames
+        self._executor = ThreadPoolExecutor(max_workers=1) if prefetch_frames > 0 else None
+        # Futures of frames that are being read ahead, keyed by time step index
+        self._pending = {}
+        # Whether the value is zero (e.g., after the last frame), so that it does not change until the next frame
+        self._zero = True
+
+    @classmethod
+    def value_shape(cls, step):
+        return tuple(dimension.size for dimension in step.dimensions)
+
+    def handle_parameter_change(self, name):
+        if name == "timed_custom_input":
+            self._cancel_pending()
+            self._source = self._step.frames()
+            return True
+        return super().handle_parameter_change(name)
+
+    def _read_frame(self, index):
+        frame = self._source.frame(index)
+        return None if frame is None else np.array(frame, dtype=self._dtype)
+
+    def _frame(self, index):
+        if self._executor is None:
+            return self._source.frame(index)
+        future = self._pending.pop(index, None)
+        if future is None:
+            self._cancel_pending()
+            future = self._executor.submit(self._read_frame, index)
+        # The executor has a single thread, so frames are read in order (as required by iterators)
+        num_frames = self._source.num_frames
+        for ahead in range(index + 1, index + 1 + self._prefetch_frames):
+            if ahead not in self._pending and (num_frames is None or ahead < num_frames):
+                self._pending[ahead] = self._executor.submit(self._read_frame, ahead)
+        return future.result()
+
+    def _cancel_pending(self):
+        for future in self._pending.values():
+            future.cancel()
+        for future in self._pending.values():
+            if not future.cancelled():
+                future.result()
+        self._pending.clear()
+
+    def breakpoints(self, time_step_duration):
+        indices = self._source.change_indices()
+        if indices is None:
+            return None
+        return [index * time_step_duration for index in indices]
+
+    def reset(self, rng):
+        self._cancel_pending()
+        self._source.reset()
+        self.value.fill(0)
+        self._zero = True
+
+    def update(self, time, time_step_duration, rng):
+        frame = self._frame(int(round(time / time_step_duration)))
+        if frame is None:
+            if self._zero:
+                return
+            self.value.fill(0)
+        else:
+            np.copyto(self.value, frame)
+        self._zero = frame is None
+        self.version += 1
+
+
+class CompiledTimedGate(CompiledStep):
+    """Runtime counterpart of a :class:`TimedGate`: the sum of its inputs from min_time (inclusive) to max_time
+    (exclusive), zero otherwise.
+    """
+    # The inputs may be batched
+    batched_by_default = True
+
+    def __init__(self, step: TimedGate, dtype=np.float64, **options):
+        super().__init__(step, self.value_shape(step), dtype, **options)
+        self._open = False
+
+    @classmethod
+    def value_shape(cls, step):
+        return step.shape()
+
+    def handle_parameter_change(self, name):
+        return name in ("min_time", "max_time") or super().handle_parameter_change(name)
+
+    def breakpoints(self, time_step_duration):
+        step = self._step
+        return [step.min_time] if step.max_time is None else [step.min_time, step.max_time]
+
+    def reset(self, rng):
+        self.value.fill(0)
+        self._open = False
+        self._input_versions = None
+
+    def update(self, time, time_step_duration, rng):
+        step = self._step
+        is_open = step.min_time <= time and (step.max_time is None or time < step.max_time)
+        if is_open:
+            connections = self.input_connections
+            if connections:
+                connections[0].write(self.value)
+                for connection in connections[1:]:
+                    connection.accumulate(self.value)
+            self.version += 1
+        elif self._open:
+            self.value.fill(0)
+            self.version += 1
+        self._open = is_open
+
+
+_compiled_step_types = [
+    (Field, CompiledField),
+    (Node, CompiledNode),
+    (NodeArray, CompiledNodeArray),
+    (GaussInput, CompiledGaussInput),
+    (CustomInput, CompiledCustomInput),
+    (NoiseInput, CompiledNoiseInput),
+    (TimedBoost, CompiledTimedBoost),
+    (TimedCustomInput, CompiledTimedCustomInput),
+    (TimedGate, CompiledTimedGate),
+    (Boost, CompiledBoost),
+]
+
+
+def _random_dtype(dtype):
+    # The random number generators only produce float32 and float64 numbers; float16 noise is drawn as float32
+    return np.dtype(np.float32) if np.dtype(dtype).itemsize < 4 else np.dtype(dtype)
+
+
+def compiled_step_type(step: Step):
+    """Returns the compiled step type of a step (a subclass of :class:`CompiledStep`).
+
+    :param step: the step
+    """
+    for step_type, compiled_type in _compiled_step_types:
+        if isinstance(step, step_type):
+            return compiled_type
+    raise RuntimeError(f"Step {step.name} of type {type(step).__name__} is not supported by the NumPy simulator")
+
+
+def compile_step(step: Step, dtype=np.float64, **options):
+    """Returns the runtime counterpart of a step.
+
+    :param step: the step
+    :param dtype: dtype of the buffers
+    :param options: simulation options, which are passed on to the compiled step types that use them
+    :return CompiledStep: the compiled step
+    """
+    return compiled_step_type(step)(step, dtype, **options)
@@ -0,0 +1,536 @@
+import itertools
+import math
+
+import numpy as np
+
+from dfpy.weight_patterns import KernelCache, CustomWeightPattern, SparseWeightPattern
+from dfpy.simulation.kernels import kernel_shape
+
+BORDER_TYPES = ("zero", "circular")
+CONVOLUTION_METHODS = ("direct", "separable", "fft", "matrix")
+
+# Relative costs used to choose between the convolution methods, in units of a multiply-add over one element of
+# a shifted view (about 2 ns on x86-64): the cost per element and log2(size) of a real FFT, the fixed overhead of a
+# NumPy call, the fixed overhead of a forward and inverse FFT, and the cost per entry of a product with a matrix.
+# Checked against timings of Gauss kernels on fields of 51 to 30000 elements in one to three dimensions (NumPy's
+# pocketfft and OpenBLAS), where the estimates are within 1.7 to 2.7 ns per unit for the chosen methods.
+_FFT_COST = 0.6
+_CALL_OVERHEAD_COST = 500.0
+_FFT_OVERHEAD_COST = 12000.0
+_MATRIX_COST = 0.1
+
+# The transforms allocate temporary arrays on every evaluation, so the FFT is only chosen automatically for padded
+# transforms of at least this many elements. Smaller fields are cheaper with a matrix anyway, without allocations.
+_FFT_MIN_PADDED_SIZE = 256
+# Largest number of elements of a field for which the convolution may be applied as a matrix (the matrix holds the
+# square of this many entries)
+_MATRIX_MAX_ELEMENTS = 512
+
+# Cache of kernel spectra, keyed by the content of the kernel, the padded shape, the border type and the dtype
+_spectrum_cache = KernelCache()
+# Cache of convolution matrices, keyed by the content of the kernel, the field shape, the border type and the dtype
+_matrix_cache = KernelCache()
+
+
+def _axis_pieces(offset, size, border_type):
+    # Pairs of (out slice, source slice) that realize out[i] += w * source[i + offset] along one axis
+    if border_type == "circular":
+        offset %= size
+        pieces = [(slice(0, size - offset), slice(offset, size))]
+        if offset > 0:
+            pieces.append((slice(size - offset, size), slice(0, offset)))
+        return pieces
+    lower = max(0, -offset)
+    upper = min(size, size - offset)
+    if lower >= upper:
+        return []
+    return [(slice(lower, upper), slice(lower + offset, upper + offset))]
+
+
+class DirectConvolution:
+    """Convolution of a source buffer with a dense kernel, written into an output buffer of the same shape.
+
+    The convolution is evaluated as a sum of shifted views of the source (one per non-zero kernel entry), so that it
+    runs entirely in place on preallocated buffers. Like the convolutions of DynamicFieldFlow, it computes a
+    cross-correlation, which is identical for the symmetric kernels that are common in DFT. The kernel applies to the
+    trailing axes of the buffers, so that the buffers may carry additional leading axes.
+    """
+    method = "direct"
+    # Set by build_convolution
+    estimated_cost = None
+
+    def __init__(self, kernel, source, out, scratch=None, border_type="zero"):
+        """Creates a DirectConvolution.
+
+        :param kernel: dense kernel array
+        :param source: source buffer
+        :param out: output buffer (same shape as source)
+        :param scratch: optional scratch buffer (same shape as out) that may be shared with other convolutions
+        :param border_type: "zero" to pad the source with zeros, "circular" to wrap it around
+        """
+        if border_type not in BORDER_TYPES:
+            raise RuntimeError(f"Unsupported border type '{border_type}'")
+        kernel = np.asarray(kernel)
+        ndim = kernel.ndim
+        shape = source.shape[source.ndim - ndim:]
+        centers = [(size - 1) // 2 for size in kernel.shape]
+
+        self._kernel = kernel
+        self._border_type = border_type
+        self._out = out
+        self._scratch = np.empty_like(out) if scratch is None else scratch
+        self._terms = []
+        for kernel_index in itertools.product(*[range(size) for size in kernel.shape]):
+            weight = kernel[kernel_index]
+            if weight == 0:
+                continue
+            pieces = [_axis_pieces(position - center, size, border_type)
+                      for position, center, size in zip(kernel_index, centers, shape)]
+            for combination in itertools.product(*pieces):
+                out_index = (Ellipsis,) + tuple(out_slice for out_slice, _ in combination)
+                source_index = (Ellipsis,) + tuple(source_slice for _, source_slice in combination)
+                self._terms.append((out[out_index], source[source_index], self._scratch[out_index],
+                                    out.dtype.type(weight)))
+
+    @property
+    def kernel(self):
+        return self._kernel
+
+    @property
+    def border_type(self):
+        return self._border_type
+
+    def compute(self):
+        """Computes the convolution into the output buffer.
+        """
+        self._out.fill(0)
+        for out_view, source_view, scratch_view, weight in self._terms:
+            np.multiply(source_view, weight, out=scratch_view)
+            out_view += scratch_view
+        return self._out
+
+
+class SeparableConvolution:
+    """Convolution with a kernel that is given as a sum of outer products of 1-D factors (see
+    :meth:`WeightPattern.separable_factors`).
+
+    Each component is applied as a sequence of 1-D convolutions, one along each axis, so that the cost per element
+    is proportional to the sum instead of the product of the kernel sizes. The result is identical to a
+    :class:`DirectConvolution` with the materialized kernel.
+    """
+    method = "separable"
+    # Set by build_convolution
+    estimated_cost = None
+
+    def __init__(self, factors, source, out, border_type="zero"):
+        """Creates a SeparableConvolution.
+
+        :param factors: list of components, each a list holding one 1-D factor per kernel dimension
+        :param source: source buffer
+        :param out: output buffer (same shape as source)
+        :param border_type: "zero" to pad the source with zeros, "circular" to wrap it around
+        """
+        self._factors = factors
+        self._border_type = border_type
+        self._out = out
+        self._scratch = np.empty_like(out)
+        self._stages = [np.empty_like(out), np.empty_like(out)]
+        self._components = []
+
+        for index, component in enumerate(factors):
+            ndim = len(component)
+            # Factors of size one only scale the result and are folded into the first pass
+            gain = 1.0
+            passes = []
+            for axis, factor in enumerate(component):
+                factor = np.asarray(factor)
+                if factor.size == 1:
+                    gain *= float(factor[0])
+                else:
+                    passes.append((axis, factor))
+            if not passes:
+                passes.append((0, np.ones(1)))
+            passes[0] = (passes[0][0], passes[0][1] * gain)
+
+            convolutions = []
+            current = source
+            for pass_index, (axis, factor) in enumerate(passes):
+                if pass_index == len(passes) - 1:
+                    target = out if index == 0 else self._stages[pass_index % 2]
+                else:
+                    target = self._stages[pass_index % 2]
+                kernel = factor.reshape([-1 if i == axis else 1 for i in range(ndim)])
+                convolutions.append(DirectConvolution(kernel, current, target, self._scratch, border_type))
+                current = target
+            self._components.append((convolutions, current))
+
+    @property
+    def factors(self):
+        return self._factors
+
+    @property
+    def border_type(self):
+        return self._border_type
+
+    def compute(self):
+        """Computes the convolution into the output buffer.
+        """
+        for index, (convolutions, result) in enumerate(self._components):
+            for convolution in convolutions:
+                convolution.compute()
+            if index > 0:
+                self._out += result
+        return self._out
+
+
+def _next_fast_size(size):
+    # Smallest 5-smooth number >= size, for which the FFT is efficient
+    best = 2 ** math.ceil(math.log2(max(size, 1)))
+    power5 = 1
+    while power5 < best:
+        power35 = power5
+        while power35 < best:
+            candidate = power35
+            while candidate < size:
+                candidate *= 2
+            best = min(best, candidate)
+            power35 *= 3
+        power5 *= 5
+    return best
+
+
+def _padded_shape(field_shape, kernel_shape, border_type):
+    if border_type == "circular":
+        return tuple(field_shape)
+    return tuple(_next_fast_size(size + kernel_size - 1) for size, kernel_size in zip(field_shape, kernel_shape))
+
+
+def _kernel_spectrum(kernel, padded_shape):
+    # Spectrum of the kernel, flipped and wrapped around so that multiplying it with the spectrum of the source
+    # yields the cross-correlation at the unshifted output positions
+    ndim = kernel.ndim
+    embedded = np.zeros(padded_shape)
+    embedded[tuple(slice(0, size) for size in kernel.shape)] = kernel[(slice(None, None, -1),) * ndim]
+    shifts = [-(size - 1 - (size - 1) // 2) for size in kernel.shape]
+    embedded = np.roll(embedded, shifts, axis=tuple(range(ndim)))
+    return np.fft.rfftn(embedded)
+
+
+class FFTConvolution:
+    """Convolution via the fast Fourier transform.
+
+    The source is transformed on every evaluation and multiplied with the spectrum of the kernel, which is computed
+    once and shared between all convolutions with the same kernel, field shape and border type. With zero borders,
+    the transform is padded to a size without wrap-around; with circular borders, it has the size of the field. The
+    result is identical (up to rounding) to a :class:`DirectConvolution`. Unlike the other methods, the transforms
+    allocate temporary arrays on each evaluation.
+    """
+    method = "fft"
+    # Set by build_convolution
+    estimated_cost = None
+
+    def __init__(self, kernel, source, out, border_type="zero", key=None):
+        """Creates an FFTConvolution.
+
+        :param kernel: dense kernel array
+        :param source: source buffer
+        :param out: output buffer (same shape as source)
+        :param border_type: "zero" to pad the source with zeros, "circular" to wrap it around
+        :param key: hashable content key of the kernel, under which its spectrum is cached (None to disable caching)
+        """
+        if border_type not in BORDER_TYPES:
+            raise RuntimeError(f"Unsupported border type '{border_type}'")
+        kernel = np.asarray(kernel)
+        ndim = kernel.ndim
+        shape = source.shape[source.ndim - ndim:]
+        padded_shape = _padded_shape(shape, kernel.shape, border_type)
+
+        def compute_spectrum():
+            return _kernel_spectrum(kernel, padded_shape).astype(np.result_type(out.dtype, np.complex64))
+        if key is None:
+            self._spectrum = compute_spectrum()
+        else:
+            self._spectrum = _spectrum_cache.get((key, kernel.shape, padded_shape, border_type, out.dtype.str),
+                                                 compute_spectrum)
+
+        self._kernel = kernel
+        self._border_type = border_type
+        self._source = source
+        self._out = out
+        self._padded_shape = padded_shape
+        self._axes = tuple(range(-ndim, 0))
+        self._crop = (Ellipsis,) + tuple(slice(0, size) for size in shape)
+
+    @property
+    def kernel(self):
+        return self._kernel
+
+    @property
+    def border_type(self):
+        return self._border_type
+
+    def compute(self):
+        """Computes the convolution into the output buffer.
+        """
+        spectrum = np.fft.rfftn(self._source, s=self._padded_shape, axes=self._axes)
+        spectrum *= self._spectrum
+        result = np.fft.irfftn(spectrum, s=self._padded_shape, axes=self._axes)
+        np.copyto(self._out, result[self._crop])
+        return self._out
+
+
+class MatrixConvolution:
+    """Convolution of a small field as a product with a dense matrix that maps the flattened source onto the
+    flattened output.
+
+    The matrix is computed once from a :class:`DirectConvolution` of the unit vectors and shared between all
+    convolutions with the same kernel, field shape and border type. An evaluation is a single matrix product into
+    the output buffer, without temporary arrays, whose cost grows with the square of the number of elements of the
+    field. This makes it the fastest method for small fields, on which the other methods are dominated by the
+    overhead of their NumPy calls. The source and output buffers must be contiguous in their field dimensions.
+    """
+    method = "matrix"
+    # Set by build_convolution
+    estimated_cost = None
+
+    def __init__(self, kernel, source, out, border_type="zero", key=None):
+        """Creates a MatrixConvolution.
+
+        :param kernel: dense kernel array
+        :param source: source buffer
+        :param out: output buffer (same shape as source)
+        :param border_type: "zero" to pad the source with zeros, "circular" to wrap it around
+        :param key: hashable content key of the kernel, under which the matrix is cached (None to disable caching)
+        """
+        if border_type not in BORDER_TYPES:
+            raise RuntimeError(f"Unsupported border type '{border_type}'")
+        kernel = np.asarray(kernel)
+        ndim = kernel.ndim
+        lead = source.ndim - ndim
+        shape = source.shape[lead:]
+        num_elements = int(np.prod(shape))
+
+        def compute_matrix():
+            # Row j holds the response of the convolution to the j-th unit vector
+            units = np.eye(num_elements, dtype=out.dtype).reshape((num_elements,) + shape)
+            responses = np.empty_like(units)
+            DirectConvolution(kernel, units, responses, border_type=border_type).compute()
+            return responses.reshape(num_elements, num_elements)
+        if key is None:
+            self._matrix = compute_matrix()
+        else:
+            self._matrix = _matrix_cache.get((key, kernel.shape, shape, border_type, out.dtype.str), compute_matrix)
+
+        self._kernel = kernel
+        self._border_type = border_type
+        self._out = out
+        self._flat_source = _flat_view(source, lead)
+        self._flat_out = _flat_view(out, lead)
+
+    @property
+    def kernel(self):
+        return self._kernel
+
+    @property
+    def border_type(self):
+        return self._border_type
+
+    def compute(self):
+        """Computes the convolution into the output buffer.
+        """
+        np.matmul(self._flat_source, self._matrix, out=self._flat_out)
+        return self._out
+
+
+def _flat_view(array, lead):
+    # A view of the buffer with flattened field dimensions
+    flat = array.reshape(array.shape[:lead] + (-1,))
+    if not np.may_share_memory(flat, array):
+        raise RuntimeError("A matrix convolution requires buffers that are contiguous in their field dimensions")
+    return flat
+
+
+def _num_kernel_entries(weight_pattern, shape):
+    # Number of non-zero entries of the kernel sampled with the given shape, as far as it follows from the parameters
+    # of the weight pattern (sampled patterns such as Gauss kernels are dense within their ranges)
+    if isinstance(weight_pattern, CustomWeightPattern) and np.shape(weight_pattern.pattern) == tuple(shape):
+        return int(np.count_nonzero(weight_pattern.pattern))
+    if isinstance(weight_pattern, SparseWeightPattern) and weight_pattern.shape == tuple(shape):
+        return weight_pattern.num_non_zeros
+    return int(np.prod(shape))
+
+
+def estimate_costs(weight_pattern, field_shape, border_type="zero", dtype=np.float64):
+    """Estimates the cost of one evaluation of each applicable convolution method for a weight pattern applied to a
+    field.
+
+    The cost model is based on the number of elements of the field, the kernel shape that follows from the kernel
+    ranges (see :func:`computeKernelRange`) and the border type. It is derived from the parameters of the weight
+    pattern, without materializing the kernel. Costs are given in units of a multiply-add over one
+    element; they are meant for comparing the methods, not as absolute timings.
+
+    :param weight_pattern: the kernel
+    :param field_shape: shape of the field to which the kernel is applied (without leading batch axes)
+    :param border_type: "zero" or "circular"
+    :param dtype: dtype of the buffers
+    :return: dict mapping each applicable method to its estimated cost
+    """
+    circular = border_type == "circular"
+    shape = kernel_shape(weight_pattern, field_shape, circular)
+    num_elements = int(np.prod(field_shape))
+
+    # Every non-zero kernel entry is one multiply-add over the field, consisting of two NumPy calls. Circular
+    # borders split the shifted views into up to 2**ndim pieces, which adds call overhead but no work.
+    pieces = 2 ** len(shape) if circular else 1
+    costs = {"direct": _num_kernel_entries(weight_pattern, shape) * (num_elements + 2 * pieces * _CALL_OVERHEAD_COST)}
+
+    factors = weight_pattern.separable_factors(shape, dtype)
+    if factors is not None and len(factors) * len(shape) > 1:
+        costs["separable"] = separable_cost(factors) * (num_elements + 2 * (2 if circular else 1) * _CALL_OVERHEAD_COST)
+
+    num_padded = int(np.prod(_padded_shape(field_shape, shape, border_type)))
+    # A forward and an inverse transform, the product of the spectra and the copy into the output buffer
+    costs["fft"] = 2 * _FFT_COST * num_padded * max(math.log2(num_padded), 1.0) + num_padded + num_elements\
+        + _FFT_OVERHEAD_COST
+
+    if num_elements <= _MATRIX_MAX_ELEMENTS:
+        costs["matrix"] = _MATRIX_COST * num_elements * num_elements + _CALL_OVERHEAD_COST
+    return costs
+
+
+def select_method(weight_pattern, field_shape, border_type="zero", dtype=np.float64, contiguous=True):
+    """Chooses the convolution method with the lowest estimated cost (see :func:`estimate_costs`). The FFT is only
+    chosen for padded transforms of at least a minimum size, since its transforms allocate temporary arrays on every
+    evaluation.
+
+    :param weight_pattern: the kernel
+    :param field_shape: shape of the field to which the kernel is applied (without leading batch axes)
+    :param border_type: "zero" or "circular"
+    :param dtype: dtype of the buffers
+    :param contiguous: whether the buffers are contiguous in their field dimensions (required by "matrix")
+    :return: tuple of the chosen method and the dict of estimated costs of all applicable methods
+    """
+    costs = estimate_costs(weight_pattern, field_shape, border_type, dtype)
+    candidates = dict(costs)
+    shape = kernel_shape(weight_pattern, field_shape, border_type == "circular")
+    if int(np.prod(_padded_shape(field_shape, shape, border_type))) < _FFT_MIN_PADDED_SIZE:
+        del candidates["fft"]
+    if not contiguous:
+        candidates.pop("matrix", None)
+    return min(candidates, key=candidates.get), costs
+
+
+def estimate_resources(weight_pattern, field_shape, method, border_type="zero", dtype=np.float64,
+                       num_batch_elements=1):
+    """Estimates the memory and the floating-point operations of a convolution, without creating it or
+    materializing its kernel.
+
+    :param weight_pattern: the kernel
+    :param field_shape: shape of the field to which the kernel is applied (without leading batch axes)
+    :param method: "direct", "separable", "fft" or "matrix"
+    :param border_type: "zero" or "circular"
+    :param dtype: dtype of the buffers
+    :param num_batch_elements: number of batch elements that are convolved at once
+    :return: dict holding the bytes of the kernel, its factors or its spectrum ("kernel_bytes", shared between
+    convolutions with the same kernel), of the buffers owned by the convolution ("buffer_bytes"), of the temporary
+    arrays allocated by each evaluation ("temporary_bytes"), and the floating-point operations per evaluation
+    ("flops")
+    """
+    itemsize = np.dtype(dtype).itemsize
+    shape = kernel_shape(weight_pattern, field_shape, border_type == "circular")
+    num_elements = int(np.prod(field_shape)) * num_batch_elements
+    buffer_bytes = num_elements * itemsize
+    if method == "separable":
+        factors = weight_pattern.separable_factors(shape, dtype)
+        if factors is None:
+            raise RuntimeError(f"Weight pattern {weight_pattern} is not separable")
+        return {"kernel_bytes": sum(np.size(factor) for component in factors for factor in component) * itemsize,
+                # A scratch buffer and two buffers for the intermediate passes
+                "buffer_bytes": 3 * buffer_bytes,
+                "temporary_bytes": 0,
+                "flops": 2 * separable_cost(factors) * num_elements}
+
+    kernel_bytes = int(np.prod(shape)) * itemsize
+    if method == "matrix":
+        num_field_elements = int(np.prod(field_shape))
+        # The kernel and the matrix; one multiply-add per matrix entry and batch element
+        return {"kernel_bytes": kernel_bytes + num_field_elements * num_field_elements * itemsize,
+                "buffer_bytes": 0,
+                "temporary_bytes": 0,
+                "flops": 2 * num_field_elements * num_elements}
+    if method == "fft":
+        padded_shape = _padded_shape(field_shape, shape, border_type)
+        num_padded = int(np.prod(padded_shape))
+        num_frequencies = num_padded // padded_shape[-1] * (padded_shape[-1] // 2 + 1) if padded_shape else 1
+        spectrum_itemsize = np.result_type(dtype, np.complex64).itemsize
+        # The transforms are computed in double precision: the spectrum of the source and the padded result
+        return {"kernel_bytes": kernel_bytes + num_frequencies * spectrum_itemsize,
+                "buffer_bytes": 0,
+                "temporary_bytes": (num_frequencies * 16 + num_padded * 8) * num_batch_elements,
+                "flops": int((5 * num_padded * max(math.log2(num_padded), 1.0) + 6 * num_frequencies)
+                             * num_batch_elements)}
+    if method != "direct":
+        raise RuntimeError(f"Unsupported convolution method '{method}'")
+    # A scratch buffer; every non-zero kernel entry is a multiply and an add over the field
+    return {"kernel_bytes": kernel_bytes, "buffer_bytes": buffer_bytes, "temporary_bytes": 0,
+            "flops": 2 * _num_kernel_entries(weight_pattern, shape) * num_elements}
+
+
+def build_convolution(weight_pattern, source, out, border_type="zero", method=None):
+    """Creates a convolution of a source buffer with a weight pattern.
+
+    Unless a method is given, the method is chosen by :func:`select_method`. The chosen
+    method is available as the `method` attribute of the returned convolution, its estimated cost per evaluation
+    (for all batch elements) as the `estimated_cost` attribute.
+
+    :param WeightPattern weight_pattern: the kernel
+    :param source: source buffer (the kernel applies to its trailing axes)
+    :param out: output buffer (same shape as source)
+    :param border_type: "zero" to pad the source with zeros, "circular" to wrap it around
+    :param method: "direct", "separable", "fft" or "matrix" to override the automatic choice
+    :return: the convolution
+    """
+    if border_type not in BORDER_TYPES:
+        raise RuntimeError(f"Unsupported border type '{border_type}'")
+    ndim = weight_pattern.dimensionality()
+    field_shape = source.shape[source.ndim - ndim:]
+    shape = kernel_shape(weight_pattern, field_shape, border_type == "circular")
+
+    contiguous = all(np.may_share_memory(buffer.reshape(buffer.shape[:buffer.ndim - ndim] + (-1,)), buffer)
+                     for buffer in (source, out))
+    selected, costs = select_method(weight_pattern, field_shape, border_type, out.dtype, contiguous)
+    if method is None:
+        method = selected
+    elif method not in CONVOLUTION_METHODS:
+        raise RuntimeError(f"Unsupported convolution method '{method}'")
+
+    if method == "separable":
+        factors = weight_pattern.separable_factors(shape, out.dtype)
+        if factors is None:
+            raise RuntimeError(f"Weight pattern {weight_pattern} is not separable")
+        convolution = SeparableConvolution(factors, source, out, border_type)
+    else:
+        kernel = weight_pattern.materialize(shape, out.dtype)
+        if method == "fft":
+            convolution = FFTConvolution(kernel, source, out, border_type, key=weight_pattern.content_key())
+        elif method == "matrix":
+            if "matrix" not in costs:
+                raise RuntimeError(f"Matrix convolutions are limited to fields of at most {_MATRIX_MAX_ELEMENTS} "
+                                   f"elements")
+            convolution = MatrixConvolution(kernel, source, out, border_type, key=weight_pattern.content_key())
+        else:
+            convolution = DirectConvolution(kernel, source, out, border_type=border_type)
+    num_batch_elements = source.size // max(int(np.prod(field_shape)), 1)
+    convolution.estimated_cost = costs.get(method, costs["direct"]) * num_batch_elements
+    return convolution
+
+
+def separable_cost(factors):
+    """Returns the number of shifted multiply-adds per element of a :class:`SeparableConvolution`.
+
+    :param factors: list of components, each a list holding one 1-D factor per kernel dimension
+    """
+    cost = 0
+    for component in factors:
+        cost += sum(np.count_nonzero(factor) for factor in component if np.size(factor) > 1) or 1
+    return cost + len(factors) - 1
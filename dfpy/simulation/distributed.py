@@ -0,0 +1,203 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory, util
+
+import numpy as np
+
+from dfpy.neural_structure import NeuralStructure
+from dfpy.serialization import encode_neural_structure, decode_neural_structure, array_layout
+from dfpy.shared import get_default_neural_structure
+from dfpy.steps.step import float_dtype
+from dfpy.simulation.compiled_steps import compiled_step_type
+from dfpy.simulation.simulator import Simulator
+
+
+def _array_views(memory, descriptions, read_only):
+    views = []
+    for description in descriptions:
+        view = np.ndarray(tuple(description["shape"]), dtype=np.dtype(description["dtype"]), buffer=memory.buf,
+                          offset=description["offset"])
+        if read_only:
+            view.flags.writeable = False
+        views.append(view)
+    return views
+
+
+class _Worker:
+    """State of a worker process: the neural structure (whose large arrays are views of the shared input memory)
+    and the shared result arrays.
+    """
+    def __init__(self, description, input_name, input_descriptions, output_name, output_descriptions,
+                 num_time_steps, steps, simulator_options):
+        self._input_memory = shared_memory.SharedMemory(name=input_name)
+        self._output_memory = shared_memory.SharedMemory(name=output_name)
+        arrays = _array_views(self._input_memory, input_descriptions, read_only=True)
+        self._neural_structure = decode_neural_structure(description, arrays)
+        self._outputs = dict(zip(steps, _array_views(self._output_memory, output_descriptions, read_only=False)))
+        self._num_time_steps = num_time_steps
+        self._simulator_options = simulator_options
+
+    def close(self):
+        """Releases the views of the shared memory and closes it (it is unlinked by the parent process).
+        """
+        self._neural_structure = None
+        self._outputs = {}
+        for memory in (self._input_memory, self._output_memory):
+            try:
+                memory.close()
+            except BufferError:
+                # A view is still referenced (e.g., by a pending exception); the mapping ends with the process
+                pass
+
+    def run(self, index, parameters, seed):
+        ns = self._neural_structure
+        previous_values = []
+        try:
+            for step_name, step_parameters in parameters.items():
+                step = ns.get_step_by_name(step_name)
+                for name, value in step_parameters.items():
+                    previous_values.append((step, name, getattr(step, name)))
+                    setattr(step, name, value)
+            simulator = Simulator(ns, seed=seed, live_tuning=False, **self._simulator_options)
+            simulator.simulate_for(self._num_time_steps)
+            for name, outputs in self._outputs.items():
+                outputs[index, ...] = simulator.get_value(name)
+        finally:
+            # The neural structure is reused for the next run of the worker
+            for step, name, value in reversed(previous_values):
+                setattr(step, name, value)
+        return index
+
+
+_worker = None
+
+
+def _initialize_worker(*args):
+    global _worker
+    _worker = _Worker(*args)
+    # Pool processes exit without running atexit handlers, but run the finalizers of multiprocessing
+    util.Finalize(None, _worker.close, exitpriority=10)
+
+
+def _run(index, parameters, seed):
+    return _worker.run(index, parameters, seed)
+
+
+class DistributedSweep:
+    """Simulates a neural structure for many parameter sets in a pool of processes and streams the results back as
+    the runs finish.
+
+    The neural structure is serialized once (see :func:`encode_neural_structure`). Its large arrays (e.g., the
+    patterns of a CustomInput or TimedCustomInput) are copied into a block of shared memory that all worker processes
+    read from, so that they are neither pickled per run nor copied per process. The final values of the recorded
+    steps are written by the workers into a second block of shared memory, with one entry per run.
+
+    The runs start on construction. Iterating over the sweep (with for or async for) yields (index, values) for each
+    run in the order in which the runs finish, where values maps each step name to a copy of its final value.
+    Close the sweep (or use it as a context manager) to stop the processes and free the shared memory.
+    """
+    def __init__(self, num_time_steps: int, steps: list, parameter_sets: list,
+                 neural_structure: NeuralStructure = None, num_processes: int = None, seed=None,
+                 **simulator_options):
+        """Creates a DistributedSweep and starts the runs.
+
+        :param num_time_steps: number of time steps to simulate per run
+        :param steps: names of the steps whose final values to return
+        :param parameter_sets: one dict per run that maps step names to dicts that map parameter names to values,
+        e.g., [{"Field": {"resting_level": -5.0}}, {"Field": {"resting_level": -4.0}}]
+        :param neural_structure: the neural structure to simulate (defaults to the default neural structure)
+        :param num_processes: number of worker processes (defaults to the number of CPUs)
+        :param seed: seed of the random number generators used for noise (run i uses [seed, i])
+        :param simulator_options: further keyword arguments for :class:`Simulator`
+        """
+        if neural_structure is None:
+            neural_structure = get_default_neural_structure()
+        if "batch_size" in simulator_options or "parameters" in simulator_options:
+            raise RuntimeError("Distributed runs are not batched; use simulate_sweep within a process instead")
+        self._steps = list(steps)
+        self._num_runs = len(parameter_sets)
+        self._input_memory = None
+        self._output_memory = None
+        self._executor = None
+
+        try:
+            description, arrays = encode_neural_structure(neural_structure)
+            input_descriptions, input_size = array_layout(arrays)
+            self._input_memory = shared_memory.SharedMemory(create=True, size=max(input_size, 1))
+            for view, array in zip(_array_views(self._input_memory, input_descriptions, read_only=False), arrays):
+                np.copyto(view, array)
+            view = None
+
+            # The shapes of the results follow from the layouts of the compiled steps (the runs are not batched)
+            outputs = []
+            dtype = simulator_options.get("dtype")
+            for name in self._steps:
+                step = neural_structure.get_step_by_name(name)
+                shape, _ = compiled_step_type(step).layout(step)
+                step_dtype = float_dtype(dtype) if dtype is not None else neural_structure.step_dtype(step)
+                outputs.append(np.empty((self._num_runs,) + shape, dtype=step_dtype))
+            output_descriptions, output_size = array_layout(outputs)
+            self._output_memory = shared_memory.SharedMemory(create=True, size=max(output_size, 1))
+            self._outputs = dict(zip(self._steps, _array_views(self._output_memory, output_descriptions,
+                                                                read_only=True)))
+
+            self._executor = ProcessPoolExecutor(
+                num_processes, initializer=_initialize_worker,
+                initargs=(description, self._input_memory.name, input_descriptions, self._output_memory.name,
+                          output_descriptions, num_time_steps, self._steps, simulator_options))
+            self._futures = [self._executor.submit(_run, index, parameters, None if seed is None else [seed, index])
+                             for index, parameters in enumerate(parameter_sets)]
+        except BaseException:
+            self.close()
+            raise
+
+    @property
+    def num_runs(self):
+        return self._num_runs
+
+    @property
+    def steps(self):
+        return self._steps
+
+    def _values(self, index):
+        return {name: outputs[index].copy() for name, outputs in self._outputs.items()}
+
+    def __iter__(self):
+        for future in as_completed(self._futures):
+            index = future.result()
+            yield index, self._values(index)
+
+    async def __aiter__(self):
+        for future in asyncio.as_completed([asyncio.wrap_future(future) for future in self._futures]):
+            index = await future
+            yield index, self._values(index)
+
+    def results(self):
+        """Waits for all runs to finish and returns their results.
+
+        :return: dict mapping each step name to an array with the final values, with one entry per run
+        """
+        for future in self._futures:
+            future.result()
+        return {name: outputs.copy() for name, outputs in self._outputs.items()}
+
+    def close(self):
+        """Stops the worker processes (cancelling runs that have not started) and frees the shared memory.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        # Views of the shared memory have to be released before it can be closed
+        self._outputs = {}
+        for memory in (self._input_memory, self._output_memory):
+            if memory is not None:
+                memory.close()
+                memory.unlink()
+        self._input_memory = None
+        self._output_memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
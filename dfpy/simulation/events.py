@@ -0,0 +1,68 @@
+import bisect
+
+
+class EventTimeline:
+    """The breakpoints of all stateless steps whose value is piecewise constant in time (see
+    :meth:`CompiledStep.breakpoints`), merged into a single sorted index.
+
+    The timeline keeps a position: :meth:`advance` returns the steps with breakpoints between the previous and the
+    given time by bisecting the index, so that a time step without events costs a single lookup rather than an
+    update of each step.
+    """
+    def __init__(self, compiled_steps: list, time_step_duration: float):
+        """Creates an EventTimeline.
+
+        :param compiled_steps: the compiled steps (those without breakpoints are ignored)
+        :param time_step_duration: duration of a time step
+        """
+        events = []
+        self._compiled_steps = []
+        for compiled in compiled_steps:
+            breakpoints = compiled.breakpoints(time_step_duration)
+            if breakpoints is None:
+                continue
+            self._compiled_steps.append(compiled)
+            events.extend((float(time), len(self._compiled_steps) - 1) for time in breakpoints)
+        events.sort()
+        self._times = [time for time, _ in events]
+        self._steps = [self._compiled_steps[index] for _, index in events]
+        self._position = 0
+
+    @property
+    def compiled_steps(self):
+        """The steps that are only updated at their breakpoints (and when their inputs change).
+        """
+        return self._compiled_steps
+
+    @property
+    def times(self):
+        """The times of all breakpoints, in ascending order.
+        """
+        return self._times
+
+    @property
+    def next_time(self):
+        """Time of the next breakpoint (None if there is none).
+        """
+        return self._times[self._position] if self._position < len(self._times) else None
+
+    def seek(self, time: float):
+        """Moves the position such that the next call of :meth:`advance` returns the breakpoints from the given time
+        on.
+
+        :param time: the time
+        """
+        self._position = bisect.bisect_left(self._times, time)
+
+    def advance(self, time: float):
+        """Returns the steps with breakpoints up to (and including) the given time that were not returned before.
+
+        :param time: the current time
+        :return: list of compiled steps (a step with several breakpoints in between is listed several times)
+        """
+        position = self._position
+        if position == len(self._times) or self._times[position] > time:
+            return []
+        end = bisect.bisect_right(self._times, time, position)
+        self._position = end
+        return self._steps[position:end]
@@ -0,0 +1,64 @@
+import numpy as np
+
+from dfpy.weight_patterns import WeightPattern, GaussWeightPattern, SumWeightPattern, RepeatWeightPattern, \
+    RepeatedValueWeightPattern, CustomWeightPattern, SparseWeightPattern, LowRankWeightPattern, computeKernelRange
+
+
+def kernel_ranges(weight_pattern: WeightPattern, field_shape: tuple, cutoff_factor: float = 4.,
+                  circular: bool = False):
+    """Computes the extent of a kernel to the left and right of its center along each dimension of a field.
+
+    Patterns that were created with a field size carry their own ranges, all others are cut off at
+    cutoff_factor standard deviations.
+
+    :param weight_pattern: the kernel
+    :param field_shape: shape of the field to which the kernel is applied
+    :param cutoff_factor: cutoff in multiples of sigma for patterns without precomputed ranges
+    :param circular: whether the field has circular borders (the kernel may then cover the whole field)
+    :return: list holding an array [left, right] for each dimension
+    """
+    if isinstance(weight_pattern, GaussWeightPattern) or isinstance(weight_pattern, SumWeightPattern):
+        if weight_pattern.ranges() is not None:
+            return [np.array(r, dtype=np.int32) for r in weight_pattern.ranges()]
+    if isinstance(weight_pattern, GaussWeightPattern):
+        return [computeKernelRange(sigma, cutoff_factor, size, circular)
+                for sigma, size in zip(weight_pattern.sigmas, field_shape)]
+    if isinstance(weight_pattern, SumWeightPattern):
+        component_ranges = [kernel_ranges(component, field_shape, cutoff_factor, circular)
+                            for component in weight_pattern.weight_patterns]
+        return [np.max(np.array(ranges), axis=0) for ranges in zip(*component_ranges)]
+    if isinstance(weight_pattern, RepeatWeightPattern):
+        return kernel_ranges(weight_pattern.weight_pattern, field_shape[:-1], cutoff_factor, circular) \
+               + [np.array([0, 0], dtype=np.int32)]
+    if isinstance(weight_pattern, (RepeatedValueWeightPattern, CustomWeightPattern, SparseWeightPattern,
+                                   LowRankWeightPattern)):
+        shape = np.shape(weight_pattern.pattern) if isinstance(weight_pattern, CustomWeightPattern)\
+            else weight_pattern.shape
+        return [np.array([(size - 1) // 2, size // 2], dtype=np.int32) for size in shape]
+    raise RuntimeError(f"Unsupported weight pattern: {weight_pattern}")
+
+
+def sample_kernel(weight_pattern: WeightPattern, field_shape: tuple, dtype=np.float64, circular: bool = False):
+    """Materializes a weight pattern into a dense kernel array that is centered on the field's grid.
+
+    A :class:`RepeatWeightPattern` is sampled with extent one along its repeated (last) dimension, i.e., the inner
+    kernel is applied to each slice along that dimension independently.
+
+    :param weight_pattern: the kernel
+    :param field_shape: shape of the field to which the kernel is applied
+    :param dtype: dtype of the returned array
+    :param circular: whether the field has circular borders
+    :return: the dense kernel (read-only, shared through the kernel cache)
+    """
+    return weight_pattern.materialize(kernel_shape(weight_pattern, field_shape, circular), dtype)
+
+
+def kernel_shape(weight_pattern: WeightPattern, field_shape: tuple, circular: bool = False):
+    """Computes the shape of the dense kernel that a weight pattern is sampled into for a field.
+
+    :param weight_pattern: the kernel
+    :param field_shape: shape of the field to which the kernel is applied
+    :param circular: whether the field has circular borders
+    :return: shape of the kernel
+    """
+    return tuple(int(r[0] + r[1] + 1) for r in kernel_ranges(weight_pattern, field_shape, circular=circular))
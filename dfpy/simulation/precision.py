@@ -0,0 +1,71 @@
+import numpy as np
+
+from dfpy.neural_structure import NeuralStructure
+from dfpy.shared import get_default_neural_structure
+from dfpy.simulation.simulator import Simulator
+
+
+def precision_report(num_time_steps: int, neural_structure: NeuralStructure = None, steps: list = None, dtype=None,
+                     every: int = 1, seed=0, **simulator_options):
+    """Measures how far a simulation in reduced precision deviates from a simulation in float64.
+
+    The neural structure is simulated twice in lockstep: with its dtype policy (or with the given dtype), and with
+    all steps in float64. Every n-th time step, the values of the steps are compared. Noise is drawn with the same
+    seed, but the random number generators produce different numbers for float32 than for float64, so noisy steps
+    deviate by the noise itself; compare noise-free structures to measure the rounding error alone.
+
+    :param num_time_steps: number of time steps to simulate
+    :param neural_structure: the neural structure (defaults to the default neural structure)
+    :param steps: names of the steps to compare (defaults to all steps)
+    :param dtype: dtype of all steps in the reduced-precision simulation (None to use the dtype policy of the
+    neural structure, see :meth:`NeuralStructure.step_dtype`)
+    :param every: compare every n-th time step
+    :param seed: seed of the random number generators used for noise
+    :param simulator_options: further keyword arguments for :class:`Simulator`
+    :return: dict mapping each step name to a dict holding the dtype of the step ("dtype"), the largest absolute
+    deviation ("max_abs_error"), the root mean square deviation ("rms_error"), the largest absolute deviation relative
+    to the largest absolute value of the reference ("max_relative_error"), and the largest number of elements whose
+    value had a different sign than in the reference at a compared time step ("max_sign_mismatches", e.g., positions
+    that are above the output threshold of a field in only one of the simulations)
+    """
+    if neural_structure is None:
+        neural_structure = get_default_neural_structure()
+    simulator_options["live_tuning"] = False
+    simulator = Simulator(neural_structure, seed=seed, dtype=dtype, **simulator_options)
+    reference = Simulator(neural_structure, seed=seed, dtype=np.float64, **simulator_options)
+    names = steps if steps is not None else [step.name for step in neural_structure.steps]
+
+    max_abs_errors = dict.fromkeys(names, 0.0)
+    squared_errors = dict.fromkeys(names, 0.0)
+    max_reference_values = dict.fromkeys(names, 0.0)
+    max_sign_mismatches = dict.fromkeys(names, 0)
+    num_elements = dict.fromkeys(names, 0)
+    for time_step in range(1, num_time_steps + 1):
+        simulator.simulate_time_step()
+        reference.simulate_time_step()
+        if time_step % every != 0:
+            continue
+        for name in names:
+            reference_value = reference.get_value(name)
+            value = simulator.get_value(name).astype(np.float64)
+            error = np.abs(value - reference_value)
+            max_abs_errors[name] = max(max_abs_errors[name], float(np.max(error, initial=0.0)))
+            squared_errors[name] += float(np.sum(error * error))
+            num_elements[name] += error.size
+            max_reference_values[name] = max(max_reference_values[name],
+                                             float(np.max(np.abs(reference_value), initial=0.0)))
+            mismatches = int(np.count_nonzero(np.broadcast_to(value > 0, error.shape)
+                                              != np.broadcast_to(reference_value > 0, error.shape)))
+            max_sign_mismatches[name] = max(max_sign_mismatches[name], mismatches)
+
+    report = {}
+    for name in names:
+        max_reference_value = max_reference_values[name]
+        report[name] = {
+            "dtype": simulator.get_compiled_step(name).dtype,
+            "max_abs_error": max_abs_errors[name],
+            "rms_error": float(np.sqrt(squared_errors[name] / num_elements[name])) if num_elements[name] else 0.0,
+            "max_relative_error": max_abs_errors[name] / max_reference_value if max_reference_value > 0 else 0.0,
+            "max_sign_mismatches": max_sign_mismatches[name],
+        }
+    return report
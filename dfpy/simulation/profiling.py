@@ -0,0 +1,196 @@
+import json
+import threading
+import time
+import tracemalloc
+
+
+class ProfileEntry:
+    """Measurements of a compiled step or connection, accumulated over all calls since profiling started.
+    """
+    def __init__(self, name, kind: str):
+        """Creates a ProfileEntry.
+
+        :param name: name of the step, or (input step name, output step name) for a connection
+        :param kind: "step" or "connection"
+        """
+        self.name = name
+        self.kind = kind
+        self.calls = 0
+        # Wall time spent in the step or connection itself (calls of connections from within a step are excluded)
+        self.seconds = 0.0
+        self.allocated_bytes = 0
+
+
+class Profiler:
+    """Measures the wall time and the number of calls of each compiled step and connection of a simulation, and
+    optionally the memory they allocate (see :meth:`Simulator.profile`).
+
+    The profiler replaces the methods that do the work on every time step (update and integrate of the steps, write
+    and accumulate of the connections) by timed wrappers on the compiled objects themselves. The simulation loop is
+    not changed, so that a simulation without a profiler runs exactly as before, and the wrappers are removed again
+    by :meth:`detach`. Steps are keyed by their name, connections by the names of their input and output step.
+
+    Memory is measured with tracemalloc (which traces NumPy allocations as well): for each call, the peak of the
+    traced memory above the level at its start. This slows down the simulation considerably, and with several threads,
+    allocations of concurrent calls are attributed to each of them.
+    """
+    def __init__(self, track_allocations: bool = False, trace: bool = False, max_trace_events: int = 1000000):
+        """Creates a Profiler.
+
+        :param track_allocations: whether to measure the memory allocated by each call
+        :param trace: whether to keep one event per call for :meth:`write_chrome_trace`
+        :param max_trace_events: maximum number of events that are kept (later calls are only counted)
+        """
+        self._track_allocations = track_allocations
+        self._trace = trace
+        self._max_trace_events = max_trace_events
+        self._entries = {}
+        self._events = []
+        self._thread_ids = {}
+        self._local = threading.local()
+        # Wrapped objects, keyed by id, with the names of the wrapped methods
+        self._wrapped = {}
+        self._start_time = time.perf_counter()
+        self._started_tracemalloc = False
+        if track_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    @property
+    def entries(self):
+        """The measurements, keyed by (kind, name).
+        """
+        return self._entries
+
+    @property
+    def events(self):
+        """The recorded calls in Chrome trace event format (if tracing is enabled).
+        """
+        return self._events
+
+    def attach(self, compiled_steps: list):
+        """Wraps the steps and their incoming connections that are not wrapped yet.
+
+        :param compiled_steps: the compiled steps of the simulation
+        """
+        for compiled in compiled_steps:
+            def step_name(compiled=compiled):
+                return compiled.name
+            if compiled.stateful:
+                self._wrap(compiled, ("integrate",), "step", step_name)
+            elif not compiled.static:
+                self._wrap(compiled, ("update",), "step", step_name)
+            for connection in compiled.input_connections:
+                def connection_name(connection=connection, compiled=compiled):
+                    return connection.source.name, compiled.name
+                self._wrap(connection, ("write", "accumulate"), "connection", connection_name)
+
+    def detach(self):
+        """Restores the methods of all wrapped objects and stops tracing memory allocations.
+        """
+        for wrapped, method_names in self._wrapped.values():
+            for method_name in method_names:
+                del wrapped.__dict__[method_name]
+        self._wrapped = {}
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _wrap(self, wrapped, method_names, kind, name):
+        if id(wrapped) in self._wrapped:
+            return
+        for method_name in method_names:
+            setattr(wrapped, method_name, self._timed(getattr(wrapped, method_name), method_name, kind, name))
+        self._wrapped[id(wrapped)] = (wrapped, method_names)
+
+    def _timed(self, method, method_name, kind, name):
+        def timed(*args):
+            # Each thread keeps a stack with the time spent in nested calls of the calls in progress
+            stack = getattr(self._local, "stack", None)
+            if stack is None:
+                stack = self._local.stack = []
+            stack.append(0.0)
+            if self._track_allocations:
+                memory_before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+            start = time.perf_counter()
+            result = method(*args)
+            end = time.perf_counter()
+            allocated_bytes = max(tracemalloc.get_traced_memory()[1] - memory_before, 0) \
+                if self._track_allocations else 0
+
+            duration = end - start
+            nested_seconds = stack.pop()
+            if stack:
+                stack[-1] += duration
+            key = (kind, name())
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = ProfileEntry(key[1], kind)
+            entry.calls += 1
+            entry.seconds += duration - nested_seconds
+            entry.allocated_bytes += allocated_bytes
+            if self._trace and len(self._events) < self._max_trace_events:
+                self._add_event(key, method_name, start, duration, allocated_bytes)
+            return result
+        return timed
+
+    def _add_event(self, key, method_name, start, duration, allocated_bytes):
+        thread_id = self._thread_ids.setdefault(threading.get_ident(), len(self._thread_ids))
+        kind, name = key
+        event = {"name": name if kind == "step" else f"{name[0]} -> {name[1]}", "cat": f"{kind}.{method_name}",
+                 "ph": "X", "ts": (start - self._start_time) * 1e6, "dur": duration * 1e6, "pid": 0,
+                 "tid": thread_id}
+        if self._track_allocations:
+            event["args"] = {"allocated_bytes": allocated_bytes}
+        self._events.append(event)
+
+    def reset(self):
+        """Discards all measurements.
+        """
+        self._entries = {}
+        self._events = []
+        self._start_time = time.perf_counter()
+
+    def report(self, top: int = None):
+        """Returns the measurements, ranked by wall time.
+
+        :param top: number of entries to return (None for all)
+        :return: list of dicts holding the name ("name"), the kind ("kind"), the number of calls ("calls"), the wall
+        time in seconds ("seconds", and per call "seconds_per_call"), its share of the total measured wall time
+        ("fraction"), and the memory allocated over all calls ("allocated_bytes")
+        """
+        entries = sorted(self._entries.values(), key=lambda entry: entry.seconds, reverse=True)
+        total_seconds = sum(entry.seconds for entry in entries)
+        report = [{
+            "name": entry.name,
+            "kind": entry.kind,
+            "calls": entry.calls,
+            "seconds": entry.seconds,
+            "seconds_per_call": entry.seconds / entry.calls if entry.calls else 0.0,
+            "fraction": entry.seconds / total_seconds if total_seconds > 0 else 0.0,
+            "allocated_bytes": entry.allocated_bytes,
+        } for entry in entries]
+        return report if top is None else report[:top]
+
+    def format_report(self, top: int = 20):
+        """Returns the ranked measurements (see :meth:`report`) as a table.
+
+        :param top: number of entries to list (None for all)
+        """
+        lines = [f"{'name':<40} {'kind':<10} {'calls':>8} {'total ms':>10} {'us/call':>10} {'share':>7} "
+                 f"{'allocated':>12}"]
+        for entry in self.report(top):
+            name = entry["name"] if entry["kind"] == "step" else f"{entry['name'][0]} -> {entry['name'][1]}"
+            lines.append(f"{name:<40} {entry['kind']:<10} {entry['calls']:>8} {entry['seconds'] * 1e3:>10.2f} "
+                         f"{entry['seconds_per_call'] * 1e6:>10.1f} {entry['fraction']:>7.1%} "
+                         f"{entry['allocated_bytes']:>12}")
+        return "\n".join(lines)
+
+    def write_chrome_trace(self, filename: str):
+        """Writes the recorded calls to a JSON file that can be opened in chrome://tracing or Perfetto.
+
+        :param filename: name of the file
+        """
+        with open(filename, "w") as file:
+            json.dump({"traceEvents": self._events, "displayTimeUnit": "ms"}, file)
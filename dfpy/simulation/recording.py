@@ -0,0 +1,285 @@
+import numpy as np
+
+from dfpy.simulation.activation import compile_activation_function
+
+REDUCTIONS = (None, "max", "argmax", "output_sum")
+
+
+class MemorySink:
+    """Keeps all recorded frames in memory.
+    """
+    def __init__(self):
+        self._frames = []
+        self._time_steps = []
+
+    def append(self, time_step, frame):
+        """Appends a frame.
+
+        :param int time_step: time step at which the frame was recorded
+        :param frame: the frame (copied by the sink)
+        """
+        self._frames.append(frame.copy())
+        self._time_steps.append(time_step)
+
+    def time_steps(self):
+        return np.array(self._time_steps, dtype=np.int64)
+
+    def data(self):
+        """Returns the recorded frames, stacked along a leading time axis.
+        """
+        return np.stack(self._frames) if self._frames else np.zeros((0,))
+
+    def clear(self):
+        self._frames = []
+        self._time_steps = []
+
+
+class RingBufferSink:
+    """Keeps the most recent frames in a preallocated buffer, overwriting the oldest ones.
+    """
+    def __init__(self, capacity: int):
+        """Creates a RingBufferSink.
+
+        :param capacity: maximum number of frames that are kept
+        """
+        self._capacity = capacity
+        self._buffer = None
+        self._time_steps = np.zeros(capacity, dtype=np.int64)
+        self._num_frames = 0
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def append(self, time_step, frame):
+        if self._buffer is None:
+            self._buffer = np.zeros((self._capacity,) + frame.shape, dtype=frame.dtype)
+        position = self._num_frames % self._capacity
+        self._buffer[position] = frame
+        self._time_steps[position] = time_step
+        self._num_frames += 1
+
+    def _order(self):
+        if self._num_frames <= self._capacity:
+            return np.arange(self._num_frames)
+        return (np.arange(self._capacity) + self._num_frames) % self._capacity
+
+    def time_steps(self):
+        return self._time_steps[self._order()]
+
+    def data(self):
+        """Returns the kept frames in chronological order, stacked along a leading time axis.
+        """
+        if self._buffer is None:
+            return np.zeros((0,))
+        return self._buffer[self._order()]
+
+    def clear(self):
+        self._num_frames = 0
+
+
+class NpyFileSink:
+    """Appends frames to a .npy file on disk, so that the recording only needs memory for a single frame.
+
+    The header of the file is rewritten on every :meth:`flush` (and on :meth:`close`), after which the file can be
+    read with np.load (e.g., with mmap_mode="r" while the simulation is still running).
+    """
+    # Space reserved for the header, so that it can be rewritten in place when the number of frames grows
+    _max_shape_digits = 20
+
+    def __init__(self, filename: str):
+        """Creates a NpyFileSink.
+
+        :param filename: name of the file (an existing file is overwritten)
+        """
+        self._filename = filename
+        self._file = open(filename, "wb")
+        self._frame_shape = None
+        self._dtype = None
+        self._header_size = None
+        self._time_steps = []
+
+    @property
+    def filename(self):
+        return self._filename
+
+    def _header(self, num_frames):
+        shape = (num_frames,) + self._frame_shape
+        header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (self._dtype.str, shape)
+        if self._header_size is None:
+            reserved = len(header) + self._max_shape_digits
+            # Magic string, version and header length take 10 bytes; the data starts at a multiple of 64 bytes
+            self._header_size = -(-(10 + reserved + 1) // 64) * 64
+        header = header.ljust(self._header_size - 10 - 1) + "\n"
+        return b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode("latin1")
+
+    def append(self, time_step, frame):
+        if self._frame_shape is None:
+            self._frame_shape = frame.shape
+            self._dtype = frame.dtype
+            self._file.write(self._header(0))
+        self._file.write(np.ascontiguousarray(frame, dtype=self._dtype).tobytes())
+        self._time_steps.append(time_step)
+
+    def time_steps(self):
+        return np.array(self._time_steps, dtype=np.int64)
+
+    def flush(self):
+        """Updates the header to the current number of frames and flushes the file.
+        """
+        if self._frame_shape is None or self._file.closed:
+            return
+        position = self._file.tell()
+        self._file.seek(0)
+        self._file.write(self._header(len(self._time_steps)))
+        self._file.seek(position)
+        self._file.flush()
+
+    def data(self):
+        """Returns the recorded frames as a read-only memory map of the file.
+        """
+        self.flush()
+        if self._frame_shape is None:
+            return np.zeros((0,))
+        return np.load(self._filename, mmap_mode="r")
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def clear(self):
+        raise RuntimeError("A NpyFileSink cannot be cleared")
+
+
+class Recorder:
+    """Records the activation of a step over time.
+
+    Each recorded frame is the value of the step (the activation for fields and nodes), optionally restricted to a
+    region of interest and reduced to a few numbers. Frames are passed on to a sink that determines how much memory
+    the recording takes: all frames in memory (default), the most recent frames (:class:`RingBufferSink`), or all
+    frames on disk (:class:`NpyFileSink`).
+
+    Recorders are created with :meth:`Simulator.record`.
+    """
+    def __init__(self, compiled_step, every: int = 1, roi: tuple = None, reduction: str = None, dtype=None,
+                 sink=None):
+        """Creates a Recorder.
+
+        :param CompiledStep compiled_step: the compiled step whose value to record
+        :param every: record every n-th time step
+        :param roi: region of interest: a tuple holding a slice or an index for each (leading) dimension of the step
+        :param reduction: None to record the (region of interest of the) value, "max" to record its maximum,
+        "argmax" to record the position of its maximum (indices along each dimension of the step), or "output_sum"
+        to record the sum of the output (the value passed through the step's activation function)
+        :param dtype: dtype in which frames are stored (e.g., np.float16; defaults to the dtype of the simulation).
+        Positions recorded by "argmax" are always stored as integers.
+        :param sink: the sink that receives the frames (defaults to a :class:`MemorySink`)
+        """
+        if reduction not in REDUCTIONS:
+            raise RuntimeError(f"Unknown reduction '{reduction}', must be one of {REDUCTIONS}")
+        if every < 1:
+            raise RuntimeError("Recorders can only record every n-th time step for n >= 1")
+
+        self._every = int(every)
+        self._roi = tuple(roi) if roi is not None else ()
+        self._reduction = reduction
+        self._requested_dtype = dtype
+        self._sink = sink if sink is not None else MemorySink()
+        self.bind(compiled_step)
+
+    def bind(self, compiled_step):
+        """Makes the recorder read from the buffers of a (newly) compiled step.
+
+        :param CompiledStep compiled_step: the compiled step whose value to record
+        """
+        self._compiled_step = compiled_step
+        roi = self._roi
+        value = compiled_step.value
+        lead = value.ndim - len(compiled_step.shape)
+        if len(roi) > len(compiled_step.shape):
+            raise RuntimeError(f"The region of interest has more entries than {compiled_step.name} has dimensions")
+        self._view = value[(slice(None),) * lead + roi]
+        self._axes = tuple(range(lead, self._view.ndim))
+
+        self._activation_function = None
+        if self._reduction == "output_sum":
+            self._activation_function = compile_activation_function(
+                getattr(compiled_step.step, "activation_function", None))
+            self._scratch = np.empty(self._view.shape, dtype=value.dtype)
+        if self._reduction == "argmax":
+            # Maps positions in the region of interest to indices along the dimensions of the step
+            self._indices = [np.arange(size)[roi[axis] if axis < len(roi) else slice(None)]
+                             for axis, size in enumerate(compiled_step.shape)]
+            self._indices = [indices for indices in self._indices if np.ndim(indices) == 1]
+            self._dtype = np.dtype(np.int64)
+        else:
+            self._dtype = np.dtype(self._requested_dtype) if self._requested_dtype is not None else value.dtype
+
+        self._frame = np.zeros(self._frame_shape(), dtype=self._dtype)
+
+    def _frame_shape(self):
+        batch_shape = self._view.shape[:len(self._view.shape) - len(self._axes)]
+        if self._reduction is None:
+            return self._view.shape
+        if self._reduction == "argmax":
+            return batch_shape + (len(self._axes),)
+        return batch_shape
+
+    @property
+    def compiled_step(self):
+        return self._compiled_step
+
+    @property
+    def step_name(self):
+        return self._compiled_step.name
+
+    @property
+    def every(self):
+        return self._every
+
+    @property
+    def reduction(self):
+        return self._reduction
+
+    @property
+    def sink(self):
+        return self._sink
+
+    def record(self, time_step: int):
+        """Records the current value of the step if the time step is one of the recorded ones.
+
+        :param time_step: the current time step
+        """
+        if time_step % self._every != 0:
+            return
+        view = self._view
+        frame = self._frame
+        if self._reduction is None:
+            np.copyto(frame, view, casting="unsafe")
+        elif self._reduction == "max":
+            frame[...] = view.max(axis=self._axes) if self._axes else view
+        elif self._reduction == "output_sum":
+            self._activation_function(view, self._scratch)
+            frame[...] = self._scratch.sum(axis=self._axes) if self._axes else self._scratch
+        else:
+            if self._axes:
+                batch_shape = frame.shape[:-1]
+                positions = view.reshape(batch_shape + (-1,)).argmax(axis=-1)
+                for axis, index in enumerate(np.unravel_index(positions, view.shape[len(batch_shape):])):
+                    frame[..., axis] = self._indices[axis][index]
+        self._sink.append(time_step, frame)
+
+    def time_steps(self):
+        """Returns the time steps at which the (kept) frames were recorded.
+        """
+        return self._sink.time_steps()
+
+    def data(self):
+        """Returns the recorded (kept) frames, stacked along a leading time axis.
+        """
+        return self._sink.data()
+
+    def clear(self):
+        """Discards all recorded frames.
+        """
+        self._sink.clear()
@@ -0,0 +1,231 @@
+import numpy as np
+
+from dfpy.activation_function import Identity
+from dfpy.connection import SynapticConnection
+from dfpy.neural_structure import NeuralStructure
+from dfpy.shared import get_default_neural_structure
+from dfpy.steps import Field, Node, NodeArray, NoiseInput
+from dfpy.steps.step import float_dtype
+from dfpy.weight_patterns import WeightPattern, CustomWeightPattern, SparseWeightPattern, LowRankWeightPattern
+from dfpy.simulation.activation import compile_activation_function
+from dfpy.simulation.compiled_steps import compiled_step_type, _random_dtype
+from dfpy.simulation.convolution import select_method, estimate_resources
+
+# Floating-point operations per element of a time step of a field or node: the rate (resting level, input,
+# interaction, time scale), the Euler step, and the sigmoid (scaling, tanh, shift)
+_DYNAMICS_FLOPS = 10
+# Floating-point operations per element of an activation function
+_ACTIVATION_FLOPS = 4
+
+
+def _convolution_resources(weight_pattern, field_shape, dtype, num_batch_elements, border_type, method):
+    if method is None:
+        method, _ = select_method(weight_pattern, field_shape, border_type, dtype)
+    resources = estimate_resources(weight_pattern, field_shape, method, border_type, dtype, num_batch_elements)
+    resources["method"] = method
+    return resources
+
+
+class _StepLayout:
+    # Shape, dtype and batch axis of the value of a step, as the simulator would allocate it
+    def __init__(self, step, dtype, batch_size, parameters):
+        self.step = step
+        self.shape, self.batched = compiled_step_type(step).layout(step, batch_size, parameters.get(step.name))
+        self.dtype = dtype
+        self.batch_shape = (batch_size,) if self.batched else ()
+        self.size = int(np.prod(self.batch_shape + self.shape))
+        self.num_batch_elements = batch_size if self.batched else 1
+
+
+def _step_resources(layout, num_input_connections, border_type, convolution_method, adaptive_tolerance):
+    step = layout.step
+    itemsize = layout.dtype.itemsize
+    value_bytes = layout.size * itemsize
+    report = {"type": type(step).__name__, "shape": layout.shape, "dtype": layout.dtype, "batched": layout.batched,
+              "state_bytes": value_bytes, "output_bytes": 0, "buffer_bytes": 0, "kernel_bytes": 0,
+              "temporary_bytes": 0, "flops_per_time_step": 0, "convolution_method": None}
+    if num_input_connections > 0:
+        # Buffer in which connections weight their output (allocated if any connection needs it)
+        report["buffer_bytes"] += value_bytes
+
+    if isinstance(step, (Field, Node, NodeArray)):
+        # The value, the rate and the noise of the current Euler step (and the previous rate for adaptive steps)
+        report["state_bytes"] += value_bytes + layout.size * _random_dtype(layout.dtype).itemsize
+        if adaptive_tolerance is not None:
+            report["state_bytes"] += value_bytes
+        report["output_bytes"] = value_bytes
+        # The input sum and a scalar per batch element
+        report["buffer_bytes"] += value_bytes + layout.num_batch_elements * itemsize
+        flops = _DYNAMICS_FLOPS * layout.size
+        if np.any(np.asarray(step.noise_strength) != 0):
+            flops += 2 * layout.size
+        if isinstance(step, NodeArray):
+            # The self-excitation
+            report["buffer_bytes"] += value_bytes
+            if np.any(step.self_excitation != 0):
+                flops += 2 * layout.size
+        if isinstance(step, Field):
+            # The lateral interaction
+            report["buffer_bytes"] += value_bytes
+            if step.interaction_kernel is not None:
+                convolution = _convolution_resources(step.interaction_kernel, layout.shape, layout.dtype,
+                                                     layout.num_batch_elements, border_type, convolution_method)
+                report["kernel_bytes"] += convolution["kernel_bytes"]
+                report["buffer_bytes"] += convolution["buffer_bytes"]
+                report["temporary_bytes"] += convolution["temporary_bytes"]
+                report["convolution_method"] = convolution["method"]
+                flops += convolution["flops"] + layout.size
+            if np.any(np.asarray(step.global_inhibition) != 0):
+                flops += 2 * layout.size
+        report["flops_per_time_step"] = flops
+    elif isinstance(step, NoiseInput):
+        if _random_dtype(layout.dtype) != layout.dtype:
+            report["buffer_bytes"] += layout.size * _random_dtype(layout.dtype).itemsize
+        report["flops_per_time_step"] = 2 * layout.size
+    return report
+
+
+def _pattern_size(weight_pattern, shape):
+    if isinstance(weight_pattern, CustomWeightPattern):
+        return int(np.size(weight_pattern.pattern))
+    return int(np.prod(getattr(weight_pattern, "shape", shape)))
+
+
+def _connection_resources(connection, source, target, border_type, convolution_method):
+    dtype = target.dtype
+    itemsize = dtype.itemsize
+    lead_shape = source.batch_shape
+    num_batch_elements = source.num_batch_elements
+    size = source.size
+    report = {"input_step": connection.input_step.name, "output_step": connection.output_step.name,
+              "intermediate_bytes": 0, "weight_bytes": 0, "kernel_bytes": 0, "temporary_bytes": 0,
+              "flops_per_time_step": 0, "convolution_method": None}
+
+    # Activation function (computed once by fields and nodes for all connections with the same function)
+    activation_function = connection.activation_function if isinstance(connection, SynapticConnection) else None
+    if activation_function is not None and not isinstance(activation_function, Identity):
+        key = compile_activation_function(activation_function).key
+        shared = isinstance(source.step, (Field, Node, NodeArray)) \
+            and compile_activation_function(source.step.activation_function).key == key
+        if not shared:
+            report["intermediate_bytes"] += size * itemsize
+            report["flops_per_time_step"] += _ACTIVATION_FLOPS * size
+
+    # Kernel
+    kernel_weights = connection.kernel_weights
+    if isinstance(kernel_weights, WeightPattern):
+        convolution = _convolution_resources(kernel_weights, source.shape, dtype, num_batch_elements, border_type,
+                                             convolution_method)
+        report["intermediate_bytes"] += size * itemsize + convolution["buffer_bytes"]
+        report["kernel_bytes"] += convolution["kernel_bytes"]
+        report["temporary_bytes"] += convolution["temporary_bytes"]
+        report["convolution_method"] = convolution["method"]
+        report["flops_per_time_step"] += convolution["flops"]
+
+    # Projection: contraction, expansion and weights
+    pointwise_weights = getattr(connection, "pointwise_weights", None)
+    contract_dimensions = tuple(d % len(source.shape) for d in connection.contract_dimensions or ())
+    expand_dimensions = tuple(connection.expand_dimensions or ())
+    kept_shape = tuple(axis_size for axis, axis_size in enumerate(source.shape) if axis not in contract_dimensions)
+    target_size = int(np.prod(lead_shape + target.shape))
+    is_mapping = bool(contract_dimensions) and bool(expand_dimensions) \
+        and isinstance(pointwise_weights, WeightPattern) \
+        and pointwise_weights.dimensionality() == len(source.shape) + len(expand_dimensions)
+    if is_mapping:
+        report["intermediate_bytes"] += target_size * itemsize
+        joint_size = int(np.prod(source.shape)) * int(np.prod([target.shape[d] for d in expand_dimensions]))
+        if isinstance(pointwise_weights, SparseWeightPattern):
+            num_non_zeros = pointwise_weights.num_non_zeros
+            # Weights and source indices per non-zero entry, and their products per batch element
+            report["weight_bytes"] += num_non_zeros * (itemsize + 8)
+            report["intermediate_bytes"] += num_non_zeros * num_batch_elements * itemsize
+            report["flops_per_time_step"] += 2 * num_non_zeros * num_batch_elements
+        elif isinstance(pointwise_weights, LowRankWeightPattern) and not kept_shape:
+            rank = pointwise_weights.rank
+            report["weight_bytes"] += (pointwise_weights.u.size + pointwise_weights.v.size) * itemsize
+            report["intermediate_bytes"] += rank * num_batch_elements * itemsize
+            report["flops_per_time_step"] += 2 * rank * (size + target_size)
+        else:
+            report["weight_bytes"] += joint_size * itemsize
+            report["flops_per_time_step"] += 2 * joint_size * num_batch_elements
+    elif contract_dimensions:
+        # A single weighted sum over the contracted dimensions
+        report["intermediate_bytes"] += int(np.prod(lead_shape + kept_shape)) * itemsize
+        report["flops_per_time_step"] += 2 * size
+        if isinstance(pointwise_weights, WeightPattern) and not expand_dimensions:
+            report["weight_bytes"] += _pattern_size(pointwise_weights, source.shape) * itemsize
+            report["flops_per_time_step"] += size
+    elif isinstance(pointwise_weights, WeightPattern):
+        report["weight_bytes"] += _pattern_size(pointwise_weights, source.shape) * itemsize
+        if not expand_dimensions:
+            report["intermediate_bytes"] += size * itemsize
+            report["flops_per_time_step"] += size
+    if expand_dimensions and not is_mapping and isinstance(pointwise_weights, WeightPattern):
+        report["weight_bytes"] += _pattern_size(pointwise_weights, target.shape) * itemsize
+
+    # Weighting and adding the output to the input of the output step
+    report["flops_per_time_step"] += 2 * target.size
+    return report
+
+
+def resource_report(neural_structure: NeuralStructure = None, **simulator_options):
+    """Estimates the memory and the computation that simulating a neural structure takes, without compiling or
+    simulating it.
+
+    The estimate walks the steps and their incoming connections, and derives the buffers that the
+    :class:`Simulator` would allocate from the shapes of the steps: the state and output of each step, the kernels
+    of lateral interactions and connections (whose extent follows from the kernel ranges, see
+    :func:`kernel_ranges`), the convolution method that would be chosen, and the intermediate results of the
+    projections (activation, convolution, contraction, expansion and weights). Floating-point operations are
+    counted per time step, assuming every step is updated on every time step. Some buffers are allocated only if
+    needed, and kernels with the same content are shared; the estimate counts them anyway, so it errs on the high
+    side.
+
+    :param neural_structure: the neural structure (defaults to the default neural structure)
+    :param simulator_options: keyword arguments for :class:`Simulator` that affect the resources (dtype,
+    batch_size, parameters, border_type, convolution_method and adaptive_tolerance); others are ignored
+    :return: dict holding a report per step ("steps", keyed by step name), a report per connection ("connections",
+    a list), the bytes of all buffers that are allocated for the whole simulation ("total_bytes"), that plus the
+    largest temporary allocation of a single step or connection ("peak_bytes"), and the floating-point operations
+    per time step ("flops_per_time_step"). A step report holds the type, shape, dtype and whether the step is
+    batched, and the bytes of its state ("state_bytes"), output ("output_bytes"), working buffers
+    ("buffer_bytes"), kernel ("kernel_bytes") and temporary allocations per time step ("temporary_bytes"), its
+    floating-point operations per time step ("flops_per_time_step") and the method of its lateral interaction
+    ("convolution_method"). A connection report holds the names of its input and output step, and the bytes of
+    its intermediate results ("intermediate_bytes"), weights ("weight_bytes"), kernel ("kernel_bytes") and
+    temporary allocations ("temporary_bytes"), its floating-point operations per time step and the method of its
+    kernel convolution.
+    """
+    if neural_structure is None:
+        neural_structure = get_default_neural_structure()
+    dtype = simulator_options.get("dtype")
+    batch_size = simulator_options.get("batch_size")
+    parameters = simulator_options.get("parameters") or {}
+    border_type = simulator_options.get("border_type", "zero")
+    convolution_method = simulator_options.get("convolution_method")
+    adaptive_tolerance = simulator_options.get("adaptive_tolerance")
+
+    layouts = [_StepLayout(step, float_dtype(dtype) if dtype is not None else neural_structure.step_dtype(step),
+                           batch_size, parameters)
+               for step in neural_structure.steps]
+    steps = {}
+    connections = []
+    for layout, input_connections in zip(layouts, neural_structure.connections_into_steps):
+        steps[layout.step.name] = _step_resources(layout, len(input_connections), border_type, convolution_method,
+                                                  adaptive_tolerance)
+        for connection in input_connections:
+            connections.append(_connection_resources(connection, layouts[connection.input_step_index], layout,
+                                                     border_type, convolution_method))
+
+    step_bytes = sum(report["state_bytes"] + report["output_bytes"] + report["buffer_bytes"] + report["kernel_bytes"]
+                     for report in steps.values())
+    connection_bytes = sum(report["intermediate_bytes"] + report["weight_bytes"] + report["kernel_bytes"]
+                           for report in connections)
+    temporary_bytes = max([report["temporary_bytes"] for report in list(steps.values()) + connections], default=0)
+    return {
+        "steps": steps,
+        "connections": connections,
+        "total_bytes": step_bytes + connection_bytes,
+        "peak_bytes": step_bytes + connection_bytes + temporary_bytes,
+        "flops_per_time_step": sum(report["flops_per_time_step"] for report in list(steps.values()) + connections),
+    }
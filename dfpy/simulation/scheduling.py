@@ -0,0 +1,88 @@
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def partition_by_cost(items: list, costs: list, num_groups: int):
+    """Partitions items into groups with about the same total cost (longest processing time first: every item is
+    added to the group with the lowest total so far, starting with the most expensive item).
+
+    :param items: the items
+    :param costs: the cost of each item
+    :param num_groups: maximum number of groups
+    :return: list of non-empty groups, each a list of items in their original order
+    """
+    num_groups = max(min(num_groups, len(items)), 1)
+    heap = [(0.0, group_index) for group_index in range(num_groups)]
+    indices = [[] for _ in range(num_groups)]
+    for item_index in sorted(range(len(items)), key=lambda index: -costs[index]):
+        total, group_index = heapq.heappop(heap)
+        indices[group_index].append(item_index)
+        heapq.heappush(heap, (total + costs[item_index], group_index))
+    return [[items[index] for index in sorted(group)] for group in indices if group]
+
+
+class ThreadedSchedule:
+    """Updates groups of stateful steps in parallel on a thread pool.
+
+    Within a time step, the stateful steps only depend on each other through the values of the previous time step:
+    all of them first accumulate their inputs (reading the values of other steps into their input buffers), and only
+    then advance their state. The input buffers thus act as the second buffer of a double-buffered state, and each
+    phase can be split between threads without locking. The work inside each phase is done by NumPy, which releases
+    the GIL in its array operations, so the threads run on separate cores.
+
+    The steps are partitioned into one group per thread with about the same estimated cost (see
+    :func:`partition_by_cost`). The calling thread processes the first group itself.
+    """
+    def __init__(self, num_threads: int = None):
+        """Creates a ThreadedSchedule.
+
+        :param num_threads: number of threads (None for the number of CPUs)
+        """
+        self._num_threads = num_threads if num_threads is not None else os.cpu_count() or 1
+        if self._num_threads < 1:
+            raise RuntimeError("The number of threads must be at least one")
+        self._executor = ThreadPoolExecutor(max_workers=self._num_threads - 1) if self._num_threads > 1 else None
+        self._groups = []
+
+    @property
+    def num_threads(self):
+        return self._num_threads
+
+    @property
+    def groups(self):
+        """The groups of compiled steps, one per thread.
+        """
+        return self._groups
+
+    def update(self, stateful_steps: list):
+        """Partitions the stateful steps into groups for the threads.
+
+        :param stateful_steps: the compiled stateful steps
+        """
+        costs = [compiled.estimated_cost + sum(connection.estimated_cost for connection in compiled.input_connections)
+                 for compiled in stateful_steps]
+        self._groups = partition_by_cost(stateful_steps, costs, self._num_threads)
+
+    def run(self, function):
+        """Calls a function for each group and waits until all calls have returned.
+
+        :param function: function that takes a list of compiled steps
+        """
+        if len(self._groups) <= 1 or self._executor is None:
+            for group in self._groups:
+                function(group)
+            return
+        futures = [self._executor.submit(function, group) for group in self._groups[1:]]
+        try:
+            function(self._groups[0])
+        finally:
+            for future in futures:
+                # Re-raises exceptions of the other threads
+                future.result()
+
+    def shutdown(self):
+        """Stops the threads.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
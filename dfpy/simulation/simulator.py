@@ -0,0 +1,503 @@
+import weakref
+from collections import deque
+
+import numpy as np
+
+import dfpy.config
+from dfpy.neural_structure import NeuralStructure
+from dfpy.shared import get_default_neural_structure
+from dfpy.steps.step import float_dtype
+from dfpy.simulation.compiled_steps import compile_step
+from dfpy.simulation.compiled_connections import CompiledConnection
+from dfpy.simulation.events import EventTimeline
+from dfpy.simulation.profiling import Profiler
+from dfpy.simulation.recording import Recorder
+from dfpy.simulation.scheduling import ThreadedSchedule
+
+
+class Simulator:
+    """Simulates a neural structure on the CPU with NumPy, using the Euler method.
+
+    On construction, the neural structure is compiled into a fixed schedule: every step and connection gets a
+    runtime counterpart that owns preallocated buffers, and the stateless steps are ordered topologically. A time
+    step then consists of three phases that only write into these buffers:
+
+    1. the stateless steps (inputs, boosts) compute their values for the current time; steps whose value is piecewise
+       constant in time (timed boosts, timed gates, timed custom inputs given as keyframes) are only updated at their
+       breakpoints, which are looked up in an :class:`EventTimeline` of the whole structure, and when their inputs
+       change,
+    2. the stateful steps (fields, nodes) that start an Euler step accumulate the outputs of their incoming
+       connections,
+    3. the stateful steps advance their state (see :class:`CompiledDynamics` for Euler steps that span several time
+       steps).
+
+    Since all stateful steps read their inputs before any of them is updated, the result does not depend on the
+    order in which the steps were added to the neural structure.
+
+    With live tuning, the simulator observes the neural structure and its steps, and brings the compiled schedule up
+    to date when a parameter is changed or a step or connection is added: parameters that are read on every time step
+    need no action, a changed kernel is materialized again, and only a step whose buffers change shape (e.g., a
+    resized field) is compiled again, together with its connections. If the changed step no longer fits its
+    connections (e.g., a field was resized, but a step it is connected to was not yet), the simulator keeps the
+    previous compilation and tries again on the next change and before the next time step, which raises the error if
+    the structure is still inconsistent. Without live tuning, changes to the neural structure after construction are
+    not picked up; create a new simulator instead.
+
+    With several threads, the stateful steps are split into groups of about the same estimated cost, and the
+    groups accumulate their inputs and advance their state in parallel (see :class:`ThreadedSchedule`). Each
+    stateful step then draws its noise from its own random number generator (derived from the seed and the position
+    of the step in the neural structure), so that the result does not depend on the number of threads. It differs
+    from the result of a single-threaded simulation with the same seed if any step is noisy.
+    """
+    def __init__(self, neural_structure: NeuralStructure = None, time_step_duration: float = 10.0, seed=None,
+                 border_type: str = "zero", convolution_method: str = None, batch_size: int = None,
+                 parameters: dict = None, prefetch_frames: int = 0, live_tuning: bool = None,
+                 num_threads: int = 1, dtype=None, multi_rate: float = None, adaptive_tolerance: float = None,
+                 quiescence_tolerance: float = None):
+        """Creates a Simulator.
+
+        :param neural_structure: the neural structure to simulate (defaults to the default neural structure)
+        :param time_step_duration: duration of a time step (in the same unit as the time scales of the steps)
+        :param seed: seed of the random number generator used for noise
+        :param border_type: border type of all convolutions ("zero" or "circular")
+        :param convolution_method: "direct", "separable", "fft" or "matrix" to use the same method for all convolutions
+        (by default, the method is chosen per convolution based on a cost model)
+        :param batch_size: if given, the structure is simulated batch_size times at once, in a single array per step
+        with a leading batch axis. Without parameters, the batch elements only differ in their noise.
+        :param parameters: dict mapping step names to dicts that map parameter names to arrays holding one value per
+        batch element (e.g., {"Field": {"resting_level": [-5.0, -4.0]}}). See the batch_parameter_names of the
+        compiled step types for the parameters that can be varied.
+        :param prefetch_frames: number of frames of each TimedCustomInput that are read ahead in a background thread
+        :param live_tuning: whether to pick up changes to the neural structure (defaults to
+        dfpy.config.enable_live_tuning)
+        :param num_threads: number of threads that update the stateful steps (None for the number of CPUs)
+        :param dtype: if given, the state of all steps is stored in this dtype; otherwise, each step uses the dtype
+        given by the neural structure (see :meth:`NeuralStructure.step_dtype`)
+        :param multi_rate: if given, fields and nodes take Euler steps that span several time steps, up to this
+        fraction of their time scale (see :class:`CompiledDynamics`)
+        :param adaptive_tolerance: if given, fields and nodes adapt the duration of their Euler steps such that the
+        estimated local error stays below this tolerance (in units of the activation)
+        :param quiescence_tolerance: if given, fields and nodes whose inputs do not change and whose value changes by
+        at most this much per time step skip their updates until an input changes (see :class:`CompiledDynamics`)
+        """
+        if neural_structure is None:
+            neural_structure = get_default_neural_structure()
+
+        self._neural_structure = neural_structure
+        self._time_step_duration = float(time_step_duration)
+        self._seed = seed
+        self._dtype = None if dtype is None else float_dtype(dtype)
+        self._options = {"border_type": border_type, "convolution_method": convolution_method,
+                         "batch_size": batch_size, "prefetch_frames": prefetch_frames, "multi_rate": multi_rate,
+                         "adaptive_tolerance": adaptive_tolerance, "quiescence_tolerance": quiescence_tolerance}
+        self._batch_size = batch_size
+        self._parameters = parameters if parameters is not None else {}
+        self._recorders = {}
+        self._live_tuning = dfpy.config.enable_live_tuning if live_tuning is None else live_tuning
+        self._schedule = None
+        self._profiler = None
+        self._time_step = 0
+        # Indices of changed steps that could not be compiled again yet (see _handle_step_changed)
+        self._stale_steps = set()
+        if num_threads != 1:
+            self._schedule = ThreadedSchedule(num_threads)
+            weakref.finalize(self, self._schedule.shutdown)
+
+        self._compile()
+        self.reset()
+        if self._live_tuning:
+            self._observe()
+
+    def _compile(self):
+        ns = self._neural_structure
+        unknown_steps = set(self._parameters) - set(step.name for step in ns.steps)
+        if unknown_steps:
+            raise RuntimeError(f"Parameters were given for unknown steps: {sorted(unknown_steps)}")
+        self._compiled_steps = [self._compile_step(step) for step in ns.steps]
+        self._compiled_steps_by_name = {compiled.name: compiled for compiled in self._compiled_steps}
+
+        for output_step_index, connections in enumerate(ns.connections_into_steps):
+            target = self._compiled_steps[output_step_index]
+            for connection in connections:
+                target.input_connections.append(self._compile_connection(connection, target))
+
+        self._update_schedule()
+
+    def _compile_step(self, step):
+        dtype = self._dtype if self._dtype is not None else self._neural_structure.step_dtype(step)
+        return compile_step(step, dtype, parameters=self._parameters.get(step.name), **self._options)
+
+    def _compile_connection(self, connection, target):
+        source = self._compiled_steps[connection.input_step_index]
+        return CompiledConnection(connection, source, target, target.dtype, **self._options)
+
+    def _update_schedule(self):
+        self._stateless_steps = self._topological_order(
+            [compiled for compiled in self._compiled_steps if not compiled.stateful])
+        self._dynamic_stateless_steps = [compiled for compiled in self._stateless_steps if not compiled.static]
+        self._stateful_steps = [compiled for compiled in self._compiled_steps if compiled.stateful]
+        if self._schedule is not None:
+            self._schedule.update(self._stateful_steps)
+        self._timeline = EventTimeline(self._dynamic_stateless_steps, self._time_step_duration)
+        self._timeline.seek(self.time)
+        self._event_driven_steps = {id(compiled) for compiled in self._timeline.compiled_steps}
+        # Steps may have been compiled again or changed, so all of them are evaluated on the next time step
+        self._pending_steps = set(self._event_driven_steps)
+        if self._profiler is not None:
+            self._profiler.attach(self._compiled_steps)
+
+    def _observe(self):
+        # The observers only hold a weak reference, so that they do not keep discarded simulators alive
+        reference = weakref.ref(self)
+
+        def observer(handler):
+            def notify(*args):
+                simulator = reference()
+                if simulator is not None:
+                    handler(simulator, *args)
+            return notify
+
+        ns = self._neural_structure
+        ns.register_add_step_observer(observer(Simulator._handle_step_added))
+        ns.register_add_connection_observer(observer(Simulator._handle_connection_added))
+        self._step_observer = observer
+        for step in ns.steps:
+            self._observe_step(step)
+
+    def _observe_step(self, step):
+        # Parameter setters notify with (step, parameter name), the name setter without arguments
+        step.register_observer(self._step_observer(
+            lambda simulator, *args: simulator._handle_step_changed(step, args[1] if len(args) > 1 else "name")))
+
+    def _handle_step_changed(self, step, changed_param):
+        if changed_param == "name":
+            self._compiled_steps_by_name = {compiled.name: compiled for compiled in self._compiled_steps}
+            return
+        index = self._neural_structure.get_step_index(step)
+        compiled = self._compiled_steps[index]
+        if compiled.handle_parameter_change(changed_param):
+            # Steps that read from the step have to notice the change, even if they are quiescent
+            compiled.version += 1
+            if not compiled.stateful and not compiled.static:
+                # The breakpoints of the step may have changed
+                self._update_schedule()
+        else:
+            # The error of a change that leaves the step incompatible with its connections is deferred, since a
+            # following change (e.g., resizing the connected step as well) may resolve it
+            self._stale_steps.add(index)
+            try:
+                self._recompile_stale_steps()
+            except RuntimeError:
+                pass
+
+    def _recompile_stale_steps(self):
+        # Raises if the stale steps still do not fit their connections; they then stay stale
+        self._recompile_steps(sorted(self._stale_steps))
+        self._stale_steps.clear()
+
+    def _recompile_steps(self, indices):
+        # The new compiled steps, keyed by the id of the previous ones, and the previous ones, keyed by the new ones
+        replaced = {}
+        previous_steps = {}
+        compiled_steps = list(self._compiled_steps)
+        for index in indices:
+            previous = compiled_steps[index]
+            compiled = self._compile_step(previous.step)
+            compiled_steps[index] = compiled
+            replaced[id(previous)] = compiled
+            previous_steps[id(compiled)] = previous
+
+        # The connections into and out of the steps refer to their buffers. All of them are compiled before anything
+        # is replaced, so that the schedule stays intact if a changed step no longer fits its connections.
+        input_connections = {}
+        for target in compiled_steps:
+            is_new = id(target) in previous_steps
+            connections = previous_steps[id(target)].input_connections if is_new else target.input_connections
+            if is_new or any(id(connection.source) in replaced for connection in connections):
+                input_connections[id(target)] = [
+                    CompiledConnection(connection.connection, compiled_steps[connection.connection.input_step_index],
+                                       target, target.dtype, **self._options)
+                    if is_new or id(connection.source) in replaced else connection
+                    for connection in connections]
+
+        self._compiled_steps = compiled_steps
+        for target in compiled_steps:
+            if id(target) in input_connections:
+                target.input_connections = input_connections[id(target)]
+        for compiled in replaced.values():
+            self._compiled_steps_by_name[compiled.name] = compiled
+            compiled.reset(self._rng)
+        self._update_schedule()
+
+        for recorder in self._recorders.values():
+            compiled = replaced.get(id(recorder.compiled_step))
+            if compiled is not None:
+                recorder.bind(compiled)
+
+    def _handle_step_added(self, step):
+        compiled = self._compile_step(step)
+        self._compiled_steps.append(compiled)
+        self._compiled_steps_by_name[compiled.name] = compiled
+        compiled.reset(self._rng)
+        self._update_schedule()
+        self._observe_step(step)
+
+    def _handle_connection_added(self, connection):
+        target = self._compiled_steps[self._neural_structure.get_step_index(connection.output_step)]
+        target.input_connections.append(self._compile_connection(connection, target))
+        if not target.stateful:
+            self._update_schedule()
+        elif self._profiler is not None:
+            self._profiler.attach([target])
+
+    @staticmethod
+    def _topological_order(compiled_steps):
+        # Stateless steps may read from other stateless steps within the same time step, so they have to be
+        # evaluated after their inputs (Kahn's algorithm). Inputs from stateful steps refer to the previous state.
+        members = {id(compiled) for compiled in compiled_steps}
+        num_pending_inputs = {}
+        consumers = {id(compiled): [] for compiled in compiled_steps}
+        for compiled in compiled_steps:
+            sources = [connection.source for connection in compiled.input_connections
+                       if id(connection.source) in members]
+            num_pending_inputs[id(compiled)] = len(sources)
+            for source in sources:
+                consumers[id(source)].append(compiled)
+
+        queue = deque(compiled for compiled in compiled_steps if num_pending_inputs[id(compiled)] == 0)
+        order = []
+        while queue:
+            compiled = queue.popleft()
+            order.append(compiled)
+            for consumer in consumers[id(compiled)]:
+                num_pending_inputs[id(consumer)] -= 1
+                if num_pending_inputs[id(consumer)] == 0:
+                    queue.append(consumer)
+
+        if len(order) != len(compiled_steps):
+            cyclic = [compiled.name for compiled in compiled_steps if num_pending_inputs[id(compiled)] > 0]
+            raise RuntimeError(f"The neural structure contains a cycle of stateless steps: {cyclic}")
+        return order
+
+    def reset(self):
+        """Resets the simulation time, the random number generator and the state of all steps.
+        """
+        self._time_step = 0
+        self._rng = np.random.default_rng(self._seed)
+        self._seed_sequence = np.random.SeedSequence(self._seed)
+        self._step_rngs = {}
+        for compiled in self._stateless_steps:
+            compiled.reset(self._rng)
+        for compiled in self._stateful_steps:
+            compiled.reset(self._rng)
+        self._timeline.seek(self.time)
+        self._pending_steps = set(self._event_driven_steps)
+
+    @property
+    def neural_structure(self):
+        return self._neural_structure
+
+    @property
+    def batch_size(self):
+        """Number of batch elements (None for an unbatched simulation).
+        """
+        return self._batch_size
+
+    @property
+    def time_step_duration(self):
+        return self._time_step_duration
+
+    @property
+    def time_step(self):
+        """Number of time steps simulated since the last reset.
+        """
+        return self._time_step
+
+    @property
+    def time(self):
+        """Simulation time since the last reset.
+        """
+        return self._time_step * self._time_step_duration
+
+    @property
+    def dtype(self):
+        """The dtype of all steps if the simulator overrides the dtype policy of the neural structure, None
+        otherwise.
+        """
+        return self._dtype
+
+    @property
+    def num_threads(self):
+        return self._schedule.num_threads if self._schedule is not None else 1
+
+    @property
+    def skipped_updates(self):
+        """Number of time steps since the last reset on which each field and node was quiescent, keyed by step name
+        (see the quiescence_tolerance of the simulator).
+        """
+        return {compiled.name: compiled.skipped_updates for compiled in self._stateful_steps}
+
+    @property
+    def compiled_steps(self):
+        return self._compiled_steps
+
+    @property
+    def convolution_methods(self):
+        """The convolution method chosen for each convolution: keyed by step name for the lateral interactions of
+        fields, and by (input step name, output step name) for connections with kernel weights.
+        """
+        methods = {}
+        for compiled in self._compiled_steps:
+            if getattr(compiled, "convolution", None) is not None:
+                methods[compiled.name] = compiled.convolution.method
+            for connection in compiled.input_connections:
+                if connection.convolution is not None:
+                    methods[(connection.source.name, compiled.name)] = connection.convolution.method
+        return methods
+
+    def get_compiled_step(self, step):
+        """Returns the compiled counterpart of a step.
+
+        :param step: the step or its name
+        :return CompiledStep: the compiled step
+        """
+        name = step if type(step) == str else step.name
+        return self._compiled_steps_by_name[name]
+
+    def get_value(self, step):
+        """Returns the current value of a step (the activation for fields and nodes).
+
+        The returned array is the live buffer of the simulation; copy it if it needs to be kept. In a batched
+        simulation, it has a leading batch axis unless the step is identical across the batch.
+
+        :param step: the step or its name
+        :return: the value of the step
+        """
+        return self.get_compiled_step(step).value
+
+    @property
+    def recorders(self):
+        """The recorders of the simulation, keyed by name (see :meth:`record`).
+        """
+        return self._recorders
+
+    def record(self, step, name: str = None, every: int = 1, roi: tuple = None, reduction: str = None, dtype=None,
+               sink=None):
+        """Starts recording the value of a step after every (n-th) time step. See :class:`Recorder` for the options.
+
+        :param step: the step or its name
+        :param name: name of the recorder (defaults to the name of the step)
+        :param every: record every n-th time step
+        :param roi: region of interest: a tuple holding a slice or an index for each (leading) dimension of the step
+        :param reduction: None, "max", "argmax" or "output_sum"
+        :param dtype: dtype in which frames are stored (e.g., np.float16)
+        :param sink: the sink that receives the frames (defaults to keeping all frames in memory)
+        :return Recorder: the recorder
+        """
+        step = self._neural_structure.get_step_by_name(step) if type(step) == str else step
+        name = name if name is not None else step.name
+        if name in self._recorders:
+            raise RuntimeError(f"There already is a recorder named {name}")
+        recorder = Recorder(self.get_compiled_step(step), every, roi, reduction, dtype, sink)
+        self._recorders[name] = recorder
+        return recorder
+
+    @property
+    def profiler(self):
+        """The active profiler (None if the simulation is not profiled).
+        """
+        return self._profiler
+
+    def profile(self, track_allocations: bool = False, trace: bool = False):
+        """Starts measuring the wall time and number of calls of each step and connection (see :class:`Profiler`).
+        Without a profiler, the simulation runs without any instrumentation.
+
+        :param track_allocations: whether to measure the memory allocated by each step and connection (slow)
+        :param trace: whether to keep every call for a Chrome trace (see :meth:`Profiler.write_chrome_trace`)
+        :return Profiler: the profiler
+        """
+        self.stop_profiling()
+        self._profiler = Profiler(track_allocations, trace)
+        self._profiler.attach(self._compiled_steps)
+        return self._profiler
+
+    def stop_profiling(self):
+        """Stops profiling and removes the instrumentation.
+
+        :return Profiler: the profiler, which keeps its measurements (None if the simulation was not profiled)
+        """
+        profiler = self._profiler
+        if profiler is not None:
+            profiler.detach()
+            self._profiler = None
+        return profiler
+
+    def simulate_time_step(self):
+        """Simulates a single time step.
+        """
+        if self._stale_steps:
+            self._recompile_stale_steps()
+        time = self.time
+        dt = self._time_step_duration
+        rng = self._rng
+
+        pending_steps = self._pending_steps
+        for compiled in self._timeline.advance(time):
+            pending_steps.add(id(compiled))
+        for compiled in self._dynamic_stateless_steps:
+            if id(compiled) in self._event_driven_steps:
+                changed = compiled.inputs_changed() if compiled.input_connections else False
+                if not changed and id(compiled) not in pending_steps:
+                    continue
+            compiled.update(time, dt, rng)
+        if pending_steps:
+            pending_steps.clear()
+        if self._schedule is None:
+            for compiled in self._stateful_steps:
+                if compiled.due:
+                    compiled.accumulate_inputs()
+            for compiled in self._stateful_steps:
+                compiled.integrate(dt, rng)
+        else:
+            self._schedule.run(self._accumulate_inputs)
+            self._schedule.run(self._integrate)
+
+        self._time_step += 1
+        for recorder in self._recorders.values():
+            recorder.record(self._time_step)
+
+    @staticmethod
+    def _accumulate_inputs(compiled_steps):
+        for compiled in compiled_steps:
+            if compiled.due:
+                compiled.accumulate_inputs()
+
+    def _integrate(self, compiled_steps):
+        dt = self._time_step_duration
+        for compiled in compiled_steps:
+            compiled.integrate(dt, self._step_rng(compiled))
+
+    def _step_rng(self, compiled):
+        rng = self._step_rngs.get(id(compiled.step))
+        if rng is None:
+            # Every step gets its own stream, which only depends on the seed and the position of the step
+            index = self._compiled_steps.index(compiled)
+            rng = np.random.default_rng(np.random.SeedSequence(self._seed_sequence.entropy, spawn_key=(index,)))
+            self._step_rngs[id(compiled.step)] = rng
+        return rng
+
+    def simulate_for(self, num_time_steps: int):
+        """Simulates a given number of time steps.
+
+        :param num_time_steps: number of time steps to simulate
+        """
+        for _ in range(num_time_steps):
+            self.simulate_time_step()
+
+    def simulate_until(self, time: float):
+        """Simulates until the simulation time reaches the given time.
+
+        :param time: the time until which to simulate
+        """
+        while self.time < time:
+            self.simulate_time_step()
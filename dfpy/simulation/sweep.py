@@ -0,0 +1,56 @@
+import numpy as np
+
+from dfpy.neural_structure import NeuralStructure
+from dfpy.shared import get_default_neural_structure
+from dfpy.simulation.simulator import Simulator
+
+
+def simulate_sweep(num_time_steps: int, steps: list, parameters: dict = None, batch_size: int = None,
+                   neural_structure: NeuralStructure = None, max_batch_size: int = 64, seed=None,
+                   **simulator_options):
+    """Simulates a neural structure for many parameter sets (or noise realizations) and returns the final values of
+    the given steps.
+
+    The parameter sets are simulated in batches of at most max_batch_size elements (see the batch_size option of
+    :class:`Simulator`), so that the Python overhead per time step does not grow with the number of parameter sets
+    while the memory stays bounded.
+
+    :param num_time_steps: number of time steps to simulate
+    :param steps: names of the steps whose final values to return
+    :param parameters: dict mapping step names to dicts that map parameter names to arrays holding one value per
+    parameter set, e.g., {"Field": {"resting_level": np.linspace(-6, -3, 100)}}
+    :param batch_size: number of parameter sets if no parameters are given (i.e., number of noise realizations)
+    :param neural_structure: the neural structure to simulate (defaults to the default neural structure)
+    :param max_batch_size: maximum number of parameter sets that are simulated at once
+    :param seed: seed of the random number generators used for noise
+    :param simulator_options: further keyword arguments for :class:`Simulator`
+    :return: dict mapping each step name to an array with the final values, with one entry per parameter set
+    """
+    if neural_structure is None:
+        neural_structure = get_default_neural_structure()
+    parameters = parameters if parameters is not None else {}
+
+    lengths = set(len(values) for step_parameters in parameters.values() for values in step_parameters.values())
+    if batch_size is not None:
+        lengths.add(batch_size)
+    if len(lengths) != 1:
+        raise RuntimeError("All parameter arrays must have the same length, and either parameters or a batch size "
+                           "must be given")
+    num_sets = lengths.pop()
+
+    results = {name: [] for name in steps}
+    for chunk_index, start in enumerate(range(0, num_sets, max_batch_size)):
+        stop = min(start + max_batch_size, num_sets)
+        chunk_parameters = {step_name: {name: np.asarray(values)[start:stop] for name, values in step_parameters.items()}
+                            for step_name, step_parameters in parameters.items()}
+        chunk_seed = None if seed is None else [seed, chunk_index]
+        simulator = Simulator(neural_structure, seed=chunk_seed, batch_size=stop - start, parameters=chunk_parameters,
+                              **simulator_options)
+        simulator.simulate_for(num_time_steps)
+        for name in steps:
+            compiled = simulator.get_compiled_step(name)
+            value = compiled.value if compiled.batched\
+                else np.broadcast_to(compiled.value, (stop - start,) + compiled.value.shape)
+            results[name].append(value.copy())
+
+    return {name: np.concatenate(values) for name, values in results.items()}
@@ -1,6 +1,7 @@
 from dfpy.steps.step import Step
 from dfpy.steps.field import Field
 from dfpy.steps.node import Node
+from dfpy.steps.node_array import NodeArray
 from dfpy.steps.timed_boost import TimedBoost
 from dfpy.steps.timed_gate import TimedGate
 from dfpy.steps.boost import Boost
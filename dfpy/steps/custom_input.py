@@ -13,7 +13,10 @@ class CustomInput(Input):
         """
 
         super().__init__(static=True, name=name)
-        self._pattern = np.array(pattern)
+        # Memory-mapped and read-only patterns (e.g., of a loaded neural structure or in shared memory) are not
+        # copied into memory
+        shared = isinstance(pattern, np.memmap) or (isinstance(pattern, np.ndarray) and not pattern.flags.writeable)
+        self._pattern = pattern if shared else np.array(pattern)
         self._dimensions = dimensions
 
         self._post_constructor()
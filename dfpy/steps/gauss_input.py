@@ -78,10 +78,11 @@ class GaussInput(Input):
         self._notify_observers("sigmas")
 
     def domain(self):
-        return [[dimension.lower, dimension.upper] for dimension in self._dimensions]
+        # A new list of [lower, upper] pairs, as before the domain was cached
+        return [list(bounds) for bounds in self._cached_domain()]
 
     def shape(self):
-        return tuple([dimension.size for dimension in self._dimensions])
+        return self._cached_shape()
 
     def dimensionality(self):
         return len(self._dimensions)
@@ -0,0 +1,166 @@
+import numpy as np
+
+from dfpy.dimension import Dimension
+from dfpy.steps.step import Step
+from dfpy.activation_function import Sigmoid
+
+
+class NodeArray(Step):
+    """Computes the neural node dynamics of a population of nodes at once.
+
+    The nodes share an activation function, but each has its own resting level, time scale, self-excitation and
+    noise strength. These are stored as arrays with one element per node instead of one :class:`Node` per node, so a
+    population of thousands of nodes costs a few arrays rather than thousands of steps, and is simulated as one
+    vectorized update. The population is a step with one dimension (one element per node); single nodes are
+    addressed by their index, or by their name if node names are given.
+    """
+
+    def __init__(self, size: int = None, resting_level=-5.0, time_scale=100, self_excitation=0.0,
+                 activation_function=Sigmoid(100.0),
+                 noise_strength=0.2,
+                 node_names: list = None,
+                 name="Neural Node Array"):
+        """Creates a population of neural nodes.
+
+        :param int size: number of nodes (None to take it from the node names or the parameter arrays)
+        :param resting_level: resting level of the nodes (a scalar, or an array with one value per node)
+        :param time_scale: time scale of the nodes (parameter tau in the node dynamics; scalar or array)
+        :param self_excitation: self-excitation of the nodes (scalar or array)
+        :param activation_function: activation function of all nodes
+        :param noise_strength: amplitude of Gauss white noise (scalar or array)
+        :param list node_names: names of the nodes (optional)
+        :param string name: name of the step
+        """
+
+        super().__init__(name=name)
+
+        if size is None:
+            if node_names is not None:
+                size = len(node_names)
+            else:
+                sizes = [np.size(parameter) for parameter in (resting_level, time_scale, self_excitation,
+                                                              noise_strength) if np.ndim(parameter) > 0]
+                if not sizes:
+                    raise RuntimeError(f"The size of {self._name} can only be omitted if node names or arrays of "
+                                       f"parameters are given")
+                size = sizes[0]
+        size = int(size)
+        if node_names is not None and len(node_names) != size:
+            raise RuntimeError(f"{self._name} has {size} nodes, but {len(node_names)} node names were given")
+
+        self._size = size
+        self._dimensions = [Dimension.from_size(size)]
+        self._resting_level = self._column(resting_level, "resting_level")
+        self._time_scale = self._column(time_scale, "time_scale")
+        self._self_excitation = self._column(self_excitation, "self_excitation")
+        self._activation_function = activation_function
+        self._noise_strength = self._column(noise_strength, "noise_strength")
+        self._node_names = list(node_names) if node_names is not None else None
+        # Maps node names to indices (built on first use)
+        self._node_indices = None
+
+        self._post_constructor()
+
+    def _column(self, values, name):
+        # One float per node (a copy, so that the step owns its parameters)
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim > 1 or values.ndim == 1 and values.shape[0] != self._size:
+            raise RuntimeError(f"Parameter '{name}' of {self._name} must be a scalar or hold one value per node "
+                               f"({self._size}), not an array of shape {values.shape}")
+        return np.array(np.broadcast_to(values, (self._size,)))
+
+    @property
+    def size(self):
+        """Number of nodes.
+        """
+        return self._size
+
+    @property
+    def dimensions(self):
+        return self._dimensions
+
+    @property
+    def node_names(self):
+        return self._node_names
+
+    def node_index(self, node_name: str):
+        """Returns the index of a node.
+
+        :param node_name: name of the node
+        """
+        if self._node_names is None:
+            raise RuntimeError(f"The nodes of {self._name} have no names")
+        if self._node_indices is None:
+            self._node_indices = {node_name: index for index, node_name in enumerate(self._node_names)}
+        index = self._node_indices.get(node_name)
+        if index is None:
+            raise RuntimeError(f"{self._name} has no node named '{node_name}'")
+        return index
+
+    def set_node_parameters(self, nodes, **parameters):
+        """Changes parameters of some of the nodes, e.g., set_node_parameters([0, 3], resting_level=-2.0).
+
+        :param nodes: index, name, or list of indices or names of the nodes (or an index array or boolean mask)
+        :param parameters: new values of the parameters (resting_level, time_scale, self_excitation and
+        noise_strength), each a scalar or one value per selected node
+        """
+        if type(nodes) == str:
+            nodes = self.node_index(nodes)
+        elif type(nodes) == list and any(type(node) == str for node in nodes):
+            nodes = [self.node_index(node) if type(node) == str else node for node in nodes]
+        for name, values in parameters.items():
+            if name not in ("resting_level", "time_scale", "self_excitation", "noise_strength"):
+                raise RuntimeError(f"{self._name} has no per-node parameter '{name}'")
+            getattr(self, "_" + name)[nodes] = values
+            self._notify_observers(name)
+
+    @property
+    def resting_level(self):
+        return self._resting_level
+
+    @resting_level.setter
+    def resting_level(self, resting_level):
+        self._resting_level = self._column(resting_level, "resting_level")
+        self._notify_observers("resting_level")
+
+    @property
+    def time_scale(self):
+        return self._time_scale
+
+    @time_scale.setter
+    def time_scale(self, time_scale):
+        self._time_scale = self._column(time_scale, "time_scale")
+        self._notify_observers("time_scale")
+
+    @property
+    def activation_function(self):
+        return self._activation_function
+
+    @activation_function.setter
+    def activation_function(self, activation_function):
+        self._activation_function = activation_function
+        self._notify_observers("activation_function")
+
+    @property
+    def self_excitation(self):
+        return self._self_excitation
+
+    @self_excitation.setter
+    def self_excitation(self, self_excitation):
+        self._self_excitation = self._column(self_excitation, "self_excitation")
+        self._notify_observers("self_excitation")
+
+    @property
+    def noise_strength(self):
+        return self._noise_strength
+
+    @noise_strength.setter
+    def noise_strength(self, noise_strength):
+        self._noise_strength = self._column(noise_strength, "noise_strength")
+        self._notify_observers("noise_strength")
+
+    def shape(self):
+        return (self._size,)
+
+    def dimensionality(self):
+        return 1
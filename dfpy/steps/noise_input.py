@@ -1,3 +1,4 @@
+from dfpy.dimension import dimensions_from_sizes
 from dfpy.steps.input import Input
 
 
@@ -14,7 +15,6 @@ class NoiseInput(Input):
 
         super().__init__(static=False, name=name)
         self._dimensions = dimensions
-        self._shape = tuple([dim.size for dim in dimensions])
         self._strength = strength
 
         self._post_constructor()
@@ -30,12 +30,12 @@ class NoiseInput(Input):
 
     @property
     def shape(self):
-        return self._shape
+        return self._cached_shape()
 
     @shape.setter
     def shape(self, shape):
-        self._shape = shape
-        self._notify_observers("shape")
+        # The shape is derived from the dimensions, so setting it replaces them
+        self.dimensions = dimensions_from_sizes(*shape)
 
     @property
     def strength(self):
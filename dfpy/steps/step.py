@@ -1,3 +1,5 @@
+import numpy as np
+
 from dfpy.utils import unique_name
 import dfpy.shared
 
@@ -22,6 +24,10 @@ class Step:
         self._observers = []
         self._trainable = False
         self._assignable = False
+        self._dtype = None
+        # Shape and domain, computed from the dimensions on first use (cleared when the dimensions change)
+        self._shape = None
+        self._domain = None
 
     def _post_constructor(self):
         self._neural_structure.add_step(self)
@@ -66,9 +72,46 @@ class Step:
     def assignable(self, assignable):
         self._assignable = assignable
 
+    @property
+    def dtype(self):
+        """Floating-point dtype in which simulators store the state of the step (None to use the dtype of the neural
+        structure).
+        """
+        return self._dtype
+
+    @dtype.setter
+    def dtype(self, dtype):
+        self._dtype = None if dtype is None else float_dtype(dtype)
+        self._notify_observers("dtype")
+
+    def _cached_shape(self):
+        # The dimensions are immutable, so the shape only changes when they are replaced
+        if self._shape is None:
+            self._shape = tuple(dimension.size for dimension in self._dimensions)
+        return self._shape
+
+    def _cached_domain(self):
+        if self._domain is None:
+            self._domain = tuple((dimension.lower, dimension.upper) for dimension in self._dimensions)
+        return self._domain
+
     def register_observer(self, observer):
         self._observers.append(observer)
 
     def _notify_observers(self, changed_param):
+        if changed_param == "dimensions":
+            self._shape = None
+            self._domain = None
         for observer in self._observers:
             observer(self, changed_param)
+
+
+def float_dtype(dtype):
+    """Returns a dtype after checking that it is a floating-point type (e.g., np.float64, np.float32 or np.float16).
+
+    :param dtype: the dtype (or anything np.dtype accepts)
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind != "f":
+        raise RuntimeError(f"Steps can only be simulated with floating-point dtypes, not {dtype}")
+    return dtype
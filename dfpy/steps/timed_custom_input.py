@@ -1,5 +1,6 @@
 from dfpy import dimensions_from_sizes, shape_from_list_of_dimensions
 from dfpy.steps.input import Input
+from dfpy.frames import frame_source
 import numpy as np
 
 class TimedCustomInput(Input):
@@ -9,8 +10,12 @@ class TimedCustomInput(Input):
         """Creates a CustomInput.
 
         :param dimensions: list of `:class:`.Dimension` objects characterizing the dimensions of the custom input.
-        :param array_like timed_custom_input: list of custom input pattern for each time step
-        :param int num_time_steps: list of custom input pattern for each time step
+        :param timed_custom_input: custom input pattern for each time step. This may be an array(-like) with the time
+        step as first axis (including an on-disk np.memmap), a dictionary of keyframes mapping time step indices to
+        patterns (each is held until the next keyframe), an iterator of patterns (or a callable that returns one), or
+        a :class:`FrameSource` (e.g., :class:`ChunkedFrames`). If omitted, the input is zero for num_time_steps time
+        steps.
+        :param int num_time_steps: number of time steps (inferred from timed_custom_input if it is array-like)
         :param string name: name of the step
         """
 
@@ -24,16 +29,18 @@ class TimedCustomInput(Input):
 
         if timed_custom_input is None:
             assert num_time_steps is not None, "When no timed_custom_input is provided to the constructor, num_time_steps needs to be specified"
-            timed_custom_input = np.zeros(shape=[num_time_steps] + shape_from_list_of_dimensions(dimensions))
+            # An empty set of keyframes is zero at every time step, without holding [num_time_steps, *shape] zeros
+            timed_custom_input = {}
 
         if dimensions is None:
-            if type(timed_custom_input[0]) == float:
+            if type(timed_custom_input) in (list, np.ndarray, np.memmap) and type(timed_custom_input[0]) == float:
                 dimensions = []
             else:
                 raise RuntimeError(f"Dimensions parameter cannot be None")
 
         self._dimensions = dimensions
         self._timed_custom_input = timed_custom_input
+        self._num_time_steps = num_time_steps
 
         self._post_constructor()
 
@@ -55,5 +62,18 @@ class TimedCustomInput(Input):
         self._timed_custom_input = timed_custom_input
         self._notify_observers("timed_custom_input")
 
+    @property
+    def num_time_steps(self):
+        """Number of time steps for which the input is defined (None if it is determined by an iterator).
+        """
+        if self._num_time_steps is not None:
+            return self._num_time_steps
+        return self.frames().num_frames
+
+    def frames(self):
+        """Returns a :class:`FrameSource` that reads the patterns of the input on demand.
+        """
+        return frame_source(self._timed_custom_input, self._num_time_steps)
+
     def dimensionality(self):
         return len(self._dimensions)
\ No newline at end of file
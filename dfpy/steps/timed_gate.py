@@ -1,3 +1,4 @@
+from dfpy import dimensions_from_sizes
 from dfpy.steps.input import Input
 
 
@@ -34,7 +35,7 @@ class TimedGate(Input):
     @min_time.setter
     def min_time(self, min_time):
         self._min_time = min_time
-        self._notify_observers()
+        self._notify_observers("min_time")
 
     @property
     def max_time(self):
@@ -43,10 +44,10 @@ class TimedGate(Input):
     @max_time.setter
     def max_time(self, max_time):
         self._max_time = max_time
-        self._notify_observers()
+        self._notify_observers("max_time")
 
     def shape(self):
-        return tuple([dimension.size for dimension in self._dimensions])
+        return self._cached_shape()
 
     def dimensionality(self):
         return len(self._dimensions)
@@ -1 +1,2 @@
 from dfpy.utils._unique_name import unique_name
+from dfpy.utils._tensors import is_tensor
@@ -0,0 +1,17 @@
+import sys
+
+import numpy as np
+
+
+def is_tensor(value) -> bool:
+    """
+    Checks whether a value is a NumPy array or a TensorFlow tensor, without importing TensorFlow. A value can only be
+    a TensorFlow tensor if TensorFlow has already been imported by someone else, so sys.modules is consulted instead.
+
+    :param value: the value to check
+    :return: whether the value is an array or tensor
+    """
+    if isinstance(value, np.ndarray):
+        return True
+    tf = sys.modules.get("tensorflow")
+    return tf is not None and isinstance(value, tf.Tensor)
@@ -1,9 +1,144 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
 import numpy as np
 
+import dfpy.config
+
+__all__ = ["WeightPattern", "CustomWeightPattern", "SumWeightPattern", "RepeatWeightPattern", "GaussWeightPattern",
+           "RepeatedValueWeightPattern", "SparseWeightPattern", "LowRankWeightPattern", "clear_kernel_cache",
+           "kernel_cache_info", "computeKernelRange"]
+
+
+class KernelCache:
+    """LRU cache of materialized weight patterns, keyed by the content of the pattern (not its identity) together
+    with the requested shape and dtype. Identical kernels are therefore sampled once per process, no matter how many
+    weight pattern objects describe them. The cached arrays are read-only.
+
+    The total size of the cached arrays is bounded by dfpy.config.kernel_cache_max_bytes; the least recently used
+    arrays are evicted first.
+    """
+    def __init__(self):
+        self._arrays = OrderedDict()
+        self._num_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, sample):
+        """Returns the array cached under key, sampling and caching it if necessary.
+
+        :param key: hashable content key
+        :param sample: function that computes the array
+        :return: the read-only array
+        """
+        with self._lock:
+            array = self._arrays.get(key)
+            if array is not None:
+                self._arrays.move_to_end(key)
+                self._hits += 1
+                return array
+            self._misses += 1
+
+        array = sample()
+        array.flags.writeable = False
+
+        with self._lock:
+            if key not in self._arrays:
+                self._arrays[key] = array
+                self._num_bytes += array.nbytes
+                self._evict(dfpy.config.kernel_cache_max_bytes)
+        return array
+
+    def _evict(self, max_bytes):
+        while self._num_bytes > max_bytes and self._arrays:
+            _, evicted = self._arrays.popitem(last=False)
+            self._num_bytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._arrays.clear()
+            self._num_bytes = 0
+
+    def info(self):
+        """Returns statistics about the cache.
+
+        :return: dict with the number of cached arrays, their total size in bytes, and the number of hits and misses
+        """
+        with self._lock:
+            return {"num_arrays": len(self._arrays), "num_bytes": self._num_bytes,
+                    "hits": self._hits, "misses": self._misses}
+
+
+_kernel_cache = KernelCache()
+
+
+def clear_kernel_cache():
+    """Removes all materialized weight patterns from the kernel cache.
+    """
+    _kernel_cache.clear()
+
+
+def kernel_cache_info():
+    """Returns statistics about the kernel cache (see :meth:`KernelCache.info`).
+    """
+    return _kernel_cache.info()
+
+
 class WeightPattern:
     """Base class for a weight pattern
     """
-    pass
+
+    def materialize(self, shape, dtype=np.float64):
+        """Samples the weight pattern into an array of the given shape. The grid is centered on the element at index
+        (size-1)//2 along each dimension, so a kernel that should be centered needs an odd size.
+
+        The result is shared through a process-wide cache and is therefore read-only; copy it if it needs to be
+        modified.
+
+        :param shape: shape of the array
+        :param dtype: dtype of the array
+        :return: the read-only array
+        """
+        shape = tuple(int(size) for size in shape)
+        dtype = np.dtype(dtype)
+        if len(shape) != self.dimensionality():
+            raise RuntimeError(f"Cannot materialize a weight pattern of dimensionality {self.dimensionality()} "
+                               f"with shape {shape}")
+        key = (self.content_key(), shape, dtype.str)
+        return _kernel_cache.get(key, lambda: self._sample(shape).astype(dtype))
+
+    def separable_factors(self, shape, dtype=np.float64):
+        """Returns a factorization of the weight pattern sampled with the given shape (see :meth:`materialize`) into
+        a sum of outer products of 1-D arrays: a list with one entry per component, each of which is a list holding
+        one 1-D array per dimension. Summing the outer products of all components yields the materialized pattern.
+
+        :param shape: shape of the sampled pattern
+        :param dtype: dtype of the factors
+        :return: list of components, or None if the weight pattern is not separable
+        """
+        shape = tuple(int(size) for size in shape)
+        if len(shape) != self.dimensionality():
+            raise RuntimeError(f"Cannot factorize a weight pattern of dimensionality {self.dimensionality()} "
+                               f"with shape {shape}")
+        factors = self._factors(shape)
+        if factors is None:
+            return None
+        return [[np.asarray(factor, dtype=dtype) for factor in component] for component in factors]
+
+    def content_key(self):
+        """Returns a hashable key that is equal for weight patterns that describe the same weights.
+        """
+        raise NotImplementedError()
+
+    def _sample(self, shape):
+        raise NotImplementedError()
+
+    def _factors(self, shape):
+        if len(shape) == 1:
+            return [[self._sample(shape)]]
+        return None
 
 
 class CustomWeightPattern(WeightPattern):
@@ -15,14 +150,35 @@ class CustomWeightPattern(WeightPattern):
         :param pattern: the pattern
         """
         self._pattern = pattern
+        # Content key (with a digest of the pattern), computed on first use
+        self._content_key = None
 
     def dimensionality(self):
         return len(np.array(self._pattern).shape)
 
     @property
     def pattern(self):
+        """The pattern. Its content key is computed once, so assign the pattern again after modifying it in place.
+        """
         return self._pattern
 
+    @pattern.setter
+    def pattern(self, pattern):
+        self._pattern = pattern
+        self._content_key = None
+
+    def content_key(self):
+        if self._content_key is None:
+            pattern = np.asarray(self._pattern, order="C")
+            self._content_key = "custom", pattern.shape, pattern.dtype.str, hashlib.sha1(pattern).hexdigest()
+        return self._content_key
+
+    def _sample(self, shape):
+        pattern = np.asarray(self._pattern, dtype=np.float64)
+        if pattern.shape != shape:
+            raise RuntimeError(f"Cannot materialize a CustomWeightPattern of shape {pattern.shape} with shape {shape}")
+        return pattern.copy()
+
     def __str__(self):
         return "CustomWeightPattern(pattern=" + ','.join([str(x) for x in self._pattern]) + ")"
 
@@ -66,6 +222,24 @@ class SumWeightPattern(WeightPattern):
     def ranges(self):
         return self._ranges
 
+    def content_key(self):
+        return ("sum",) + tuple(weight_pattern.content_key() for weight_pattern in self._weight_patterns)
+
+    def _sample(self, shape):
+        kernel = np.zeros(shape)
+        for weight_pattern in self._weight_patterns:
+            kernel += weight_pattern._sample(shape)
+        return kernel
+
+    def _factors(self, shape):
+        factors = []
+        for weight_pattern in self._weight_patterns:
+            component_factors = weight_pattern._factors(shape)
+            if component_factors is None:
+                return None
+            factors += component_factors
+        return factors
+
     def __str__(self):
         return "SumWeightPattern(weight_patterns=" + ','.join([str(x) for x in self._weight_patterns]) + ")"
 
@@ -73,6 +247,10 @@ class SumWeightPattern(WeightPattern):
 
 class RepeatWeightPattern(WeightPattern):
     """A weight pattern that repeats the given weight pattern n times
+
+    When the pattern is materialized, the size of the shape along the last dimension decides how often the inner
+    pattern is repeated (:func:`dfpy.simulation.kernels.sample_kernel`, e.g., samples it once), so num_repeats is
+    not part of its content key.
     """
     def __init__(self, weight_pattern, num_repeats: int):
         """Creates a SumWeightPattern
@@ -94,6 +272,20 @@ class RepeatWeightPattern(WeightPattern):
     def dimensionality(self):
         return self._weight_pattern.dimensionality()+1
 
+    def content_key(self):
+        return "repeat", self._weight_pattern.content_key()
+
+    def _sample(self, shape):
+        # The inner pattern is copied along the additional (last) dimension
+        inner = self._weight_pattern._sample(shape[:-1])
+        return np.repeat(inner[..., np.newaxis], shape[-1], axis=-1)
+
+    def _factors(self, shape):
+        inner_factors = self._weight_pattern._factors(shape[:-1])
+        if inner_factors is None:
+            return None
+        return [component + [np.ones(shape[-1])] for component in inner_factors]
+
     def __str__(self):
         return "RepeatWeightPattern(weight_pattern=" + str(self._weight_pattern) + ")"
 
@@ -170,6 +362,25 @@ class GaussWeightPattern(WeightPattern):
     def ranges(self):
         return self._ranges
 
+    def content_key(self):
+        return "gauss", float(self._height), tuple(float(x) for x in np.ravel(self._mean)),\
+               tuple(float(x) for x in self._sigmas)
+
+    def _sample(self, shape):
+        kernel = np.ones(shape)
+        for axis, factor in enumerate(self._factors(shape)[0]):
+            kernel *= factor.reshape([-1 if i == axis else 1 for i in range(len(shape))])
+        return kernel
+
+    def _factors(self, shape):
+        factors = []
+        for size, mean, sigma in zip(shape, np.ravel(self._mean), self._sigmas):
+            x = np.arange(size) - (size - 1) // 2
+            factors.append(np.exp(-0.5 * ((x - mean) / sigma) ** 2))
+        # The height is folded into the first factor
+        factors[0] = factors[0] * self._height
+        return [factors]
+
     def __str__(self):
         return "GaussWeightPattern(height=" + str(self._height) + ", mean=" + str(self._mean)\
                + ", sigmas=[" + ','.join([str(x) for x in self._sigmas]) + "])"
@@ -205,10 +416,199 @@ class RepeatedValueWeightPattern(WeightPattern):
     def dimensionality(self):
         return len(self._shape)
 
+    def content_key(self):
+        return "repeated_value", float(self._value)
+
+    def _sample(self, shape):
+        return np.full(shape, self._value, dtype=np.float64)
+
+    def _factors(self, shape):
+        return [[np.full(shape[0], self._value)] + [np.ones(size) for size in shape[1:]]]
+
     def __str__(self):
         return "RepeatedValueWeightPattern(value=" + str(self._value) + ", shape=" + str(self._shape) + ")"
 
 
+class SparseWeightPattern(WeightPattern):
+    """A weight pattern of which most entries are zero, stored as the coordinates and values of its non-zero entries
+    (COO format)
+    """
+    def __init__(self, shape: tuple, coordinates, values):
+        """Creates a SparseWeightPattern
+
+        :param shape: shape of the (dense) pattern
+        :param coordinates: integer array of shape [len(shape), num_non_zeros] holding the index of each non-zero
+        entry along each dimension
+        :param values: array of shape [num_non_zeros] holding the non-zero entries
+        """
+        self._shape = tuple(int(size) for size in shape)
+        self._coordinates = np.asarray(coordinates, dtype=np.int64).reshape(len(self._shape), -1)
+        self._values = np.asarray(values)
+        if self._values.shape != (self._coordinates.shape[1],):
+            raise RuntimeError("SparseWeightPattern requires one value per coordinate")
+        for coordinates, size in zip(self._coordinates, self._shape):
+            if len(coordinates) > 0 and (coordinates.min() < 0 or coordinates.max() >= size):
+                raise RuntimeError(f"Coordinates of SparseWeightPattern exceed its shape {self._shape}")
+
+    @classmethod
+    def from_dense(cls, pattern):
+        """Creates a SparseWeightPattern from the non-zero entries of a dense array.
+
+        :param pattern: the dense array
+        """
+        pattern = np.asarray(pattern)
+        coordinates = np.array(np.nonzero(pattern), dtype=np.int64).reshape(pattern.ndim, -1)
+        return cls(pattern.shape, coordinates, pattern[tuple(coordinates)])
+
+    @classmethod
+    def from_csr(cls, shape: tuple, indptr, indices, values):
+        """Creates a SparseWeightPattern from a matrix in CSR format. Rows correspond to the first dimension of the
+        pattern, columns to the (flattened) remaining dimensions.
+
+        :param shape: shape of the (dense) pattern
+        :param indptr: array holding the offset of each row in indices and values (and the number of non-zeros)
+        :param indices: flat column index of each non-zero entry
+        :param values: the non-zero entries
+        """
+        shape = tuple(int(size) for size in shape)
+        rows = np.repeat(np.arange(shape[0]), np.diff(indptr))
+        columns = np.unravel_index(np.asarray(indices, dtype=np.int64), shape[1:])
+        return cls(shape, np.stack((rows,) + tuple(columns)), values)
+
+    @classmethod
+    def from_edges(cls, source_shape: tuple, target_shape: tuple, source_indices, target_indices, weights):
+        """Creates a SparseWeightPattern that maps the entries of a source onto the entries of a target, given as a
+        list of weighted edges. The pattern spans the dimensions of the source followed by those of the target. The
+        edges are validated in one pass and stored sorted by their target entry (the order of a CSR matrix with one
+        row per target entry). Weights of repeated edges add up.
+
+        :param source_shape: shape of the source
+        :param target_shape: shape of the target
+        :param source_indices: flat index of the source entry of each edge
+        :param target_indices: flat index of the target entry of each edge
+        :param weights: weight of each edge (or a single weight for all edges)
+        """
+        source_shape = tuple(int(size) for size in source_shape)
+        target_shape = tuple(int(size) for size in target_shape)
+        source_indices = np.asarray(source_indices)
+        target_indices = np.asarray(target_indices)
+        if source_indices.ndim != 1 or source_indices.shape != target_indices.shape:
+            raise RuntimeError("The source and target indices of the edges must be one-dimensional arrays of the "
+                               "same length")
+        num_edges = len(source_indices)
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim == 0:
+            weights = np.full(num_edges, float(weights))
+        if weights.shape != (num_edges,):
+            raise RuntimeError(f"Expected one weight per edge ({num_edges}), but got weights of shape "
+                               f"{weights.shape}")
+        for name, indices, shape in (("source", source_indices, source_shape),
+                                     ("target", target_indices, target_shape)):
+            if num_edges > 0 and indices.dtype.kind not in "iu":
+                raise RuntimeError(f"The {name} indices of the edges must be integers")
+            size = int(np.prod(shape))
+            if num_edges > 0 and (indices.min() < 0 or indices.max() >= size):
+                raise RuntimeError(f"The {name} indices of the edges must lie in [0, {size})")
+        if not np.all(np.isfinite(weights)):
+            raise RuntimeError("The weights of the edges must be finite")
+
+        order = np.argsort(target_indices, kind="stable")
+        source_indices = source_indices[order]
+        target_indices = target_indices[order]
+        coordinates = np.empty((len(source_shape) + len(target_shape), num_edges), dtype=np.int64)
+        coordinates[:len(source_shape)] = np.unravel_index(source_indices, source_shape)
+        coordinates[len(source_shape):] = np.unravel_index(target_indices, target_shape)
+        return cls(source_shape + target_shape, coordinates, weights[order])
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def coordinates(self):
+        return self._coordinates
+
+    @property
+    def values(self):
+        return self._values
+
+    @property
+    def num_non_zeros(self):
+        return len(self._values)
+
+    def dimensionality(self):
+        return len(self._shape)
+
+    def content_key(self):
+        digest = hashlib.sha1(np.ascontiguousarray(self._coordinates))
+        digest.update(np.ascontiguousarray(self._values, dtype=np.float64))
+        return "sparse", self._shape, digest.hexdigest()
+
+    def _sample(self, shape):
+        if shape != self._shape:
+            raise RuntimeError(f"Cannot materialize a SparseWeightPattern of shape {self._shape} with shape {shape}")
+        pattern = np.zeros(shape)
+        np.add.at(pattern, tuple(self._coordinates), self._values)
+        return pattern
+
+    def __str__(self):
+        return "SparseWeightPattern(shape=" + str(self._shape) + ", num_non_zeros=" + str(self.num_non_zeros) + ")"
+
+
+class LowRankWeightPattern(WeightPattern):
+    """A weight pattern given by a sum of products of two factors, W[i..., j...] = sum_r U[i..., r] * V[j..., r]
+    (i.e., U·Vᵀ for matrices)
+    """
+    def __init__(self, u, v):
+        """Creates a LowRankWeightPattern
+
+        :param u: array of shape [*shape_u, rank] that spans the leading dimensions of the pattern
+        :param v: array of shape [*shape_v, rank] that spans the trailing dimensions of the pattern
+        """
+        self._u = np.asarray(u)
+        self._v = np.asarray(v)
+        if self._u.ndim < 2 or self._v.ndim < 2 or self._u.shape[-1] != self._v.shape[-1]:
+            raise RuntimeError("The factors of a LowRankWeightPattern must have at least two dimensions and the same "
+                               "rank (size of the last dimension)")
+
+    @property
+    def u(self):
+        return self._u
+
+    @property
+    def v(self):
+        return self._v
+
+    @property
+    def rank(self):
+        return self._u.shape[-1]
+
+    @property
+    def shape(self):
+        return self._u.shape[:-1] + self._v.shape[:-1]
+
+    def dimensionality(self):
+        return self._u.ndim + self._v.ndim - 2
+
+    def content_key(self):
+        digest = hashlib.sha1(np.ascontiguousarray(self._u, dtype=np.float64))
+        digest.update(np.ascontiguousarray(self._v, dtype=np.float64))
+        return "low_rank", self._u.shape, self._v.shape, digest.hexdigest()
+
+    def _sample(self, shape):
+        if shape != self.shape:
+            raise RuntimeError(f"Cannot materialize a LowRankWeightPattern of shape {self.shape} with shape {shape}")
+        return np.tensordot(self._u.astype(np.float64), self._v.astype(np.float64), axes=([-1], [-1]))
+
+    def _factors(self, shape):
+        if self._u.ndim != 2 or self._v.ndim != 2 or shape != self.shape:
+            return None
+        return [[self._u[:, r], self._v[:, r]] for r in range(self.rank)]
+
+    def __str__(self):
+        return "LowRankWeightPattern(shape=" + str(self.shape) + ", rank=" + str(self.rank) + ")"
+
+
 # By Sebastian Schneegans (https://github.com/cosivina/cosivina_python)
 def computeKernelRange(sigma, cutoffFactor, fieldSize, circular = True):
     if circular: